@@ -0,0 +1,389 @@
+import sys
+import os
+import ast
+import json
+import time
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(BENCHMARKS_DIR, '..')))
+from config import settings
+
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+
+# Components with a Hugging Face model behind them; --offline stubs exactly these
+MODEL_COMPONENTS = ["safety_guard", "embedder", "rag_system", "bot_voice", "validator"]
+
+# (section, metric, higher_is_worse, noise floor). A metric regresses when it gets worse by more
+# than the tolerance AND by more than the floor, so microsecond stubs don't flap on jitter.
+COMPARED_METRICS = [
+    ("stages", "p50_ms", True, 1.0),
+    ("stages", "p95_ms", True, 2.0),
+    ("stages", "ms_per_call", True, 1.0),
+    ("load", "seconds", True, 0.25),
+]
+
+
+def apply_overrides(pairs):
+    """
+    KEY=VALUE pairs patched into config.settings before any component is imported, e.g.
+    LLM_MODEL_NAME=google/flan-t5-small to benchmark with a tiny model. Values are parsed as
+    Python literals when possible, otherwise kept as strings.
+    """
+    overrides = {}
+    for pair in pairs:
+        key, sep, raw = pair.partition("=")
+        if not sep or not hasattr(settings, key):
+            raise ValueError(f"Unknown setting override '{pair}' (expected KEY=VALUE with KEY in config/settings.py)")
+        try:
+            value = ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            value = raw
+        setattr(settings, key, value)
+        overrides[key] = value
+    return overrides
+
+
+def load_workload(limit=None):
+    """
+    Replays what production sees: every logged user_query plus the texts the classifiers were
+    trained on. Returns {"queries": [...], "pairs": [(response, context), ...]} where the pairs
+    are logged answers with the context they were generated from (for the validator).
+    """
+    queries, pairs = [], []
+
+    log_path = os.path.join(settings.LOGS_DIR, 'production_logs.csv')
+    if os.path.exists(log_path):
+        logs = pd.read_csv(log_path, usecols=lambda c: c in ('user_query', 'retrieved_context', 'llm_response'))
+        queries += logs['user_query'].dropna().astype(str).tolist()
+        if {'retrieved_context', 'llm_response'}.issubset(logs.columns):
+            answered = logs.dropna(subset=['retrieved_context', 'llm_response'])
+            answered = answered[answered['llm_response'] != 'N/A']
+            pairs += list(zip(answered['llm_response'].astype(str), answered['retrieved_context'].astype(str)))
+
+    processed_dir = os.path.join(settings.BASE_DIR, 'data', 'processed')
+    if os.path.isdir(processed_dir):
+        for name in sorted(os.listdir(processed_dir)):
+            if name.endswith('.csv'):
+                frame = pd.read_csv(os.path.join(processed_dir, name))
+                if 'text' in frame.columns:
+                    queries += frame['text'].dropna().astype(str).tolist()
+
+    # Unique texts in first-seen order: repeats would measure the caches, not the models
+    queries = list(dict.fromkeys(q.strip() for q in queries if q.strip()))
+    if limit:
+        queries = queries[:limit]
+    if not queries:
+        raise ValueError("No benchmark queries found in logs/production_logs.csv or data/processed/.")
+    return {"queries": queries, "pairs": pairs}
+
+
+def workload_fingerprint(workload, args):
+    digest = hashlib.sha1()
+    for query in workload["queries"]:
+        digest.update(query.encode("utf-8") + b"\0")
+    digest.update(f"{args.generation_limit}:{args.turn_limit}:{args.passes}:{args.concurrency}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def percentile(sorted_samples, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, int(round(q * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[index]
+
+
+def time_calls(fn, items, concurrency=1):
+    """
+    Calls fn(item) for every item (on `concurrency` threads) and returns latency percentiles,
+    throughput and the resident memory gained while it ran.
+    """
+    from src.utils.system import current_rss_mb
+
+    def timed(item):
+        start = time.perf_counter()
+        fn(item)
+        return time.perf_counter() - start
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(timed, items))
+    else:
+        samples = [timed(item) for item in items]
+    wall = time.perf_counter() - start
+
+    samples_ms = sorted(s * 1000 for s in samples)
+    return {
+        "calls": len(samples_ms),
+        "concurrency": concurrency,
+        "throughput_per_s": round(len(samples_ms) / wall, 3) if wall else 0.0,
+        "ms_per_call": round(wall * 1000 / len(samples_ms), 4) if samples_ms else 0.0,
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 4) if samples_ms else 0.0,
+        "p50_ms": round(percentile(samples_ms, 0.50), 4),
+        "p95_ms": round(percentile(samples_ms, 0.95), 4),
+        "p99_ms": round(percentile(samples_ms, 0.99), 4),
+        "max_ms": round(samples_ms[-1], 4) if samples_ms else 0.0,
+        "rss_delta_mb": round(current_rss_mb() - rss_before, 2),
+    }
+
+
+def load_components(stubbed, work_ms, log_dir):
+    """
+    Loads the components the same way src/bootstrap.py does (so load times are comparable),
+    with the names in stubbed swapped for their offline stand-ins. The logger always writes
+    to log_dir so benchmark turns never end up in the production logs.
+    """
+    from src.bootstrap import COMPONENTS, ComponentLoader
+    from src.utils.analytics import ExperimentLogger
+    from benchmarks.stubs import stub_factories
+
+    stubs = stub_factories(work_ms)
+    components = {}
+    for name, (label, factory) in COMPONENTS.items():
+        if name in stubbed:
+            components[name] = stubs[name]
+        else:
+            components[name] = (label, factory)
+    components["logger"] = ("Experiment Logger", lambda: ExperimentLogger(log_dir=log_dir))
+
+    loader = ComponentLoader(components)
+    loaded = loader.load()
+    loader.print_report()
+
+    load_report = {
+        entry["name"]: {
+            "seconds": round(entry["seconds"], 4),
+            "rss_delta_mb": round(entry["rss_delta_mb"], 2),
+            "status": entry["status"],
+        }
+        for entry in loader.report
+    }
+    load_report["wall"] = {"seconds": round(loader.wall_seconds, 4)}
+    return loaded, load_report
+
+
+def clear_embedding_cache(components):
+    clear = getattr(components["embedder"], "clear", None)
+    if clear is not None:
+        clear()
+
+
+def run_stage_benchmarks(components, workload, args):
+    """Each component on its own, called directly (no stage or response cache in front of it)."""
+    queries = workload["queries"]
+    concurrency = args.concurrency
+    results = {}
+
+    def stage(name, fn, items):
+        clear_embedding_cache(components)
+        print(f"   - {name}: {len(items)} calls...")
+        results[name] = time_calls(fn, items, concurrency)
+        print(f"     p50 {results[name]['p50_ms']:.2f}ms | p95 {results[name]['p95_ms']:.2f}ms | "
+              f"{results[name]['throughput_per_s']:.1f}/s")
+
+    stage("safety", components["safety_guard"].check_safety, queries)
+    stage("sentiment", components["sentiment_engine"].predict, queries)
+    stage("intent", components["intent_engine"].predict, queries)
+    for name in ("sentiment", "intent"):
+        engine = components[f"{name}_engine"]
+        if hasattr(engine, "predict_batch"):
+            batches = [queries[i:i + 256] for i in range(0, len(queries), 256)]
+            stage(f"{name}_batch256", engine.predict_batch, batches)
+    stage("embedding", components["embedder"].encode_one, queries)
+    stage("retrieval", components["rag_system"].retrieve, queries)
+    if hasattr(components["rag_system"], "search_batch"):
+        batches = [queries[i:i + 32] for i in range(0, len(queries), 32)]
+        stage("retrieval_batch32", components["rag_system"].search_batch, batches)
+
+    pairs = workload["pairs"] or [(q, components["rag_system"].retrieve(q)["text"]) for q in queries]
+    stage("validation", lambda pair: components["validator"].validate(*pair), pairs)
+
+    # Generation is the slow one: a handful of prompts is enough for stable percentiles
+    prompts = [
+        dict(user_query=q, retrieved_context=components["rag_system"].retrieve(q)["text"],
+             sentiment="neutral", intent="general_inquiry")
+        for q in queries[:args.generation_limit]
+    ]
+    stage("generation", lambda prompt: components["bot_voice"].generate_response(**prompt), prompts)
+    return results
+
+
+def run_turn_benchmarks(components, workload, args):
+    """
+    The full main.py flow through ChatPipeline.run_turn, with the stage and response caches
+    configured as in settings. The first pass over the queries is cold; later passes
+    ("turn_warm") show what the caches buy on repeated traffic.
+    """
+    from src.bootstrap import build_stage_cache
+    from src.pipeline import ChatPipeline
+    from src.utils.response_cache import SemanticResponseCache
+
+    clear_embedding_cache(components)
+    pipeline = ChatPipeline(
+        safety_guard=components["safety_guard"],
+        sentiment_engine=components["sentiment_engine"],
+        intent_engine=components["intent_engine"],
+        rag_system=components["rag_system"],
+        bot_voice=components["bot_voice"],
+        validator=components["validator"],
+        logger=components["logger"],
+        variant="benchmark",
+        response_cache=SemanticResponseCache(components["embedder"]) if settings.RESPONSE_CACHE_ENABLED else None,
+        stage_cache=build_stage_cache() if settings.STAGE_CACHE_ENABLED else None
+    )
+
+    queries = workload["queries"][:args.turn_limit]
+    results = {}
+    for turn_pass in range(args.passes):
+        name = "turn" if turn_pass == 0 else "turn_warm"
+        print(f"   - {name} (pass {turn_pass + 1}/{args.passes}): {len(queries)} turns...")
+        results[name] = time_calls(lambda q: pipeline.run_turn("benchmark", q), queries, args.concurrency)
+        print(f"     p50 {results[name]['p50_ms']:.2f}ms | p95 {results[name]['p95_ms']:.2f}ms | "
+              f"{results[name]['throughput_per_s']:.1f}/s")
+
+    pipeline.executor.shutdown()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(current, baseline, tolerance):
+    """Prints every compared metric side by side and returns the regressions as strings."""
+    for key in ("workload", "stubbed", "stub_work_ms", "overrides"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"   Warning: baseline differs in '{key}'; deltas are not like for like.")
+
+    regressions = []
+    print(f"\n   {'metric':<34} {'baseline':>12} {'current':>12} {'change':>9}")
+    for section, metric, higher_is_worse, floor in COMPARED_METRICS:
+        for name, values in current.get(section, {}).items():
+            old = baseline.get(section, {}).get(name, {}).get(metric)
+            new = values.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            worse = (new - old) if higher_is_worse else (old - new)
+            flag = ""
+            if worse > floor and worse > abs(old) * tolerance:
+                flag = "  REGRESSION"
+                regressions.append(f"{section}.{name}.{metric}: {old} -> {new} ({change:+.1%})")
+            print(f"   {f'{section}.{name}.{metric}':<34} {old:>12.3f} {new:>12.3f} {change:>+8.1%}{flag}")
+
+    old_rss, new_rss = baseline.get("peak_rss_mb"), current.get("peak_rss_mb")
+    if old_rss and new_rss:
+        print(f"   {'peak_rss_mb':<34} {old_rss:>12.1f} {new_rss:>12.1f} {(new_rss - old_rss) / old_rss:>+8.1%}")
+        if new_rss - old_rss > max(old_rss * tolerance, 10.0):
+            regressions.append(f"peak_rss_mb: {old_rss} -> {new_rss}")
+    return regressions
+
+
+def run_benchmarks(args):
+    overrides = apply_overrides(args.set)
+    stubbed = set(MODEL_COMPONENTS) if args.offline else set()
+    stubbed |= {name for name in args.stub.split(",") if name}
+    work_ms = dict((k, float(v)) for k, _, v in (pair.partition("=") for pair in args.stub_work_ms))
+
+    print("Starting Benchmark Run...")
+    workload = load_workload(args.limit)
+    print(f"   - Workload: {len(workload['queries'])} unique queries, {len(workload['pairs'])} logged answers.")
+    print(f"   - Stubbed: {', '.join(sorted(stubbed)) or 'nothing'}")
+
+    with tempfile.TemporaryDirectory(prefix="chatbot-bench-logs-") as log_dir:
+        components, load_report = load_components(stubbed, work_ms, log_dir)
+
+        print("   Stage benchmarks:")
+        stages = run_stage_benchmarks(components, workload, args)
+        print("   Full turn benchmarks:")
+        stages.update(run_turn_benchmarks(components, workload, args))
+
+        # Flush inside the block: the writer thread still has rows for log_dir
+        components["logger"].close()
+
+    from src.utils.system import peak_rss_mb
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "stubbed": sorted(stubbed),
+            "stub_work_ms": work_ms,
+            "overrides": overrides,
+            "queries": len(workload["queries"]),
+            "workload": workload_fingerprint(workload, args),
+        },
+        "load": load_report,
+        "stages": stages,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage and the full turn, and compare against a baseline.")
+    parser.add_argument("--offline", action="store_true",
+                        help=f"Stub every model-backed component ({', '.join(MODEL_COMPONENTS)}); needs no downloads")
+    parser.add_argument("--stub", default="", help="Comma-separated component names to stub, e.g. bot_voice,safety_guard")
+    parser.add_argument("--stub-work-ms", nargs="*", default=[], metavar="NAME=MS",
+                        help="Simulated cost per call for a stub, e.g. bot_voice=400")
+    parser.add_argument("--set", nargs="*", default=[], metavar="KEY=VALUE",
+                        help="Override config/settings.py values, e.g. LLM_MODEL_NAME=google/flan-t5-small")
+    parser.add_argument("--limit", type=int, default=None, help="Use only the first N unique queries")
+    parser.add_argument("--generation-limit", type=int, default=20, help="Prompts for the generation stage")
+    parser.add_argument("--turn-limit", type=int, default=50, help="Queries replayed through the full turn")
+    parser.add_argument("--passes", type=int, default=2, help="Full-turn passes (the second one runs warm)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Threads calling each stage at once")
+    parser.add_argument("--output", default=None, help="Result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Also store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Relative slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Comparing against {args.baseline} (recorded {baseline['meta'].get('timestamp')}, commit {baseline['meta'].get('commit')}):")
+        regressions = compare(results, baseline, args.tolerance)
+    else:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for regression in regressions:
+            print(f"   - {regression}")
+        sys.exit(1)
@@ -0,0 +1,167 @@
+import hashlib
+import time
+
+import numpy as np
+
+# Offline stand-ins for the model-backed components. Each one has the same interface as the real
+# component and is deterministic, so a run on a CPU-only box without the Hugging Face models
+# measures the pipeline around the models (threading, caches, logging) reproducibly.
+# work_ms simulates the model's own cost with a sleep, which releases the GIL like native code does.
+
+POLICY_CHUNKS = [
+    ("refund_policy", "refund", "Refund Policy: You can request a full refund within 30 days of purchase. "
+                                "Money is returned to the original payment method within 5-7 business days."),
+    ("shipping_policy", "shipping", "Shipping Policy: Standard shipping takes 3-5 business days. "
+                                    "Express shipping is delivered within 1-2 business days."),
+    ("account_policy", "account", "Account Policy: You can reset your password from the login page. "
+                                  "Accounts inactive for 2 years are closed."),
+    ("warranty_policy", "warranty", "Warranty Policy: Hardware is covered for 1 year against manufacturing defects. "
+                                    "Accidental damage is not covered."),
+]
+
+BLOCKED_WORDS = {"idiot", "stupid", "hate", "kill", "moron", "loser", "hell"}
+
+
+def _words(text):
+    return [w.strip(".,!?;:'\"()") for w in text.lower().split()]
+
+
+def _pick(text, options):
+    """Deterministic choice that depends only on the text."""
+    digest = hashlib.sha1(text.lower().encode("utf-8")).digest()
+    return options[digest[0] % len(options)]
+
+
+def _work(ms):
+    if ms:
+        time.sleep(ms / 1000.0)
+
+
+class StubSafetyGuard:
+    def __init__(self, work_ms=0.0):
+        self.work_ms = work_ms
+
+    def check_safety(self, text):
+        _work(self.work_ms)
+        hits = BLOCKED_WORDS.intersection(_words(text))
+        if hits:
+            return False, f"Blocked due to toxic ({sorted(hits)[0]})"
+        return True, "Safe"
+
+
+class StubClassifier:
+    def __init__(self, labels, work_ms=0.0):
+        self.labels = labels
+        self.work_ms = work_ms
+
+    def predict(self, text):
+        _work(self.work_ms)
+        return _pick(text, self.labels)
+
+
+class StubEmbedder:
+    """Hashed bag-of-words vectors with the EmbeddingService interface (encode / encode_one / prime)."""
+    def __init__(self, dim=384, work_ms=0.0):
+        self.dim = dim
+        self.work_ms = work_ms
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, texts):
+        _work(self.work_ms)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in _words(text):
+                vectors[row, int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    def encode_one(self, text):
+        return self.encode([text])[0]
+
+    def prime(self, texts, embeddings):
+        pass
+
+
+class StubKnowledgeBase:
+    def __init__(self, embedder=None, work_ms=0.0):
+        self.embedder = embedder or StubEmbedder()
+        self.work_ms = work_ms
+        self._vectors = self.embedder.encode([text for _, _, text in POLICY_CHUNKS])
+
+    def search(self, query, n_results=1):
+        return self.retrieve(query, n_results)["text"]
+
+    def retrieve(self, query, n_results=1):
+        _work(self.work_ms)
+        scores = self._vectors @ self.embedder.encode_one(query)
+        chunk_id, category, text = POLICY_CHUNKS[int(np.argmax(scores))]
+        return {"id": chunk_id, "text": text, "category": category}
+
+
+class StubStream:
+    """Mimics GenerationStream: iterating yields the answer word by word."""
+    def __init__(self, text, work_ms):
+        self.text = text
+        self.generated_tokens = len(text.split())
+        self.tokens_per_second = 0.0
+        self._work_ms = work_ms
+
+    def __iter__(self):
+        start = time.perf_counter()
+        words = self.text.split()
+        for i, word in enumerate(words):
+            _work(self._work_ms / max(len(words), 1))
+            yield word if i == 0 else " " + word
+        elapsed = time.perf_counter() - start
+        self.tokens_per_second = self.generated_tokens / elapsed if elapsed else 0.0
+
+
+class StubGenerator:
+    """Answers with the first sentence of the retrieved context."""
+    def __init__(self, work_ms=0.0):
+        self.work_ms = work_ms
+
+    def _answer(self, retrieved_context, max_new_tokens=None):
+        answer = retrieved_context.split(". ")[0].rstrip(".") + "."
+        return answer if max_new_tokens is None else " ".join(answer.split()[:max_new_tokens])
+
+    def generate_response(self, user_query, retrieved_context, sentiment, intent, max_new_tokens=None, history=None):
+        _work(self.work_ms)
+        return self._answer(retrieved_context, max_new_tokens)
+
+    def stream_response(self, user_query, retrieved_context, sentiment, intent, max_new_tokens=None, history=None):
+        return StubStream(self._answer(retrieved_context, max_new_tokens), self.work_ms)
+
+
+class StubValidator:
+    """Word overlap between answer and context, in place of MiniLM cosine similarity."""
+    def __init__(self, work_ms=0.0):
+        self.work_ms = work_ms
+
+    def validate(self, llm_response, retrieved_context):
+        _work(self.work_ms)
+        if not llm_response or len(llm_response) < 5:
+            return 0.0, "Too Short"
+        response, context = set(_words(llm_response)), set(_words(retrieved_context))
+        return len(response & context) / max(len(response), 1), "Valid"
+
+
+def stub_factories(work_ms=None):
+    """
+    name -> (label, factory) for every component that has a stub, in the shape of
+    src.bootstrap.COMPONENTS. work_ms optionally maps a name to its simulated cost per call.
+    """
+    work_ms = work_ms or {}
+    return {
+        "sentiment_engine": ("Sentiment Classifier (stub)",
+                             lambda: StubClassifier(["negative", "neutral", "positive"], work_ms.get("sentiment_engine", 0.0))),
+        "intent_engine": ("Intent Classifier (stub)",
+                          lambda: StubClassifier(["cancellation and refund", "shipping and delivery", "account access",
+                                                  "general_inquiry"], work_ms.get("intent_engine", 0.0))),
+        "safety_guard": ("Toxicity Filter (stub)", lambda: StubSafetyGuard(work_ms.get("safety_guard", 0.0))),
+        "embedder": ("Embedding Service (stub)", lambda: StubEmbedder(work_ms=work_ms.get("embedder", 0.0))),
+        "rag_system": ("RAG Knowledge Base (stub)", lambda: StubKnowledgeBase(work_ms=work_ms.get("rag_system", 0.0))),
+        "bot_voice": ("LLM (stub)", lambda: StubGenerator(work_ms.get("bot_voice", 0.0))),
+        "validator": ("Quality Validator (stub)", lambda: StubValidator(work_ms.get("validator", 0.0))),
+    }
@@ -8,6 +8,18 @@ ARTIFACTS_DIR = os.path.join(BASE_DIR, "artifacts")
 LOGS_DIR = os.path.join(BASE_DIR, "logs")
 
 # Classifiers
+# Released by the training scripts as versioned bundles (artifacts/bundles/<name>/<version>/ plus a
+# CURRENT pointer). The three separate pickles below are only read when no bundle exists yet.
+MODEL_BUNDLE_DIR = os.path.join(ARTIFACTS_DIR, "bundles")
+MODEL_BUNDLE_MMAP = True # Memory-map the arrays inside a bundle so worker processes share them
+MODEL_BUNDLE_VERIFY = True # Check the bundle against its manifest hash before loading
+MODEL_BUNDLE_KEEP = 3 # Released versions kept per bundle (for rollback)
+CLASSIFIER_COMPILED_SCORER = True # Score with the compiled TF-IDF lookup (src/components/compiled_scorer.py) when available
+CLASSIFIER_VERIFY_SAMPLE = 500 # Training messages a scorer compiled at load time is checked on (plus every vocabulary term)
+CLASSIFIER_TRAINING_DATA = {
+    "sentiment": os.path.join(BASE_DIR, "data", "processed", "automatically_labelled_support_data.csv"),
+    "intent": os.path.join(BASE_DIR, "data", "processed", "automatically_labelled_intents.csv"),
+}
 SENTIMENT_MODEL_PATH = os.path.join(ARTIFACTS_DIR, "sentiment_xgboost.pkl")
 SENTIMENT_VECTORIZER_PATH = os.path.join(ARTIFACTS_DIR, "tfidf_vectorizer.pkl")
 SENTIMENT_LABEL_PATH = os.path.join(ARTIFACTS_DIR, "label_encoder.pkl")
@@ -19,19 +31,158 @@ INTENT_LABEL_PATH = os.path.join(ARTIFACTS_DIR, "intent_label_encoder.pkl")
 # Vector Database
 CHROMA_DB_PATH = os.path.join(ARTIFACTS_DIR, "chroma_db_data")
 CHROMA_COLLECTION_NAME = "company_knowledge_base"
+RAG_INDEX_VERSION_PATH = os.path.join(CHROMA_DB_PATH, "index_version.txt") # Rewritten by build_rag_db.py on every build
+
+# Retrieval backend: "chroma" queries the collection, "numpy" answers from an in-memory matrix of
+# the collection's embeddings (exported next to it by build_rag_db.py, rebuilt from Chroma if stale)
+RAG_BACKEND = os.getenv("CHATBOT_RAG_BACKEND", "chroma")
+RAG_VECTOR_INDEX_PATH = os.path.join(ARTIFACTS_DIR, "vector_index")
+RAG_VECTOR_INDEX_MMAP = True # Memory-map the matrix instead of reading it into each process
+RAG_VECTOR_INDEX_CHECK_SECONDS = 5 # How often the numpy backend looks for a rebuilt knowledge base
+RAG_INTENT_FILTER = True # numpy backend: only search the category the predicted intent maps to
+# Predicted intent -> chunk category written by build_rag_db.py. Intents not listed search everything.
+RAG_INTENT_CATEGORIES = {
+    "refund": "refund",
+    "shipping": "shipping",
+    "account_issue": "general",
+    "technical_support": "general",
+}
+
+# Knowledge base ingestion (scripts/build_rag_db.py)
+RAG_INGEST_BATCH_SIZE = 256 # Chunks embedded and upserted per batch (bounds memory)
+RAG_INGEST_READ_THREADS = 8 # Policy files read and chunked in parallel
+RAG_INGEST_FILE_GROUP = 64 # Files read per round before their new chunks are embedded
+
+# Embeddings (shared by the RAG search and the QualityValidator)
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_CACHE_SIZE = 4096 # Texts kept in the LRU cache
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_MAX_WAIT_MS = 2
 
 # LLM Settings
 LLM_MODEL_NAME = "google/flan-t5-large"
 LLM_MAX_LENGTH = 256
 LLM_TEMPERATURE = 0.7
 LLM_REPETITION_PENALTY = 1.2
+LLM_BACKEND = os.getenv("CHATBOT_LLM_BACKEND", "torch") # See "Inference Backends" below
+
+# Prompt (src/components/prompt_builder.py). flan-t5 reads at most 512 input tokens;
+# the instructions and labels take about 80 of them.
+PROMPT_CONTEXT_TOKENS = 256 # Retrieved policy text beyond this is trimmed at sentence boundaries
+PROMPT_QUERY_TOKENS = 96 # Longer user messages keep their first tokens
+PROMPT_HISTORY_TOKENS = 64 # Conversation history (see Sessions) keeps its most recent tokens
+PROMPT_CONTEXT_CACHE_SIZE = 1024 # Fitted contexts kept (the same chunks are retrieved over and over)
+
+# Inference Backends (src/components/inference_backends.py), chosen per model:
+#   "torch"       full-precision PyTorch, as downloaded
+#   "torch_int8"  PyTorch with dynamic int8 quantization of every Linear layer
+#   "onnx"        ONNX Runtime with an int8-quantized graph (needs optimum[onnxruntime])
+# Converted models, plus a manifest with their measured agreement against fp32, are written by
+# scripts/export_inference_models.py. An export is only kept if it agrees at least this well.
+INFERENCE_MODELS_DIR = os.path.join(ARTIFACTS_DIR, "inference")
+INFERENCE_MIN_AGREEMENT = {"llm": 0.8, "toxicity": 0.98} # Mean answer token F1 / share of identical verdicts
+
+# Sessions (src/utils/session_store.py): each session's turns, fed back into the prompt.
+# Only the last few turns are kept in full; older ones are compacted into a digest of their
+# intents, retrieved chunk ids and opening words, so a session stays the same size however long it runs.
+SESSION_BACKEND = os.getenv("CHATBOT_SESSION_BACKEND", "memory") # "memory", or "sqlite" to survive restarts and share sessions across --processes workers
+SESSION_DB_PATH = os.path.join(ARTIFACTS_DIR, "sessions.sqlite3")
+SESSION_MAX_SESSIONS = 10000 # Least recently used sessions are evicted past this...
+SESSION_MAX_BYTES = 32 * 1024 * 1024 # ...or past this much serialized history
+SESSION_TTL_SECONDS = 2 * 60 * 60 # Idle sessions are forgotten after this
+SESSION_RECENT_TURNS = 2 # Turns kept in full
+SESSION_TURN_CHARS = 400 # A kept question or answer is cut to this length
+SESSION_DIGEST_ITEMS = 8 # Intents and chunk ids remembered from compacted turns
+SESSION_DIGEST_QUERY_WORDS = 8 # Opening words of each compacted question...
+SESSION_DIGEST_CHARS = 300 # ...most recent first, up to this length
+SESSION_SWEEP_SECONDS = 5 # How often the SQLite backend sweeps out expired and over-limit sessions
+
+# Stage Cache (memoizes safety / sentiment / intent / retrieval per normalized message)
+STAGE_CACHE_ENABLED = True
+STAGE_CACHE_MAX_ENTRIES = 20000
+STAGE_CACHE_DISK = False # Also persist results to SQLite so they survive restarts
+STAGE_CACHE_DISK_PATH = os.path.join(ARTIFACTS_DIR, "stage_cache.sqlite3")
+STAGE_CACHE_CHECK_SECONDS = 5 # How often live stages (retrieval) re-check their artifacts
+
+# Logging Settings (ExperimentLogger)
+LOG_QUEUE_SIZE = 10000 # Rows buffered before log() starts applying backpressure
+LOG_FLUSH_BATCH_SIZE = 256
+LOG_FLUSH_INTERVAL_SECONDS = 1.0
+LOG_ROTATE_BYTES = 100 * 1024 * 1024
+LOG_ROTATE_DAILY = True
+LOG_COLUMNAR_FORMAT = os.getenv("CHATBOT_LOG_COLUMNAR") or None # "parquet" (needs pyarrow) or None for CSV only
+
+# Response Cache (skips generation for near-duplicate questions)
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_SIMILARITY = 0.92 # Cosine similarity between query embeddings needed for a hit
+RESPONSE_CACHE_TTL_SECONDS = 6 * 60 * 60
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+RESPONSE_CACHE_VERSION_CHECK_SECONDS = 5 # How often to look for a rebuilt knowledge base
+
+# Auto-Labeler (scripts/auto_labeler.py)
+LABELER_MODEL_NAME = "facebook/bart-large-mnli" # Zero-shot teacher
+SENTIMENT_LABELS = ["positive", "negative", "neutral"]
+INTENT_LABELS = ["refund", "shipping", "account_issue", "technical_support", "general_inquiry"]
+LABELER_CHUNK_ROWS = 50000 # Raw CSV rows read at a time
+LABELER_SHARD_SIZE = 1000 # Unique texts per checkpointed shard
+LABELER_BATCH_SIZE = 16 # Premise/hypothesis pairs per forward pass
+LABELER_WORKERS = int(os.getenv("CHATBOT_LABELER_WORKERS", "2")) # Processes, each with its own copy of the teacher
+LABELER_CHECKPOINT_DIR = os.path.join(BASE_DIR, "data", "processed", "labeler_checkpoints")
+
+# Training (scripts/train_all.py, train_sentiment.py, train_intent.py)
+TRAIN_CORES = int(os.getenv("CHATBOT_TRAIN_CORES", "0")) or None # Cores shared by grid search and XGBoost (default: all)
+FEATURE_CACHE_DIR = os.path.join(ARTIFACTS_DIR, "feature_cache") # Vectorized training matrices, keyed by data + params
 
 # Guardrail Settings
 TOXICITY_THRESHOLD = 0.7
 TOXICITY_MODEL_NAME = "unitary/toxic-bert"
+TOXICITY_BACKEND = os.getenv("CHATBOT_TOXICITY_BACKEND", "torch") # See "Inference Backends" above
+TOXICITY_CASCADE = True # Let the cheap fast tier settle clear-cut messages before toxic-bert
+TOXICITY_FAST_TIER_PATH = os.path.join(ARTIFACTS_DIR, "toxicity_fast_tier.pkl") # Written by scripts/train_toxicity_tier.py
+TOXICITY_BATCHING = True # Micro-batch concurrent check_safety calls into one forward pass
+TOXICITY_MAX_BATCH_SIZE = 16
+TOXICITY_MAX_WAIT_MS = 5 # Longest a message waits for others to join its batch
 
 # Validator Settings
 QUALITY_THRESHOLD = 0.4 # Below this, we trigger the "I don't know" fallback
+# Early abort: while the LLM is still writing, the share of the answer's content words that
+# appear in the retrieved context (or the question) is re-checked every few words. An answer
+# that has clearly drifted off-context is stopped and replaced by the fallback right away.
+GENERATION_DRIFT_CHECK = True
+GENERATION_DRIFT_CHECK_EVERY = 8 # Words generated between checks
+GENERATION_DRIFT_MIN_WORDS = 12 # Content words needed before an answer can be judged
+GENERATION_DRIFT_MIN_OVERLAP = 0.25 # Grounded share of content words below which generation stops
+
+# Startup Settings (src/bootstrap.py)
+PARALLEL_STARTUP = True # Load all components side by side instead of one after another
+# Components that keep loading in the background while the system already accepts requests,
+# e.g. CHATBOT_LAZY_COMPONENTS="bot_voice,validator". The first request that needs one waits for it.
+LAZY_COMPONENTS = tuple(name for name in os.getenv("CHATBOT_LAZY_COMPONENTS", "").split(",") if name)
+
+# Pipeline Settings (src/pipeline.py)
+PIPELINE_STAGE_THREADS = int(os.getenv("CHATBOT_STAGE_THREADS", "16")) # Shared pool for classifier/retrieval stages
+SPECULATIVE_RETRIEVAL = True # Start the RAG search alongside the safety check; discarded if the text is blocked
+# Latency budget of a turn, counted from when the request arrived (0 = unlimited). When the
+# remaining budget can't cover the usual cost of a stage, the turn degrades instead of running
+# late: shorter generation, then answering with the retrieved policy text, and validation is
+# skipped when there is no time left for it.
+TURN_BUDGET_SECONDS = float(os.getenv("CHATBOT_TURN_BUDGET_SECONDS", "15"))
+TURN_MIN_GENERATION_TOKENS = 16 # Fewer affordable tokens than this: answer with the policy text instead
+TURN_ESTIMATE_WEIGHT = 0.2 # Weight of the newest turn in the moving averages of stage cost
+
+# Serving Settings (src/server.py)
+SERVER_HOST = os.getenv("CHATBOT_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("CHATBOT_PORT", "8080"))
+SERVER_WORKER_THREADS = int(os.getenv("CHATBOT_WORKER_THREADS", "8")) # Threads running blocking model calls
+SERVER_MAX_IN_FLIGHT = int(os.getenv("CHATBOT_MAX_IN_FLIGHT", "64")) # Turns admitted at once; the rest wait
+SERVER_MAX_BODY_BYTES = 64 * 1024
+SERVER_MAX_QUEUED = int(os.getenv("CHATBOT_MAX_QUEUED", "128")) # Turns waiting for a slot; more are rejected with 503
+SERVER_MIN_TURN_SECONDS = 0.5 # Budget a queued turn must still have left to be started at all
+SERVER_MAX_BUDGET_SECONDS = 60.0 # Upper bound for a client-supplied "budget_ms"
+# Pre-forked worker processes (src/prefork.py). Models load once in the parent and are shared
+# copy-on-write, so N processes cost far less than N separate servers. 1 = single process.
+SERVER_PROCESSES = int(os.getenv("CHATBOT_PROCESSES", "1"))
+SERVER_TORCH_THREADS = int(os.getenv("CHATBOT_TORCH_THREADS", "0")) # Per worker; 0 = cores // processes
 
 # --- 4. SECRETS (Optional) ---
 # In a real app, load these from environment variables
@@ -1,19 +1,180 @@
 import sys
 import os
+import glob
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 import pandas as pd
-from transformers import pipeline
 
 # Add project root to path so we can import config
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from config import settings
 
-def run_auto_labeler():
+def create_sample_dataset(raw_data_path):
+    # Create sample data so the script works immediately for testing
+    # Create a more balanced and diverse dataset
+    data = {
+        'text': [
+            # --- POSITIVE (20 examples) ---
+            "I absolutely love this product, it works great!",
+            "The shipping was incredibly fast, thank you!",
+            "Customer service was so helpful and kind.",
+            "Best purchase I've made all year.",
+            "The quality of the material is fantastic.",
+            "I am very happy with my order.",
+            "You guys are the best, thanks for the help!",
+            "The app is so easy to use now, great update.",
+            "My refund was processed immediately, very impressed.",
+            "I really appreciate the quick response.",
+            "The packaging was beautiful and secure.",
+            "Everything arrived perfect, thanks!",
+            "I'm a huge fan of your new collection.",
+            "Your team went above and beyond for me.",
+            "Excellent experience, will buy again.",
+            "The instructions were clear and easy to follow.",
+            "Finally a support team that actually listens.",
+            "Wow, that was lighter/faster than I expected!",
+            "Great job on resolving my issue so quickly.",
+            "I love the new features you added.",
+
+            # --- NEGATIVE (20 examples) ---
+            "This is the worst service I have ever received.",
+            "My package arrived completely crushed and broken.",
+            "I've been waiting for a refund for weeks.",
+            "Nobody is answering my emails, this is frustrating.",
+            "The product broke after one day of use.",
+            "I want to speak to a manager immediately.",
+            "Your website is broken and I can't log in.",
+            "Shipping is taking forever, where is my stuff?",
+            "I am very disappointed with the quality.",
+            "Don't buy from here, it's a scam.",
+            "The size guide is completely wrong.",
+            "I was charged twice for the same item!",
+            "Rude customer service agent hung up on me.",
+            "The app keeps crashing on my phone.",
+            "I demand a full refund right now.",
+            "It's been a month and I still don't have my order.",
+            "This doesn't look anything like the picture.",
+            "Stop sending me spam emails.",
+            "I can't believe how bad this experience was.",
+            "Your return policy is unfair and confusing.",
+
+            # --- NEUTRAL (20 examples) ---
+            "How long does shipping normally take?",
+            "What is your return policy?",
+            "Do you ship to Canada?",
+            "I need to reset my password.",
+            "Where can I find the tracking number?",
+            "Is this item in stock?",
+            "Can I change my shipping address?",
+            "How do I cancel my subscription?",
+            "What forms of payment do you accept?",
+            "Are you open on weekends?",
+            "Does this come with a warranty?",
+            "I have a question about my account.",
+            "How do I clear my cart?",
+            "Is there a physical store location?",
+            "Do you offer gift cards?",
+            "How do I contact support?",
+            "What is the difference between these two models?",
+            "I didn't receive a confirmation email.",
+            "Can I track my order without logging in?",
+            "When will the sale end?"
+        ] * 5  # Replicate 5 times to get ~300 rows
+    }
+    df = pd.DataFrame(data)
+    # Save this raw file so you have it for next time
+    os.makedirs(os.path.dirname(raw_data_path), exist_ok=True)
+    df.to_csv(raw_data_path, index=False)
+
+def normalize_text(text):
+    """Dedup key: the same message modulo surrounding and repeated whitespace."""
+    return " ".join(str(text).split())
+
+def checkpoint_dir():
+    """
+    Shards live in a folder named after the teacher model and the label sets, so finished
+    labels are reused across runs (and across input files) as long as those don't change.
+    """
+    signature = "|".join([settings.LABELER_MODEL_NAME, *settings.SENTIMENT_LABELS, "#", *settings.INTENT_LABELS])
+    return os.path.join(settings.LABELER_CHECKPOINT_DIR, hashlib.sha1(signature.encode("utf-8")).hexdigest()[:12])
+
+def load_checkpoints(directory):
+    """{normalized text: (sentiment, intent)} from every completed shard, plus the next shard number."""
+    labels = {}
+    shard_paths = sorted(glob.glob(os.path.join(directory, "shard_*.csv")))
+    for path in shard_paths:
+        # Every column as written: a message like "12345" or "True" must stay a string key
+        shard = pd.read_csv(path, keep_default_na=False, dtype=str)
+        labels.update(zip(shard['text'], zip(shard['sentiment'], shard['intent'])))
+    next_shard = max((int(os.path.basename(p)[6:-4]) for p in shard_paths), default=-1) + 1
+    return labels, next_shard
+
+# --- WORKER PROCESS ---
+# Each worker loads the teacher once and then labels whole shards
+_classifier = None
+
+def init_worker(torch_threads):
+    global _classifier
+    # transformers/torch are only needed inside the workers
+    import torch
+    from transformers import pipeline
+
+    torch.set_num_threads(torch_threads)
+    _classifier = pipeline("zero-shot-classification", model=settings.LABELER_MODEL_NAME)
+
+def label_shard(texts, shard_path):
+    """
+    Labels one shard and writes it to shard_path (atomically, so a crash never leaves half a shard).
+
+    Both label sets are scored in ONE zero-shot call over all their labels together. With
+    multi_label=False every label's score comes from its own entailment logit, so the best
+    label within each set is exactly what two separate calls would pick, while each text is
+    tokenized and batched once instead of twice.
+    """
+    candidate_labels = settings.SENTIMENT_LABELS + settings.INTENT_LABELS
+    results = _classifier(texts, candidate_labels, multi_label=False, batch_size=settings.LABELER_BATCH_SIZE)
+    if isinstance(results, dict):
+        results = [results]
+
+    rows = []
+    for text, result in zip(texts, results):
+        scores = dict(zip(result['labels'], result['scores']))
+        rows.append({
+            'text': text,
+            'sentiment': max(settings.SENTIMENT_LABELS, key=scores.get),
+            'intent': max(settings.INTENT_LABELS, key=scores.get),
+        })
+
+    tmp_path = shard_path + ".tmp"
+    pd.DataFrame(rows, columns=['text', 'sentiment', 'intent']).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, shard_path)
+    return {row['text']: (row['sentiment'], row['intent']) for row in rows}
+
+class InlinePool:
+    """Stand-in for the process pool when --workers 1: labels in this process, no pickling."""
+    def __init__(self, torch_threads):
+        self.torch_threads = torch_threads
+
+    def submit(self, fn, *args):
+        from concurrent.futures import Future
+        # Loaded on first use, like the pool's workers, so a fully resumed run skips it
+        if _classifier is None:
+            init_worker(self.torch_threads)
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+def run_auto_labeler(raw_data_path=None, workers=settings.LABELER_WORKERS):
     print("Starting Auto-Labeler (Teacher Model)...")
 
     # SETUP PATHS
     # In a real scenario, this would be your massive 'twcs.csv' file
     # For now, we will assume you have a raw file, or we create a dummy one if missing
-    raw_data_path = os.path.join(settings.BASE_DIR, 'data', 'raw', 'raw_customer_chats.csv')
+    raw_data_path = raw_data_path or os.path.join(settings.BASE_DIR, 'data', 'raw', 'raw_customer_chats.csv')
     output_sentiment_path = os.path.join(settings.BASE_DIR, 'data', 'processed', 'automatically_labelled_support_data.csv')
     output_intent_path = os.path.join(settings.BASE_DIR, 'data', 'processed', 'automatically_labelled_intents.csv')
 
@@ -21,117 +182,99 @@ def run_auto_labeler():
     os.makedirs(os.path.dirname(output_sentiment_path), exist_ok=True)
 
     # LOAD OR CREATE RAW DATA
-    if os.path.exists(raw_data_path):
-        print(f"   - Loading raw data from {raw_data_path}...")
-        df = pd.read_csv(raw_data_path)
-    else:
+    if not os.path.exists(raw_data_path):
         print(f"Raw data not found at {raw_data_path}. Creating a small sample dataset...")
-        # Create sample data so the script works immediately for testing
-        # Create a more balanced and diverse dataset
-        data = {
-            'text': [
-                # --- POSITIVE (20 examples) ---
-                "I absolutely love this product, it works great!",
-                "The shipping was incredibly fast, thank you!",
-                "Customer service was so helpful and kind.",
-                "Best purchase I've made all year.",
-                "The quality of the material is fantastic.",
-                "I am very happy with my order.",
-                "You guys are the best, thanks for the help!",
-                "The app is so easy to use now, great update.",
-                "My refund was processed immediately, very impressed.",
-                "I really appreciate the quick response.",
-                "The packaging was beautiful and secure.",
-                "Everything arrived perfect, thanks!",
-                "I'm a huge fan of your new collection.",
-                "Your team went above and beyond for me.",
-                "Excellent experience, will buy again.",
-                "The instructions were clear and easy to follow.",
-                "Finally a support team that actually listens.",
-                "Wow, that was lighter/faster than I expected!",
-                "Great job on resolving my issue so quickly.",
-                "I love the new features you added.",
-
-                # --- NEGATIVE (20 examples) ---
-                "This is the worst service I have ever received.",
-                "My package arrived completely crushed and broken.",
-                "I've been waiting for a refund for weeks.",
-                "Nobody is answering my emails, this is frustrating.",
-                "The product broke after one day of use.",
-                "I want to speak to a manager immediately.",
-                "Your website is broken and I can't log in.",
-                "Shipping is taking forever, where is my stuff?",
-                "I am very disappointed with the quality.",
-                "Don't buy from here, it's a scam.",
-                "The size guide is completely wrong.",
-                "I was charged twice for the same item!",
-                "Rude customer service agent hung up on me.",
-                "The app keeps crashing on my phone.",
-                "I demand a full refund right now.",
-                "It's been a month and I still don't have my order.",
-                "This doesn't look anything like the picture.",
-                "Stop sending me spam emails.",
-                "I can't believe how bad this experience was.",
-                "Your return policy is unfair and confusing.",
-
-                # --- NEUTRAL (20 examples) ---
-                "How long does shipping normally take?",
-                "What is your return policy?",
-                "Do you ship to Canada?",
-                "I need to reset my password.",
-                "Where can I find the tracking number?",
-                "Is this item in stock?",
-                "Can I change my shipping address?",
-                "How do I cancel my subscription?",
-                "What forms of payment do you accept?",
-                "Are you open on weekends?",
-                "Does this come with a warranty?",
-                "I have a question about my account.",
-                "How do I clear my cart?",
-                "Is there a physical store location?",
-                "Do you offer gift cards?",
-                "How do I contact support?",
-                "What is the difference between these two models?",
-                "I didn't receive a confirmation email.",
-                "Can I track my order without logging in?",
-                "When will the sale end?"
-            ] * 5  # Replicate 5 times to get ~300 rows
-        }
-        df = pd.DataFrame(data)
-        # Save this raw file so you have it for next time
-        os.makedirs(os.path.dirname(raw_data_path), exist_ok=True)
-        df.to_csv(raw_data_path, index=False)
-
-    print(f"   - Processing {len(df)} rows...")
-
-    # INITIALIZE TEACHER MODEL (Zero-Shot)
-    print("   - Loading Zero-Shot Classifier (This usually takes 30s)...")
-    classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
-
-    # LABEL SENTIMENT
-    print("   - Labeling Sentiment...")
-    candidate_labels = ["positive", "negative", "neutral"]
-    
-    # Run inference (This is slow on CPU)
-    # We take the top label for each row
-    sentiment_results = classifier(df['text'].tolist(), candidate_labels)
-    df['sentiment'] = [res['labels'][0] for res in sentiment_results]
-    
-    # Save Sentiment CSV
-    df[['text', 'sentiment']].to_csv(output_sentiment_path, index=False)
-    print(f"Saved Sentiment Data to: {output_sentiment_path}")
+        create_sample_dataset(raw_data_path)
+
+    # RESUME FROM CHECKPOINTS
+    shard_dir = checkpoint_dir()
+    os.makedirs(shard_dir, exist_ok=True)
+    labels, next_shard = load_checkpoints(shard_dir)
+    print(f"   - {len(labels)} texts already labelled in {shard_dir}.")
+
+    # PASS 1: LABEL EVERY UNIQUE TEXT ONCE
+    # The input is streamed in chunks; new texts are grouped into shards and labelled on a
+    # process pool. At most two shards per worker are in flight, which bounds memory.
+    workers = max(1, workers)
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"   - Labelling with {workers} worker(s); each loads the Zero-Shot Classifier on its first shard (This usually takes 30s)...")
+    pool = InlinePool(torch_threads) if workers == 1 else ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(torch_threads,)
+    )
+
+    queued = set()
+    pending = []
+    in_flight = set()
+    total_rows = 0
+    labelled_now = 0
 
-    # LABEL INTENT
-    print("   - Labeling Intents...")
-    # Define the intents you want the bot to learn
-    intent_labels = ["refund", "shipping", "account_issue", "technical_support", "general_inquiry"]
-    
-    intent_results = classifier(df['text'].tolist(), intent_labels)
-    df['intent'] = [res['labels'][0] for res in intent_results]
+    def collect(block):
+        nonlocal in_flight, labelled_now
+        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED) if block else (
+            {f for f in in_flight if f.done()}, {f for f in in_flight if not f.done()}
+        )
+        for future in done:
+            shard_labels = future.result()
+            labels.update(shard_labels)
+            queued.difference_update(shard_labels)
+            labelled_now += len(shard_labels)
+            print(f"   - Labelled {labelled_now} new texts ({total_rows} rows read so far)...")
 
-    # Save Intent CSV
-    df[['text', 'intent']].to_csv(output_intent_path, index=False)
+    def submit_shard():
+        nonlocal next_shard, pending
+        shard_path = os.path.join(shard_dir, f"shard_{next_shard:06d}.csv")
+        in_flight.add(pool.submit(label_shard, pending, shard_path))
+        next_shard += 1
+        pending = []
+        while len(in_flight) >= 2 * workers:
+            collect(block=True)
+
+    try:
+        for chunk in pd.read_csv(raw_data_path, usecols=['text'], chunksize=settings.LABELER_CHUNK_ROWS):
+            for text in chunk['text'].dropna():
+                total_rows += 1
+                key = normalize_text(text)
+                if not key or key in labels or key in queued:
+                    continue
+                queued.add(key)
+                pending.append(key)
+                if len(pending) >= settings.LABELER_SHARD_SIZE:
+                    submit_shard()
+            collect(block=False)
+
+        if pending:
+            submit_shard()
+        while in_flight:
+            collect(block=True)
+    finally:
+        pool.shutdown(wait=True)
+
+    print(f"   - Processed {total_rows} rows: labelled {labelled_now} new unique texts, reused {len(labels) - labelled_now}.")
+
+    # PASS 2: WRITE THE LABELLED DATASETS
+    # Every input row is kept (duplicates included, as before); labels come from the lookup
+    first = True
+    for chunk in pd.read_csv(raw_data_path, usecols=['text'], chunksize=settings.LABELER_CHUNK_ROWS):
+        chunk = chunk.dropna(subset=['text'])
+        keys = chunk['text'].map(normalize_text)
+        chunk = chunk[keys != ""]
+        found = keys[keys != ""].map(labels)
+        chunk = chunk.assign(
+            sentiment=[label[0] for label in found],
+            intent=[label[1] for label in found]
+        )
+        mode = 'w' if first else 'a'
+        chunk[['text', 'sentiment']].to_csv(output_sentiment_path, index=False, mode=mode, header=first)
+        chunk[['text', 'intent']].to_csv(output_intent_path, index=False, mode=mode, header=first)
+        first = False
+
+    print(f"Saved Sentiment Data to: {output_sentiment_path}")
     print(f"Saved Intent Data to: {output_intent_path}")
 
 if __name__ == "__main__":
-    run_auto_labeler()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Label raw support messages with a zero-shot teacher (resumable).")
+    parser.add_argument("--input", default=None, help="Raw CSV with a 'text' column (default: data/raw/raw_customer_chats.csv)")
+    parser.add_argument("--workers", type=int, default=settings.LABELER_WORKERS,
+                        help="Labelling processes; each holds its own copy of the teacher model")
+    args = parser.parse_args()
+    run_auto_labeler(args.input, args.workers)
@@ -1,92 +1,200 @@
 import sys
 import os
+import uuid
+import hashlib
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import chromadb
-from chromadb.utils import embedding_functions
 
 # --- PATH SETUP ---
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from config import settings
+from src.utils.response_cache import read_index_version
 
-def build_knowledge_base():
+def chunk_file(policy_dir, filename):
+    """Reads one policy file and returns its chunks as {"id", "text", "metadata"} dicts."""
+    file_path = os.path.join(policy_dir, filename)
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        full_text = f.read()
+
+    # --- CHUNKING LOGIC (Production Requirement) ---
+    # We split by double newlines to treat each paragraph as a separate searchable chunk.
+    # This prevents the 256-token limit from cutting off your data.
+    chunks = full_text.split('\n\n')
+
+    # Base ID from filename (e.g., "refund_policy")
+    base_id = filename.split('.')[0]
+
+    # Guess category
+    category = "refund" if "refund" in filename else "shipping" if "shipping" in filename else "general"
+
+    documents = {}
+    for chunk in chunks:
+        text = chunk.strip()
+        # Skip empty whitespace chunks
+        if not text:
+            continue
+        # The ID is derived from the content: an unchanged paragraph keeps its ID (and its
+        # embedding), an edited one gets a new ID. Repeated paragraphs collapse into one chunk.
+        content_hash = hashlib.sha1(f"{category}\n{text}".encode("utf-8")).hexdigest()[:16]
+        chunk_id = f"{base_id}_{content_hash}"
+        documents.setdefault(chunk_id, {
+            "id": chunk_id,
+            "text": text,
+            "metadata": {"category": category, "source": filename},
+        })
+    return list(documents.values())
+
+def existing_ids(collection, page_size):
+    """Every chunk ID already in the collection (IDs only, read page by page)."""
+    ids = set()
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return ids
+        ids.update(page["ids"])
+        offset += len(page["ids"])
+
+def open_collection(client, full_rebuild):
+    """
+    The knowledge base collection, created if missing. It is wiped first when asked to, or
+    when it was embedded with a different model (those vectors can't be reused).
+    """
+    try:
+        collection = client.get_collection(name=settings.CHROMA_COLLECTION_NAME)
+        built_with = (collection.metadata or {}).get("embedding_model")
+        if built_with != settings.EMBEDDING_MODEL_NAME:
+            print(f"   - Collection was embedded with {built_with}, not {settings.EMBEDDING_MODEL_NAME}. Rebuilding from scratch.")
+            full_rebuild = True
+        if full_rebuild:
+            client.delete_collection(name=settings.CHROMA_COLLECTION_NAME)
+            print("   - Deleted old collection to start fresh.")
+    except Exception:
+        pass
+
+    # Embeddings are computed here and passed in, so the collection needs no embedding function
+    return client.get_or_create_collection(
+        name=settings.CHROMA_COLLECTION_NAME,
+        metadata={"embedding_model": settings.EMBEDDING_MODEL_NAME}
+    )
+
+class ChunkUpserter:
+    """Embeds chunks one bounded batch at a time and upserts them, printing progress as it goes."""
+    def __init__(self, collection):
+        self.collection = collection
+        self.model = None
+        self.count = 0
+
+    def upsert(self, documents):
+        if self.model is None:
+            # Deferred: only pay for the model when something actually needs embedding
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(settings.EMBEDDING_MODEL_NAME)
+
+        texts = [doc["text"] for doc in documents]
+        embeddings = self.model.encode(texts, batch_size=settings.EMBEDDING_BATCH_SIZE, convert_to_numpy=True)
+        self.collection.upsert(
+            ids=[doc["id"] for doc in documents],
+            documents=texts,
+            metadatas=[doc["metadata"] for doc in documents],
+            embeddings=embeddings.tolist()
+        )
+        self.count += len(documents)
+        print(f"   - Embedded and stored {self.count} new or changed chunks so far...")
+
+def build_knowledge_base(full_rebuild=False):
     print("🚀 Building RAG Knowledge Base...")
 
-    documents = []
-    
-    # --- 1. READ & CHUNK DATA ---
+    # --- 1. FIND DATA ---
     policy_dir = os.path.join(settings.BASE_DIR, 'data', 'raw', 'policies')
-    
+
     # In production, fail if data is missing. Don't fallback to mock data silently.
     if not os.path.exists(policy_dir):
         raise FileNotFoundError(f"CRITICAL: No policy folder found at {policy_dir}. Cannot build database.")
 
-    # Loop through every .txt file
-    files_found = [f for f in os.listdir(policy_dir) if f.endswith(".txt")]
+    files_found = sorted(f for f in os.listdir(policy_dir) if f.endswith(".txt"))
     if not files_found:
         raise ValueError(f"CRITICAL: The folder {policy_dir} exists but is empty.")
 
     print(f"   - Found {len(files_found)} policy files.")
 
-    for filename in files_found:
-        file_path = os.path.join(policy_dir, filename)
-        
-        with open(file_path, "r", encoding="utf-8") as f:
-            full_text = f.read()
-        
-        # --- CHUNKING LOGIC (Production Requirement) ---
-        # We split by double newlines to treat each paragraph as a separate searchable chunk.
-        # This prevents the 256-token limit from cutting off your data.
-        chunks = full_text.split('\n\n')
-        
-        # Base ID from filename (e.g., "refund_policy")
-        base_id = filename.split('.')[0]
-        
-        # Guess category
-        category = "refund" if "refund" in filename else "shipping" if "shipping" in filename else "general"
-
-        for i, chunk in enumerate(chunks):
-            # Skip empty whitespace chunks
-            if chunk.strip(): 
-                documents.append({
-                    "id": f"{base_id}_chunk_{i}", # Unique ID for every paragraph
-                    "text": chunk.strip(),
-                    "category": category
-                })
-
-    print(f"   - processed into {len(documents)} searchable chunks.")
-
     # --- 2. SETUP CHROMADB ---
     print(f"   - Connecting to database at {settings.CHROMA_DB_PATH}...")
-    
+
     client = chromadb.PersistentClient(path=settings.CHROMA_DB_PATH)
-    
-    ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="all-MiniLM-L6-v2"
-    )
+    collection = open_collection(client, full_rebuild)
+    stored = existing_ids(collection, settings.RAG_INGEST_BATCH_SIZE * 16)
+    print(f"   - Collection holds {len(stored)} chunks.")
 
-    # --- 3. RESET COLLECTION ---
-    try:
-        client.delete_collection(name=settings.CHROMA_COLLECTION_NAME)
-        print("   - Deleted old collection to start fresh.")
-    except ValueError:
-        pass 
+    # --- 3. READ, CHUNK & DIFF ---
+    # Files are read on a thread pool, a group at a time, so only one group of chunk texts is
+    # held in memory. Chunks already stored under the same content hash are skipped.
+    upserter = ChunkUpserter(collection)
+    seen = set()
+    pending = []
+    total_chunks = 0
+    with ThreadPoolExecutor(max_workers=settings.RAG_INGEST_READ_THREADS) as pool:
+        group_size = settings.RAG_INGEST_FILE_GROUP
+        for start in range(0, len(files_found), group_size):
+            group = files_found[start:start + group_size]
+            for documents in pool.map(lambda name: chunk_file(policy_dir, name), group):
+                for doc in documents:
+                    if doc["id"] in seen:
+                        continue
+                    seen.add(doc["id"])
+                    total_chunks += 1
+                    if doc["id"] not in stored:
+                        pending.append(doc)
 
-    collection = client.create_collection(
-        name=settings.CHROMA_COLLECTION_NAME,
-        embedding_function=ef
-    )
+            # Embed as soon as a full batch is waiting, so memory stays bounded by the batch size
+            while len(pending) >= settings.RAG_INGEST_BATCH_SIZE:
+                upserter.upsert(pending[:settings.RAG_INGEST_BATCH_SIZE])
+                del pending[:settings.RAG_INGEST_BATCH_SIZE]
 
-    # --- 4. INDEXING ---
-    if documents:
-        print("   - Indexing documents...")
-        # Add in batches (Chroma handles large lists better in batches, but this is fine for <10k docs)
-        collection.add(
-            ids=[doc['id'] for doc in documents],
-            documents=[doc['text'] for doc in documents],
-            metadatas=[{"category": doc['category']} for doc in documents]
-        )
-        print(f"Knowledge Base Built! Indexed {len(documents)} chunks.")
+    if pending:
+        upserter.upsert(pending)
+
+    print(f"   - processed into {total_chunks} searchable chunks ({upserter.count} new or changed).")
+
+    # --- 4. REMOVE CHUNKS THAT NO LONGER EXIST ---
+    removed = sorted(stored - seen)
+    for start in range(0, len(removed), settings.RAG_INGEST_BATCH_SIZE):
+        collection.delete(ids=removed[start:start + settings.RAG_INGEST_BATCH_SIZE])
+    if removed:
+        print(f"   - Removed {len(removed)} deleted or edited chunks.")
+
+    changed = upserter.count or removed
+    if changed:
+        print(f"Knowledge Base Updated! {collection.count()} chunks indexed.")
     else:
-        print("Warning: No valid text chunks were found to index.")
+        print("Knowledge Base already up to date.")
+
+    # --- 5. STAMP THE NEW VERSION ---
+    # Running services watch this file and drop anything cached from the old index, so it is
+    # only rewritten when the contents actually changed
+    version = read_index_version()
+    if changed or version is None:
+        version = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        with open(settings.RAG_INDEX_VERSION_PATH, "w", encoding="utf-8") as f:
+            f.write(version)
+    print(f"   - Index version: {version}")
+
+    # --- 6. EXPORT THE IN-MEMORY INDEX ---
+    # Used when RAG_BACKEND = "numpy": the collection's embeddings as one normalized matrix
+    from src.components.vector_index import VectorIndex
+    try:
+        exported = VectorIndex.load(settings.RAG_VECTOR_INDEX_PATH, mmap=True).version
+    except FileNotFoundError:
+        exported = None
+    if exported != version:
+        VectorIndex.from_collection(collection, version=version).save(settings.RAG_VECTOR_INDEX_PATH)
+        print(f"   - Vector index exported to {settings.RAG_VECTOR_INDEX_PATH}")
 
 if __name__ == "__main__":
-    build_knowledge_base()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sync the RAG knowledge base with data/raw/policies (only changed chunks are re-embedded).")
+    parser.add_argument("--full", action="store_true", help="Drop the collection and re-embed everything")
+    args = parser.parse_args()
+    build_knowledge_base(full_rebuild=args.full)
@@ -0,0 +1,220 @@
+import sys
+import os
+import json
+import time
+import glob
+import shutil
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from config import settings
+from src.components.inference_backends import (
+    INT8_MODEL_FILE, MANIFEST_FILE, converted_path, load_seq2seq, load_sequence_classifier, quantize_dynamic
+)
+from src.utils.system import current_rss_mb
+
+MODELS = {"llm": settings.LLM_MODEL_NAME, "toxicity": settings.TOXICITY_MODEL_NAME}
+
+def heldout_queries(limit, seed=13):
+    """A fixed random sample of real user messages (logged queries and the processed training texts)."""
+    texts = []
+    log_path = os.path.join(settings.LOGS_DIR, 'production_logs.csv')
+    if os.path.exists(log_path):
+        texts += pd.read_csv(log_path, usecols=['user_query'])['user_query'].dropna().astype(str).tolist()
+    for name in ['automatically_labelled_support_data.csv', 'automatically_labelled_intents.csv']:
+        path = os.path.join(settings.BASE_DIR, 'data', 'processed', name)
+        if os.path.exists(path):
+            texts += pd.read_csv(path)['text'].dropna().astype(str).tolist()
+
+    texts = sorted(set(t.strip() for t in texts if t.strip()))
+    if not texts:
+        raise ValueError("No held-out queries found in logs/production_logs.csv or data/processed/.")
+    rng = np.random.default_rng(seed)
+    return [texts[i] for i in rng.permutation(len(texts))[:limit]]
+
+def directory_mb(path):
+    return sum(os.path.getsize(f) for f in glob.glob(os.path.join(path, "**"), recursive=True) if os.path.isfile(f)) / 1e6
+
+# --- CONVERSION ---
+
+def export_int8(reference, staging):
+    import torch
+    _, model = reference
+    torch.save(quantize_dynamic(model), os.path.join(staging, INT8_MODEL_FILE))
+    return {}
+
+def export_onnx(component, staging):
+    """Exports to ONNX, then quantizes every graph (encoder and decoders for the LLM) to dynamic int8."""
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    model_class = ORTModelForSeq2SeqLM if component == "llm" else ORTModelForSequenceClassification
+    fp32_dir = os.path.join(staging, "fp32")
+    model_class.from_pretrained(MODELS[component], export=True).save_pretrained(fp32_dir)
+
+    qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+    quantized = {}
+    for graph in sorted(glob.glob(os.path.join(fp32_dir, "*.onnx"))):
+        name = os.path.basename(graph)
+        ORTQuantizer.from_pretrained(fp32_dir, file_name=name).quantize(save_dir=staging, quantization_config=qconfig)
+        quantized[name] = name.replace(".onnx", "_quantized.onnx")
+    # Configs and tokenizer files are needed next to the quantized graphs; the fp32 graphs are not
+    for path in glob.glob(os.path.join(fp32_dir, "*")):
+        if not path.endswith((".onnx", ".onnx_data")) and not os.path.exists(os.path.join(staging, os.path.basename(path))):
+            shutil.copy(path, staging)
+    shutil.rmtree(fp32_dir)
+
+    if component == "toxicity":
+        return {"file_name": quantized["model.onnx"]}
+    load_kwargs = {}
+    for argument, name in (("encoder_file_name", "encoder_model.onnx"), ("decoder_file_name", "decoder_model.onnx"),
+                           ("decoder_with_past_file_name", "decoder_with_past_model.onnx")):
+        if name in quantized:
+            load_kwargs[argument] = quantized[name]
+    return load_kwargs
+
+# --- AGREEMENT CHECK ---
+
+def toxicity_outputs(model_and_tokenizer, queries):
+    from transformers import pipeline
+    tokenizer, model = model_and_tokenizer
+    classifier = pipeline("text-classification", model=model, tokenizer=tokenizer, top_k=None)
+    scores, seconds = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = classifier([query], truncation=True)[0]
+        seconds.append(time.perf_counter() - start)
+        scores.append(max(category['score'] for category in result))
+    return np.array(scores), seconds
+
+def llm_outputs(model_and_tokenizer, queries, max_new_tokens):
+    from src.components.prompt_builder import PromptBuilder
+    tokenizer, model = model_and_tokenizer
+    prompts = PromptBuilder(tokenizer)
+    answers, seconds = [], []
+    for query in queries:
+        # The serving prompt, with a generic context so no knowledge base is needed here
+        inputs = prompts.build(query, "Please contact support for help with your order.", "neutral", "general_inquiry").as_tensors()
+        start = time.perf_counter()
+        # Greedy, so differences come from the conversion and not from sampling
+        output_ids = model.generate(**inputs, do_sample=False, max_new_tokens=max_new_tokens)
+        seconds.append(time.perf_counter() - start)
+        answers.append(tokenizer.decode(output_ids[0], skip_special_tokens=True).strip())
+    return answers, seconds
+
+def token_f1(reference, candidate):
+    reference, candidate = reference.lower().split(), candidate.lower().split()
+    if not reference and not candidate:
+        return 1.0
+    common = sum(min(reference.count(word), candidate.count(word)) for word in set(candidate))
+    if not common:
+        return 0.0
+    precision, recall = common / len(candidate), common / len(reference)
+    return 2 * precision * recall / (precision + recall)
+
+def compare(component, backend, reference, rss_reference, staging, queries, max_new_tokens):
+    """Runs fp32 and the converted model (read from staging) on the same queries; returns the agreement report."""
+    loader = load_seq2seq if component == "llm" else load_sequence_classifier
+    rss_before = current_rss_mb()
+    converted = loader(MODELS[component], backend, directory=staging)
+    rss_converted = current_rss_mb() - rss_before
+
+    if component == "toxicity":
+        ref_scores, ref_seconds = toxicity_outputs(reference, queries)
+        new_scores, new_seconds = toxicity_outputs(converted, queries)
+        threshold = settings.TOXICITY_THRESHOLD
+        agreement = float(np.mean((ref_scores > threshold) == (new_scores > threshold)))
+        details = {"max_score_difference": float(np.max(np.abs(ref_scores - new_scores)))}
+    else:
+        ref_answers, ref_seconds = llm_outputs(reference, queries, max_new_tokens)
+        new_answers, new_seconds = llm_outputs(converted, queries, max_new_tokens)
+        agreement = float(np.mean([token_f1(a, b) for a, b in zip(ref_answers, new_answers)]))
+        details = {"exact_match": float(np.mean([a == b for a, b in zip(ref_answers, new_answers)]))}
+
+    return {
+        "queries": len(queries),
+        "agreement": agreement,
+        **details,
+        "fp32_p50_ms": round(float(np.median(ref_seconds)) * 1000, 2),
+        "converted_p50_ms": round(float(np.median(new_seconds)) * 1000, 2),
+        "speedup": round(float(np.median(ref_seconds) / np.median(new_seconds)), 2),
+        # RSS growth while loading: a rough but comparable measure of each model's resident size
+        "fp32_load_rss_mb": round(rss_reference, 1),
+        "converted_load_rss_mb": round(rss_converted, 1),
+        "converted_disk_mb": round(directory_mb(staging), 1),
+    }
+
+def export(component, backend, queries, max_new_tokens, force=False):
+    print(f"\nExporting {MODELS[component]} as {backend}...")
+    target = converted_path(component, backend)
+    staging = f"{target}.staging-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    loader = load_seq2seq if component == "llm" else load_sequence_classifier
+    rss_before = current_rss_mb()
+    reference = loader(MODELS[component], "torch")
+    rss_reference = current_rss_mb() - rss_before
+
+    try:
+        load_kwargs = export_onnx(component, staging) if backend == "onnx" else export_int8(reference, staging)
+        manifest = {
+            "model_name": MODELS[component],
+            "backend": backend,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "load_kwargs": load_kwargs,
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        print(f"   - Checking agreement with fp32 on {len(queries)} held-out queries...")
+        report = compare(component, backend, reference, rss_reference, staging, queries, max_new_tokens)
+        for key, value in report.items():
+            print(f"     {key:<24} {value}")
+
+        minimum = settings.INFERENCE_MIN_AGREEMENT[component]
+        report["passed"] = report["agreement"] >= minimum
+        if not report["passed"] and not force:
+            print(f"   - Agreement {report['agreement']:.3f} is below {minimum}. Export discarded (use --force to keep it).")
+            return report
+
+        manifest["agreement"] = report
+        with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        # Swap in the new export as a whole, so a loader never sees half of it
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(staging, target)
+        print(f"   - Saved to {target}")
+        return report
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert flan-t5 / toxic-bert to int8 or ONNX inference backends and check them against fp32."
+    )
+    parser.add_argument("--component", choices=["llm", "toxicity", "all"], default="all")
+    parser.add_argument("--backend", choices=["torch_int8", "onnx", "all"], default="torch_int8")
+    parser.add_argument("--queries", type=int, default=200, help="Held-out queries for the toxicity check")
+    parser.add_argument("--llm-queries", type=int, default=30, help="Held-out queries for the LLM check (it generates)")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--force", action="store_true", help="Keep an export even if it fails the agreement check")
+    args = parser.parse_args()
+
+    components = ["llm", "toxicity"] if args.component == "all" else [args.component]
+    backends = ["torch_int8", "onnx"] if args.backend == "all" else [args.backend]
+    os.makedirs(settings.INFERENCE_MODELS_DIR, exist_ok=True)
+
+    failed = False
+    for component in components:
+        queries = heldout_queries(args.llm_queries if component == "llm" else args.queries)
+        for backend in backends:
+            report = export(component, backend, queries, args.max_new_tokens, args.force)
+            failed |= not report["passed"]
+
+    print("\nSelect a backend with CHATBOT_LLM_BACKEND / CHATBOT_TOXICITY_BACKEND (or settings.py).")
+    sys.exit(1 if failed else 0)
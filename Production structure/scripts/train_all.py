@@ -0,0 +1,26 @@
+import sys
+import os
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from training_utils import PhaseTimer
+from train_sentiment import train_sentiment_model
+from train_intent import train_intent_model
+
+def train_all():
+    """
+    Retrains both classifiers in one run. Each one's grid search uses every core in turn, and
+    feature matrices are reused from the cache for whichever dataset did not change.
+    """
+    print("Starting Full Training Run...")
+    start = time.perf_counter()
+    timer = PhaseTimer()
+
+    train_sentiment_model(timer)
+    train_intent_model(timer)
+
+    timer.report()
+    print(f"All models trained in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    train_all()
@@ -1,7 +1,7 @@
 import sys
 import os
 import pandas as pd
-import joblib
+import sklearn
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.model_selection import GridSearchCV
@@ -9,9 +9,19 @@ from sklearn.preprocessing import LabelEncoder
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from config import settings
+from src.components.compiled_scorer import compile_classifier, verify_compiled
+from src.utils.model_bundle import save_bundle
+from training_utils import PhaseTimer, cached_features, thread_budget
 
-def train_intent_model():
+PARAM_GRID = {
+    'C': [0.1, 1.0, 10.0],
+    'solver': ['lbfgs']
+}
+CV_FOLDS = 3
+
+def train_intent_model(timer=None):
     print("Starting Intent Training...")
+    timer = timer or PhaseTimer()
 
     # Construct the path to your processed data file
     # Make sure this filename matches whatever your Auto-Labeler outputted for intents
@@ -20,29 +30,33 @@ def train_intent_model():
     if not os.path.exists(data_path):
         raise FileNotFoundError(f"Critical Error: Could not find training data at {data_path}")
         
-    print(f"   - Loading data from {data_path}...")
-    df = pd.read_csv(data_path)
+    with timer.phase("intent: load data"):
+        print(f"   - Loading data from {data_path}...")
+        df = pd.read_csv(data_path)
 
-    # Clean up column names to ensure they match expectations
-    # (Adjust 'intent_label' or 'clean_text' if your CSV headers are different)
-    if 'intent_label' in df.columns:
-        df.rename(columns={'intent_label': 'intent'}, inplace=True)
-    if 'clean_text' in df.columns:
-        df.rename(columns={'clean_text': 'text'}, inplace=True)
+        # Clean up column names to ensure they match expectations
+        # (Adjust 'intent_label' or 'clean_text' if your CSV headers are different)
+        if 'intent_label' in df.columns:
+            df.rename(columns={'intent_label': 'intent'}, inplace=True)
+        if 'clean_text' in df.columns:
+            df.rename(columns={'clean_text': 'text'}, inplace=True)
 
-    # Sanity Check: Drop rows where text or intent is missing
-    initial_count = len(df)
-    df.dropna(subset=['text', 'intent'], inplace=True)
-    if len(df) < initial_count:
-        print(f"   - Dropped {initial_count - len(df)} rows with missing data.")
+        # Sanity Check: Drop rows where text or intent is missing
+        initial_count = len(df)
+        df.dropna(subset=['text', 'intent'], inplace=True)
+        if len(df) < initial_count:
+            print(f"   - Dropped {initial_count - len(df)} rows with missing data.")
 
-    print(f"   - Training on {len(df)} examples.")
+        print(f"   - Training on {len(df)} examples.")
 
     # VECTORIZATION
-    print("   - Vectorizing...")
-    # We use .astype(str) to prevent crashes on non-string inputs
-    vectorizer = TfidfVectorizer(max_features=2000, ngram_range=(1,2))
-    X = vectorizer.fit_transform(df['text'].astype(str))
+    with timer.phase("intent: vectorize"):
+        print("   - Vectorizing...")
+        # We use .astype(str) to prevent crashes on non-string inputs
+        texts = df['text'].astype(str).tolist()
+        vectorizer, X = cached_features(
+            "intent", texts, TfidfVectorizer(max_features=2000, ngram_range=(1,2))
+        )
 
     # ENCODE LABELS
     encoder = LabelEncoder()
@@ -52,38 +66,57 @@ def train_intent_model():
     print(f"   - Detected Intents: {list(encoder.classes_)}")
 
     # TRAIN MODEL
-    # TRAIN MODEL
-    print("   - Training Logistic Regression with Grid Search...")
-    
+    # lbfgs is single-threaded, so every grid point x fold can have a core of its own
+    outer_jobs, _ = thread_budget(CV_FOLDS * len(PARAM_GRID['C']) * len(PARAM_GRID['solver']))
+    print(f"   - Training Logistic Regression with Grid Search ({outer_jobs} fits in parallel)...")
+
     lr_model = LogisticRegression(class_weight='balanced', max_iter=1000)
-    
-    param_grid = {
-        'C': [0.1, 1.0, 10.0],
-        'solver': ['lbfgs']
-    }
 
     grid_search = GridSearchCV(
         estimator=lr_model,
-        param_grid=param_grid,
+        param_grid=PARAM_GRID,
         scoring='accuracy',
-        cv=3,
+        cv=CV_FOLDS,
+        n_jobs=outer_jobs,
         verbose=1
     )
 
-    grid_search.fit(X, y)
+    with timer.phase("intent: grid search + refit"):
+        grid_search.fit(X, y)
     
     print(f"   - Best Parameters: {grid_search.best_params_}")
     model = grid_search.best_estimator_
 
+    # COMPILE + VERIFY: the compiled scorer is only released if it reproduces every label
+    with timer.phase("intent: compile scorer"):
+        print(f"   - Compiling scorer and checking it against the model on {len(texts)} texts...")
+        scorer = compile_classifier(vectorizer, model, encoder)
+        verify_compiled(scorer, vectorizer, model, encoder, texts)
+
     # SAVE ARTIFACTS
-    print(f"   - Saving artifacts to {settings.ARTIFACTS_DIR}...")
-    os.makedirs(settings.ARTIFACTS_DIR, exist_ok=True)
+    with timer.phase("intent: save"):
+        print(f"   - Saving artifacts to {settings.MODEL_BUNDLE_DIR}...")
+        os.makedirs(settings.ARTIFACTS_DIR, exist_ok=True)
 
-    joblib.dump(model, settings.INTENT_MODEL_PATH)
-    joblib.dump(vectorizer, settings.INTENT_VECTORIZER_PATH)
-    joblib.dump(encoder, settings.INTENT_LABEL_PATH)
+        # One bundle holds all three pieces, so they can only ever be loaded as a matching set,
+        # plus the same model compiled into plain lookup arrays for low-overhead serving
+        version = save_bundle(
+            "intent",
+            {"vectorizer": vectorizer, "model": model, "label_encoder": encoder,
+             "scorer": scorer},
+            data_path=data_path,
+            extra={
+                "classes": [str(c) for c in encoder.classes_],
+                "best_params": grid_search.best_params_,
+                "cv_accuracy": float(grid_search.best_score_),
+                "sklearn_version": sklearn.__version__,
+            }
+        )
+        print(f"   - Released bundle intent/{version}")
 
     print("Intent Model Built Successfully!")
 
 if __name__ == "__main__":
-    train_intent_model()
\ No newline at end of file
+    timer = PhaseTimer()
+    train_intent_model(timer)
+    timer.report()
\ No newline at end of file
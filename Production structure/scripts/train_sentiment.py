@@ -2,7 +2,7 @@ import sys
 import os
 import pandas as pd
 import xgboost as xgb
-import joblib
+import sklearn
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.model_selection import train_test_split, GridSearchCV
 from sklearn.preprocessing import LabelEncoder
@@ -10,9 +10,20 @@ from sklearn.utils.class_weight import compute_sample_weight
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from config import settings
+from src.components.compiled_scorer import compile_classifier, verify_compiled
+from src.utils.model_bundle import save_bundle
+from training_utils import PhaseTimer, cached_features, thread_budget
 
-def train_sentiment_model():
+PARAM_GRID = {
+    'n_estimators': [50, 100],
+    'max_depth': [3, 5],
+    'learning_rate': [0.1, 0.2]
+}
+CV_FOLDS = 3
+
+def train_sentiment_model(timer=None):
     print("Starting Sentiment Training...")
+    timer = timer or PhaseTimer()
 
     # This points to the file created by your Auto-Labeling step
     data_path = os.path.join(settings.BASE_DIR, 'data', 'processed', 'automatically_labelled_support_data.csv')
@@ -20,23 +31,27 @@ def train_sentiment_model():
     if not os.path.exists(data_path):
         raise FileNotFoundError(f"Could not find data at {data_path}. Did you run the Auto-Labeler?")
 
-    print(f"   - Loading data from {data_path}...")
-    df = pd.read_csv(data_path)
-    
-    # Standardize column names
-    if 'sentiment_label' in df.columns:
-        df.rename(columns={'sentiment_label': 'sentiment'}, inplace=True)
-        
-    if 'clean_text' in df.columns:
-        df.rename(columns={'clean_text': 'text'}, inplace=True)
-    
-    print(f"   - Loaded {len(df)} training examples")
+    with timer.phase("sentiment: load data"):
+        print(f"   - Loading data from {data_path}...")
+        df = pd.read_csv(data_path)
+
+        # Standardize column names
+        if 'sentiment_label' in df.columns:
+            df.rename(columns={'sentiment_label': 'sentiment'}, inplace=True)
+
+        if 'clean_text' in df.columns:
+            df.rename(columns={'clean_text': 'text'}, inplace=True)
+
+        print(f"   - Loaded {len(df)} training examples")
 
     # VECTORIZATION
-    print("   - Vectorizing text...")
-    vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
-    # Use the 'text' column we just renamed
-    X = vectorizer.fit_transform(df['text'].astype(str)) # Added .astype(str) to prevent errors if text is empty
+    with timer.phase("sentiment: vectorize"):
+        print("   - Vectorizing text...")
+        # Use the 'text' column we just renamed (.astype(str) prevents errors if text is empty)
+        texts = df['text'].astype(str).tolist()
+        vectorizer, X = cached_features(
+            "sentiment", texts, TfidfVectorizer(max_features=1000, stop_words='english')
+        )
 
     # ENCODE LABELS
     encoder = LabelEncoder()
@@ -50,44 +65,66 @@ def train_sentiment_model():
     sample_weights = compute_sample_weight(class_weight='balanced', y=y_train)
 
     # TRAIN XGBOOST
-    # TRAIN XGBOOST
-    print("   - Training XGBoost Classifier with Grid Search...")
+    # Grid points x folds run side by side; each XGBoost fit gets the cores left over,
+    # so the two levels of parallelism never oversubscribe the machine
+    fits = CV_FOLDS * len(PARAM_GRID['n_estimators']) * len(PARAM_GRID['max_depth']) * len(PARAM_GRID['learning_rate'])
+    outer_jobs, xgb_threads = thread_budget(fits)
+    print(f"   - Training XGBoost Classifier with Grid Search ({outer_jobs} fits in parallel x {xgb_threads} thread(s) each)...")
     xgb_model = xgb.XGBClassifier(
         objective='multi:softmax',
         num_class=3,
-        eval_metric='mlogloss'
+        eval_metric='mlogloss',
+        n_jobs=xgb_threads
     )
 
-    param_grid = {
-        'n_estimators': [50, 100],
-        'max_depth': [3, 5],
-        'learning_rate': [0.1, 0.2]
-    }
-
     grid_search = GridSearchCV(
         estimator=xgb_model,
-        param_grid=param_grid,
+        param_grid=PARAM_GRID,
         scoring='accuracy',
-        cv=3,
+        cv=CV_FOLDS,
+        n_jobs=outer_jobs,
         verbose=1
     )
 
-    grid_search.fit(X_train, y_train, sample_weight=sample_weights)
+    with timer.phase("sentiment: grid search + refit"):
+        grid_search.fit(X_train, y_train, sample_weight=sample_weights)
 
     print(f"   - Best Parameters based on Grid Search: {grid_search.best_params_}")
     model = grid_search.best_estimator_
 
+    # COMPILE + VERIFY: the compiled scorer is only released if it reproduces every label
+    with timer.phase("sentiment: compile scorer"):
+        print(f"   - Compiling scorer and checking it against the model on {len(texts)} texts...")
+        scorer = compile_classifier(vectorizer, model, encoder)
+        verify_compiled(scorer, vectorizer, model, encoder, texts)
+
     # SAVE ARTIFACTS
-    print(f"   - Saving artifacts to {settings.ARTIFACTS_DIR}...")
-    
-    # Ensure directory exists
-    os.makedirs(settings.ARTIFACTS_DIR, exist_ok=True)
-    
-    joblib.dump(model, settings.SENTIMENT_MODEL_PATH)
-    joblib.dump(vectorizer, settings.SENTIMENT_VECTORIZER_PATH)
-    joblib.dump(encoder, settings.SENTIMENT_LABEL_PATH)
-    
+    with timer.phase("sentiment: save"):
+        print(f"   - Saving artifacts to {settings.MODEL_BUNDLE_DIR}...")
+
+        # Ensure directory exists
+        os.makedirs(settings.ARTIFACTS_DIR, exist_ok=True)
+
+        # One bundle holds all three pieces, so they can only ever be loaded as a matching set,
+        # plus the same model compiled into plain lookup arrays for low-overhead serving
+        version = save_bundle(
+            "sentiment",
+            {"vectorizer": vectorizer, "model": model, "label_encoder": encoder,
+             "scorer": scorer},
+            data_path=data_path,
+            extra={
+                "classes": [str(c) for c in encoder.classes_],
+                "best_params": grid_search.best_params_,
+                "cv_accuracy": float(grid_search.best_score_),
+                "sklearn_version": sklearn.__version__,
+                "xgboost_version": xgb.__version__,
+            }
+        )
+        print(f"   - Released bundle sentiment/{version}")
+
     print("Sentiment Model Built Successfully!")
 
 if __name__ == "__main__":
-    train_sentiment_model()
\ No newline at end of file
+    timer = PhaseTimer()
+    train_sentiment_model(timer)
+    timer.report()
\ No newline at end of file
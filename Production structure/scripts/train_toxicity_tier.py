@@ -0,0 +1,148 @@
+import sys
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split, cross_val_predict, StratifiedKFold
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from config import settings
+
+# Our support data is almost entirely benign, so without these the fast tier would never see
+# a toxic example and could not be calibrated. Like every other text, they are labelled by
+# toxic-bert itself, not by hand.
+SEED_ABUSIVE_MESSAGES = [
+    "You are a useless idiot.",
+    "Shut up, you stupid bot.",
+    "I hate you and your garbage company.",
+    "You people are morons, fix my order.",
+    "This is crap and you are all pathetic losers.",
+    "Go to hell, worthless support.",
+    "What a dumb answer, are you brain dead?",
+    "Screw you and your stupid refund policy.",
+    "You idiots broke my phone, you disgusting scammers.",
+    "I will find you and hurt you if my package is late.",
+    "Your agents are filthy liars and thieves.",
+    "Stupid stupid stupid bot, answer me.",
+]
+
+def load_corpus(extra_paths):
+    texts = []
+    for name in ['automatically_labelled_support_data.csv', 'automatically_labelled_intents.csv']:
+        path = os.path.join(settings.BASE_DIR, 'data', 'processed', name)
+        if os.path.exists(path):
+            texts += pd.read_csv(path)['text'].dropna().astype(str).tolist()
+
+    log_path = os.path.join(settings.LOGS_DIR, 'production_logs.csv')
+    if os.path.exists(log_path):
+        texts += pd.read_csv(log_path, usecols=['user_query'])['user_query'].dropna().astype(str).tolist()
+
+    for path in extra_paths:
+        texts += pd.read_csv(path)['text'].dropna().astype(str).tolist()
+
+    texts += SEED_ABUSIVE_MESSAGES
+    # Duplicates would leak between the train and test split
+    return sorted(set(t.strip() for t in texts if t.strip()))
+
+def label_with_teacher(texts, batch_size=32):
+    """toxic-bert's verdict for every text: 1 when it would block the message."""
+    from src.components.guardrails import ToxicityFilter
+
+    teacher = ToxicityFilter(batching=False, cascade=False)
+    scores = []
+    for start in range(0, len(texts), batch_size):
+        scores += teacher.max_scores(texts[start:start + batch_size])
+    return (np.array(scores) > teacher.threshold).astype(int)
+
+def build_vectorizer():
+    # Stateless: hashing means no vocabulary to fit or store
+    return HashingVectorizer(
+        analyzer='char_wb', ngram_range=(2, 4), n_features=2 ** 18,
+        alternate_sign=False, norm='l2', lowercase=True
+    )
+
+def calibrate(probabilities, labels, margin):
+    """
+    Picks the two cut-offs from out-of-fold probabilities:
+    - clear_below: under the least toxic-looking message toxic-bert blocked (scaled by margin)
+    - block_above: over the most toxic-looking message toxic-bert allowed
+    Between them, the fast tier defers to toxic-bert.
+    """
+    toxic = probabilities[labels == 1]
+    safe = probabilities[labels == 0]
+    clear_below = float(toxic.min()) * margin
+    block_above = float(safe.max()) + (1.0 - float(safe.max())) * (1.0 - margin)
+    # Block tier is only worth keeping if some toxic messages actually clear it
+    if not (toxic >= block_above).any():
+        block_above = 1.01
+    return clear_below, block_above
+
+def report(name, probabilities, labels, clear_below, block_above):
+    cleared = probabilities < clear_below
+    blocked = probabilities >= block_above
+    decided = cleared | blocked
+    # Decided messages must match toxic-bert; escalated ones are decided by toxic-bert itself
+    wrong = (cleared & (labels == 1)) | (blocked & (labels == 0))
+    print(f"   - {name}: {len(labels)} messages | skipped BERT for {decided.mean():.1%} "
+          f"(cleared {cleared.sum()}, blocked {blocked.sum()}) | "
+          f"agreement with BERT-only {1 - wrong.mean():.2%} ({wrong.sum()} disagreements)")
+    return {"messages": int(len(labels)), "skip_rate": float(decided.mean()), "agreement": float(1 - wrong.mean())}
+
+def train_toxicity_tier(extra_paths=(), margin=0.8):
+    print("Starting Toxicity Fast-Tier Training...")
+
+    texts = load_corpus(extra_paths)
+    print(f"   - Loaded {len(texts)} unique messages.")
+
+    print("   - Labelling with toxic-bert (teacher)...")
+    labels = label_with_teacher(texts)
+    print(f"   - toxic-bert blocks {labels.sum()} of {len(labels)}.")
+    if labels.sum() < 4 or (labels == 0).sum() < 4:
+        raise ValueError("Need at least 4 blocked and 4 allowed messages to calibrate. Add data with --extra.")
+
+    texts = np.array(texts, dtype=object)
+    X_train, X_test, y_train, y_test = train_test_split(
+        texts, labels, test_size=0.3, random_state=42, stratify=labels
+    )
+
+    vectorizer = build_vectorizer()
+    model = LogisticRegression(class_weight='balanced', max_iter=1000, C=10.0)
+
+    # CALIBRATE on out-of-fold scores so thresholds aren't fitted to memorised examples
+    print("   - Calibrating thresholds...")
+    folds = StratifiedKFold(n_splits=min(5, int(y_train.sum()), int((y_train == 0).sum())), shuffle=True, random_state=42)
+    oof = cross_val_predict(model, vectorizer.transform(X_train), y_train, cv=folds, method='predict_proba')[:, 1]
+    clear_below, block_above = calibrate(oof, y_train, margin)
+    print(f"   - Clear below {clear_below:.3f} | Block at or above {block_above:.3f}")
+
+    model.fit(vectorizer.transform(X_train), y_train)
+
+    # MEASURE agreement with the BERT-only decision on data the model never saw
+    print("   - Agreement with toxic-bert:")
+    metrics = {
+        "calibration (out-of-fold)": report("calibration (out-of-fold)", oof, y_train, clear_below, block_above),
+        "held-out": report("held-out", model.predict_proba(vectorizer.transform(X_test))[:, 1], y_test, clear_below, block_above),
+    }
+
+    os.makedirs(settings.ARTIFACTS_DIR, exist_ok=True)
+    joblib.dump({
+        "vectorizer": vectorizer,
+        "model": model,
+        "clear_below": clear_below,
+        "block_above": block_above,
+        "teacher": settings.TOXICITY_MODEL_NAME,
+        "teacher_threshold": settings.TOXICITY_THRESHOLD,
+        "metrics": metrics,
+    }, settings.TOXICITY_FAST_TIER_PATH)
+    print(f"Fast tier saved to {settings.TOXICITY_FAST_TIER_PATH}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the cheap first tier of the toxicity cascade against toxic-bert.")
+    parser.add_argument("--extra", nargs="*", default=[], help="Extra CSV files with a 'text' column")
+    parser.add_argument("--margin", type=float, default=0.8,
+                        help="Safety margin in (0, 1]; lower sends more messages to toxic-bert")
+    args = parser.parse_args()
+    train_toxicity_tier(args.extra, args.margin)
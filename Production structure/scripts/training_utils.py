@@ -0,0 +1,69 @@
+import os
+import time
+import hashlib
+from contextlib import contextmanager
+
+import joblib
+import sklearn
+
+from config import settings
+
+class PhaseTimer:
+    """Wall time per named training phase, printed as each phase ends and summarised at the end."""
+    def __init__(self):
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.phases.append((name, seconds))
+            print(f"     [{name}: {seconds:.2f}s]")
+
+    def report(self):
+        print("\n   Wall time per phase")
+        for name, seconds in self.phases:
+            print(f"   {name:<40} {seconds:>8.2f}s")
+        print(f"   {'total':<40} {sum(s for _, s in self.phases):>8.2f}s")
+
+def thread_budget(fits, cores=None):
+    """
+    Splits the cores between grid-search fits running side by side (outer) and the threads
+    each fit may use itself (inner, e.g. XGBoost's n_jobs), so outer * inner never exceeds the
+    core count. Fits are independent, so they get the cores first.
+    """
+    cores = cores or settings.TRAIN_CORES or os.cpu_count() or 1
+    outer = max(1, min(cores, fits))
+    inner = max(1, cores // outer)
+    return outer, inner
+
+def cached_features(name, texts, vectorizer):
+    """
+    Fits vectorizer on texts and returns (fitted vectorizer, sparse matrix), reusing the result
+    from disk when the same texts were vectorized with the same parameters before. The key
+    covers the text contents, the vectorizer's parameters and the scikit-learn version.
+    """
+    digest = hashlib.sha1()
+    for text in texts:
+        digest.update(text.encode("utf-8") + b"\0")
+    digest.update(repr(sorted(vectorizer.get_params().items())).encode("utf-8"))
+    digest.update(sklearn.__version__.encode("utf-8"))
+    path = os.path.join(settings.FEATURE_CACHE_DIR, f"{name}-{digest.hexdigest()[:16]}.joblib")
+
+    if os.path.exists(path):
+        print(f"   - Reusing cached features from {path}")
+        cached = joblib.load(path)
+        return cached["vectorizer"], cached["X"]
+
+    X = vectorizer.fit_transform(texts)
+    os.makedirs(settings.FEATURE_CACHE_DIR, exist_ok=True)
+    # Only the latest matrix per feature set is worth keeping
+    for stale in os.listdir(settings.FEATURE_CACHE_DIR):
+        if stale.startswith(f"{name}-"):
+            os.remove(os.path.join(settings.FEATURE_CACHE_DIR, stale))
+    joblib.dump({"vectorizer": vectorizer, "X": X}, path)
+    print(f"   - Cached features to {path}")
+    return vectorizer, X
@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import settings
+from src.components.guardrails import ToxicityFilter
+from src.components.classifiers import SentimentEngine, IntentEngine
+from src.components.rag import KnowledgeBase
+from src.components.llm import ChatGenerator
+from src.components.embeddings import get_embedding_service
+from src.components.inference_backends import converted_path
+from src.utils.analytics import ExperimentLogger, QualityValidator
+from src.utils.response_cache import SemanticResponseCache
+from src.utils.session_store import open_session_store
+from src.utils.model_bundle import current_pointer
+from src.utils.stage_cache import StageCache
+from src.utils.system import current_rss_mb, proportional_rss_mb
+from src.utils.tracing import tracer
+from src.pipeline import ChatPipeline
+
+# name -> (label, factory). Everything here is independent, so it can load side by side.
+# The embedder is listed on its own so MiniLM shows up separately in the boot report;
+# KnowledgeBase and QualityValidator then share that instance.
+COMPONENTS = {
+    "sentiment_engine": ("Sentiment Classifier (XGBoost)", SentimentEngine),
+    "intent_engine": ("Intent Classifier (LogReg)", IntentEngine),
+    "safety_guard": ("Toxicity Filter (toxic-bert)", ToxicityFilter),
+    "embedder": ("Embedding Service (MiniLM)", get_embedding_service),
+    "rag_system": ("RAG Knowledge Base (Chroma)", KnowledgeBase),
+    "bot_voice": ("LLM (flan-t5)", ChatGenerator),
+    "logger": ("Experiment Logger", ExperimentLogger),
+    "validator": ("Quality Validator", QualityValidator),
+}
+
+
+class LazyComponent:
+    """
+    Stands in for a component that is still loading in the background.
+    Attribute access blocks until the real object is ready, then forwards to it.
+    """
+    def __init__(self, name, future):
+        self._name = name
+        self._future = future
+
+    @property
+    def ready(self):
+        return self._future.done()
+
+    def __getattr__(self, attr):
+        return getattr(self._future.result(), attr)
+
+
+class ComponentLoader:
+    """
+    Builds all components on a thread pool and records how long each took and how much
+    resident memory the process gained meanwhile. Loads overlap, so the memory deltas are
+    approximate: a component can be charged for memory another one allocated at the same time.
+    """
+    def __init__(self, components=None, parallel=settings.PARALLEL_STARTUP):
+        self.components = components or COMPONENTS
+        self.report = []
+        self.wall_seconds = 0.0
+        self._report_lock = threading.Lock()
+        # Not used as a context manager: lazy loads must outlive load()
+        self._pool = ThreadPoolExecutor(
+            max_workers=len(self.components) if parallel else 1,
+            thread_name_prefix="loader"
+        )
+
+    def load(self, lazy=()):
+        """
+        Returns {name: component}. Names listed in lazy come back as LazyComponent proxies that
+        keep loading in the background; everything else is ready when this returns.
+        Raises the first error from an eager component.
+        """
+        start = time.perf_counter()
+        futures = {
+            name: self._pool.submit(self._load_one, name, label, factory)
+            for name, (label, factory) in self.components.items()
+        }
+
+        loaded = {}
+        for name, future in futures.items():
+            if name in lazy:
+                loaded[name] = LazyComponent(name, future)
+            else:
+                loaded[name] = future.result()
+
+        self.wall_seconds = time.perf_counter() - start
+        self._pool.shutdown(wait=False)
+        return loaded
+
+    def _load_one(self, name, label, factory):
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return factory()
+        except Exception as e:
+            status = f"failed: {e}"
+            raise
+        finally:
+            entry = {
+                "name": name,
+                "label": label,
+                "seconds": time.perf_counter() - start,
+                "rss_delta_mb": current_rss_mb() - rss_before,
+                "status": status,
+            }
+            with self._report_lock:
+                self.report.append(entry)
+            print(f"   - {label}: {status} in {entry['seconds']:.2f}s")
+
+    def print_report(self):
+        with self._report_lock:
+            entries = sorted(self.report, key=lambda e: e["seconds"], reverse=True)
+        finished = {e["name"] for e in entries}
+
+        print("\n   Boot report (load time | RSS gained while loading)")
+        for entry in entries:
+            print(f"   {entry['label']:<34} {entry['seconds']:>7.2f}s {entry['rss_delta_mb']:>9.1f} MB  {entry['status']}")
+        for name, (label, _) in self.components.items():
+            if name not in finished:
+                print(f"   {label:<34} warming up in background")
+
+        summed = sum(e["seconds"] for e in entries)
+        print(f"   Startup wall time {self.wall_seconds:.2f}s (components sum {summed:.2f}s) | RSS now {current_rss_mb():.0f} MB\n")
+
+
+def build_stage_cache():
+    """StageCache with every deterministic stage registered against the artifacts it depends on."""
+    cache = StageCache(disk_path=settings.STAGE_CACHE_DISK_PATH if settings.STAGE_CACHE_DISK else None)
+    sentiment_artifacts = [current_pointer("sentiment"), settings.SENTIMENT_MODEL_PATH,
+                           settings.SENTIMENT_VECTORIZER_PATH, settings.SENTIMENT_LABEL_PATH]
+    intent_artifacts = [current_pointer("intent"), settings.INTENT_MODEL_PATH,
+                        settings.INTENT_VECTORIZER_PATH, settings.INTENT_LABEL_PATH]
+    cache.register("sentiment", sentiment_artifacts)
+    cache.register("intent", intent_artifacts)
+    # A converted toxic-bert can score slightly differently, so its export is part of the key too
+    cache.register(
+        "safety",
+        [settings.TOXICITY_FAST_TIER_PATH,
+         os.path.join(converted_path("toxicity", settings.TOXICITY_BACKEND), "manifest.json")],
+        extra=f"{settings.TOXICITY_MODEL_NAME}:{settings.TOXICITY_THRESHOLD}:{settings.TOXICITY_CASCADE}:"
+              f"{settings.TOXICITY_BACKEND}"
+    )
+    # Chroma reads from disk on every query (and the numpy index reloads itself after a rebuild),
+    # so a rebuild changes results without a restart. With intent filtering the chosen category
+    # depends on the intent model too.
+    cache.register(
+        "retrieval",
+        [settings.RAG_INDEX_VERSION_PATH, os.path.join(settings.CHROMA_DB_PATH, "chroma.sqlite3"), *intent_artifacts],
+        extra=f"{settings.EMBEDDING_MODEL_NAME}:{settings.RAG_BACKEND}:{settings.RAG_INTENT_FILTER}:"
+              f"{sorted(settings.RAG_INTENT_CATEGORIES.items())}",
+        live=True
+    )
+    return cache
+
+
+def load_pipeline(variant="v1_production", lazy=None):
+    """
+    Loads every component (concurrently) and wires them into a ChatPipeline.
+    Components named in lazy (default: settings.LAZY_COMPONENTS) keep warming up in the
+    background and block only the first request that needs them.
+    Raises whatever the failing component raised so callers can report it.
+    """
+    lazy = settings.LAZY_COMPONENTS if lazy is None else lazy
+    loader = ComponentLoader()
+    components = loader.load(lazy=lazy)
+    loader.print_report()
+
+    response_cache = None
+    if settings.RESPONSE_CACHE_ENABLED:
+        response_cache = SemanticResponseCache(components["embedder"])
+
+    stage_cache = build_stage_cache() if settings.STAGE_CACHE_ENABLED else None
+    sessions = open_session_store()
+
+    pipeline = ChatPipeline(
+        safety_guard=components["safety_guard"],
+        sentiment_engine=components["sentiment_engine"],
+        intent_engine=components["intent_engine"],
+        rag_system=components["rag_system"],
+        bot_voice=components["bot_voice"],
+        validator=components["validator"],
+        logger=components["logger"],
+        variant=variant,
+        response_cache=response_cache,
+        stage_cache=stage_cache,
+        sessions=sessions
+    )
+    pipeline.boot_report = loader.report
+
+    # Scraped alongside the span histograms on GET /metrics
+    tracer.register_gauge("chatbot_process_rss_megabytes", current_rss_mb, "Resident memory of this process.")
+    tracer.register_gauge("chatbot_process_pss_megabytes", proportional_rss_mb,
+                          "This process's share of resident memory; pages shared with forked siblings count once in total.")
+    if response_cache is not None:
+        tracer.register_gauge("chatbot_response_cache_hit_ratio", lambda: response_cache.hit_rate,
+                              "Share of generation-eligible turns answered from the response cache.")
+    if stage_cache is not None:
+        tracer.register_gauge("chatbot_stage_cache_hit_ratio", lambda: stage_cache.hit_rate,
+                              "Share of stage calls (all stages) answered from the stage cache.")
+    tracer.register_gauge("chatbot_session_history_bytes", lambda: sessions.bytes,
+                          "Serialized conversation history held by the session store.")
+    return pipeline
@@ -1,44 +1,151 @@
-import joblib
+import csv
+import itertools
 import os
+
+import joblib
+import numpy as np
 import re
 
-class SentimentEngine:
+from config import settings
+from src.components.compiled_scorer import compile_classifier, verify_compiled
+from src.utils.model_bundle import load_bundle
+from src.utils.tracing import tracer
+
+def load_classifier(bundle_name, legacy_paths):
+    """
+    Returns (model, vectorizer, label_encoder, scorer, version) from the released model bundle, or
+    from the three separate pickles older training runs wrote when no bundle exists yet.
+    scorer is the compiled equivalent of the other three, or None when it is disabled, the
+    model can't be compiled, or the compiled labels differ from scikit-learn's (predictions
+    then go through scikit-learn).
+    """
+    try:
+        parts, manifest = load_bundle(bundle_name)
+        model, vectorizer, label_encoder, version = parts["model"], parts["vectorizer"], parts["label_encoder"], manifest["version"]
+        scorer = parts.get("scorer")
+    except FileNotFoundError:
+        model_path, vectorizer_path, label_path = legacy_paths
+        model, vectorizer, label_encoder, version = joblib.load(model_path), joblib.load(vectorizer_path), joblib.load(label_path), "legacy"
+        scorer = None
+
+    if not settings.CLASSIFIER_COMPILED_SCORER:
+        scorer = None
+    elif scorer is None:
+        # Released before scorers were compiled (and verified) at training time. Compiling takes
+        # milliseconds; the result is only used once it matches scikit-learn on a sample.
+        try:
+            scorer = compile_classifier(vectorizer, model, label_encoder)
+            verify_compiled(scorer, vectorizer, model, label_encoder, _verification_texts(bundle_name, vectorizer))
+        except ValueError as e:
+            print(f"Warning: {bundle_name} model can't be compiled ({e}). Using scikit-learn for predictions.")
+            scorer = None
+    return model, vectorizer, label_encoder, scorer, version
+
+def _verification_texts(bundle_name, vectorizer):
+    """
+    Cleaned messages from the start of the model's training data (when it is on disk) plus
+    every vocabulary term on its own, so each feature column is exercised at least once.
+    """
+    texts = list(vectorizer.vocabulary_)
+    path = settings.CLASSIFIER_TRAINING_DATA.get(bundle_name)
+    if path and os.path.exists(path):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = itertools.islice(csv.DictReader(f), settings.CLASSIFIER_VERIFY_SAMPLE)
+            texts += clean_texts(row.get("text") or row.get("clean_text") or "" for row in rows)
+    return texts
+
+_NON_LETTERS = re.compile(r'[^a-zA-Z\s]')
+
+def clean_text(text):
+    """The preprocessing both classifiers were trained on: letters and whitespace only, lowercased."""
+    return _NON_LETTERS.sub('', text).lower().strip()
+
+def clean_texts(texts):
+    """clean_text() for many messages. Clean once and pass cleaned=True to feed several engines."""
+    return [clean_text(str(text)) for text in texts]
+
+class TextClassifier:
+    """
+    Batch scoring shared by the TF-IDF engines (subclasses load model, vectorizer and
+    label_encoder). The whole batch becomes one sparse matrix and one call into the model,
+    instead of a transform and a predict per message.
+    """
+    span_name = "classifier"
+
+    @property
+    def classes(self):
+        """Labels in the column order of predict_proba_batch()."""
+        return [str(label) for label in self.label_encoder.inverse_transform(self.model.classes_)]
+
+    def predict_proba_batch(self, texts, cleaned=False):
+        """(n_messages, n_classes) class probabilities; columns follow self.classes."""
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, len(self.classes)))
+        with tracer.span(f"{self.span_name}.predict_batch"):
+            features = self.vectorizer.transform(texts if cleaned else clean_texts(texts))
+            return self.model.predict_proba(features)
+
+    def predict_batch(self, texts, cleaned=False):
+        """Labels for many messages, in order."""
+        return [label for label, _ in self.predict_batch_with_confidence(texts, cleaned)]
+
+    def predict_batch_with_confidence(self, texts, cleaned=False):
+        """[(label, probability of that label), ...] for many messages, in order."""
+        probabilities = self.predict_proba_batch(texts, cleaned)
+        classes = self.classes
+        best = probabilities.argmax(axis=1) if len(probabilities) else []
+        return [(classes[i], float(row[i])) for i, row in zip(best, probabilities)]
+
+class SentimentEngine(TextClassifier):
+    span_name = "sentiment"
+
     def __init__(self):
-        # Dynamic path finding: Go up two levels from this file to find 'artifacts'
-        base_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        self.artifacts_dir = os.path.join(base_path, 'artifacts')
-        
         try:
-            self.model = joblib.load(os.path.join(self.artifacts_dir, 'sentiment_xgboost.pkl'))
-            self.vectorizer = joblib.load(os.path.join(self.artifacts_dir, 'tfidf_vectorizer.pkl'))
-            self.label_encoder = joblib.load(os.path.join(self.artifacts_dir, 'label_encoder.pkl'))
+            self.model, self.vectorizer, self.label_encoder, self.scorer, self.version = load_classifier(
+                "sentiment",
+                (settings.SENTIMENT_MODEL_PATH, settings.SENTIMENT_VECTORIZER_PATH, settings.SENTIMENT_LABEL_PATH)
+            )
         except FileNotFoundError:
-            raise FileNotFoundError(f"Could not find Sentiment artifacts in {self.artifacts_dir}. Did you run the training script?")
+            raise FileNotFoundError(f"Could not find Sentiment artifacts in {settings.ARTIFACTS_DIR}. Did you run the training script?")
 
     def predict(self, text):
+        with tracer.span("sentiment.predict"):
+            return self._predict(text)
+
+    def _predict(self, text):
         # 1. Clean
-        clean_text = re.sub(r'[^a-zA-Z\s]', '', text).lower().strip()
+        cleaned = clean_text(text)
+        if self.scorer is not None:
+            # Vectorize, predict and decode in one compiled lookup
+            return self.scorer.predict([cleaned])[0]
         # 2. Vectorize
-        vectorized_text = self.vectorizer.transform([clean_text])
+        vectorized_text = self.vectorizer.transform([cleaned])
         # 3. Predict
         pred_idx = self.model.predict(vectorized_text)[0]
         # 4. Decode
         return self.label_encoder.inverse_transform([pred_idx])[0]
 
-class IntentEngine:
+class IntentEngine(TextClassifier):
+    span_name = "intent"
+
     def __init__(self):
-        base_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        self.artifacts_dir = os.path.join(base_path, 'artifacts')
-        
         try:
-            self.model = joblib.load(os.path.join(self.artifacts_dir, 'intent_logistic_regression.pkl'))
-            self.vectorizer = joblib.load(os.path.join(self.artifacts_dir, 'intent_vectorizer.pkl'))
-            self.label_encoder = joblib.load(os.path.join(self.artifacts_dir, 'intent_label_encoder.pkl'))
+            self.model, self.vectorizer, self.label_encoder, self.scorer, self.version = load_classifier(
+                "intent",
+                (settings.INTENT_MODEL_PATH, settings.INTENT_VECTORIZER_PATH, settings.INTENT_LABEL_PATH)
+            )
         except FileNotFoundError:
             raise FileNotFoundError("Could not find Intent artifacts. Did you run the training script?")
 
     def predict(self, text):
-        clean_text = re.sub(r'[^a-zA-Z\s]', '', text).lower().strip()
-        vectorized_text = self.vectorizer.transform([clean_text])
+        with tracer.span("intent.predict"):
+            return self._predict(text)
+
+    def _predict(self, text):
+        cleaned = clean_text(text)
+        if self.scorer is not None:
+            return self.scorer.predict([cleaned])[0]
+        vectorized_text = self.vectorizer.transform([cleaned])
         pred_idx = self.model.predict(vectorized_text)[0]
         return self.label_encoder.inverse_transform([pred_idx])[0]
\ No newline at end of file
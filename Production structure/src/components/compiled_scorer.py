@@ -0,0 +1,221 @@
+import json
+import math
+import re
+
+import numpy as np
+
+
+class CompiledTfidf:
+    """
+    TfidfVectorizer.transform() for the configurations the training scripts use, as a plain
+    token -> (column, idf) lookup. Produces the same columns and values as scikit-learn
+    (lowercase, token_pattern, stop words, word n-grams, sublinear tf, l1/l2 norm) without
+    building a scipy matrix per call.
+    """
+    def __init__(self, vectorizer):
+        if vectorizer.analyzer != "word" or vectorizer.tokenizer is not None or vectorizer.preprocessor is not None:
+            raise ValueError("Only word analyzers with the default tokenizer and preprocessor can be compiled")
+        if vectorizer.strip_accents is not None:
+            raise ValueError("strip_accents is not supported by the compiled vectorizer")
+        if vectorizer.norm not in ("l1", "l2", None):
+            raise ValueError(f"Unsupported norm {vectorizer.norm!r}")
+
+        idf = vectorizer.idf_ if vectorizer.use_idf else np.ones(len(vectorizer.vocabulary_))
+        self.terms = {term: (int(column), float(idf[column])) for term, column in vectorizer.vocabulary_.items()}
+        self.n_features = len(vectorizer.vocabulary_)
+        self.token_pattern = re.compile(vectorizer.token_pattern)
+        self.lowercase = vectorizer.lowercase
+        self.stop_words = frozenset(vectorizer.get_stop_words() or ())
+        self.ngram_range = tuple(vectorizer.ngram_range)
+        self.sublinear_tf = vectorizer.sublinear_tf
+        self.binary = vectorizer.binary
+        self.norm = vectorizer.norm
+
+    def _terms(self, text):
+        tokens = self.token_pattern.findall(text.lower() if self.lowercase else text)
+        if self.stop_words:
+            tokens = [token for token in tokens if token not in self.stop_words]
+        min_n, max_n = self.ngram_range
+        if max_n == 1:
+            return tokens
+        terms = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n, len(tokens)) + 1):
+            terms += [" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
+        return terms
+
+    def transform_one(self, text):
+        """(columns, values) of one document's row, columns ascending like scikit-learn's CSR output."""
+        counts = {}
+        for term in self._terms(text):
+            entry = self.terms.get(term)
+            if entry is not None:
+                counts[entry] = counts.get(entry, 0) + 1
+        if not counts:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+
+        entries = sorted(counts)
+        columns = np.fromiter((column for column, _ in entries), dtype=np.intp, count=len(entries))
+        values = np.empty(len(entries))
+        for i, entry in enumerate(entries):
+            tf = 1 if self.binary else counts[entry]
+            if self.sublinear_tf:
+                tf = 1 + math.log(tf)
+            values[i] = tf * entry[1]
+        if self.norm == "l2":
+            values /= math.sqrt(float(values @ values))
+        elif self.norm == "l1":
+            values /= np.abs(values).sum()
+        return columns, values
+
+
+class LinearScorer:
+    """Decision function of a fitted linear model (e.g. LogisticRegression) as dense weights."""
+    def __init__(self, model):
+        # (n_features, n_outputs), so one row's score is a sum over its non-zero columns
+        self.weights = np.ascontiguousarray(model.coef_.T, dtype=np.float64)
+        self.intercept = np.asarray(model.intercept_, dtype=np.float64)
+        self.binary = self.weights.shape[1] == 1
+
+    def predict(self, rows, n_features):
+        scores = np.empty((len(rows), self.weights.shape[1]))
+        for i, (columns, values) in enumerate(rows):
+            scores[i] = values @ self.weights[columns] + self.intercept
+        if self.binary:
+            return (scores[:, 0] > 0).astype(np.intp)
+        return scores.argmax(axis=1)
+
+
+class TreeEnsembleScorer:
+    """
+    A multi-class XGBoost gbtree ensemble flattened into node arrays and walked in NumPy,
+    every tree of every row one level per step. Features are compared in float32 and absent
+    (sparse) features take each node's default branch, exactly as XGBoost does; margins are
+    accumulated tree by tree from the base score in float32 and the argmax is the class.
+    """
+    def __init__(self, model):
+        booster = model.get_booster()
+        learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+        objective = learner["objective"]["name"]
+        if objective not in ("multi:softmax", "multi:softprob"):
+            raise ValueError(f"Unsupported XGBoost objective {objective!r}")
+        if learner["gradient_booster"]["name"] != "gbtree":
+            raise ValueError("Only gbtree boosters can be compiled")
+
+        params = learner["learner_model_param"]
+        self.n_classes = int(params["num_class"])
+        base_score = json.loads(params["base_score"])
+        self.base_score = np.broadcast_to(np.asarray(base_score, dtype=np.float32), (self.n_classes,)).copy()
+
+        trees_model = learner["gradient_booster"]["model"]
+        trees = trees_model["trees"]
+        tree_class = trees_model["tree_info"]
+        try:
+            # Set by early stopping; predict() then ignores the trees after it
+            best_iteration = model.best_iteration
+        except AttributeError:
+            best_iteration = None
+        if best_iteration is not None and trees_model.get("iteration_indptr"):
+            trees = trees[:trees_model["iteration_indptr"][best_iteration + 1]]
+            tree_class = tree_class[:len(trees)]
+
+        left, right, feature, threshold, default_left, roots, depth = [], [], [], [], [], [], 0
+        for tree in trees:
+            if any(tree["split_type"]):
+                raise ValueError("Categorical splits can't be compiled")
+            offset = len(left)
+            roots.append(offset)
+            left += [child + offset if child >= 0 else -1 for child in tree["left_children"]]
+            right += [child + offset if child >= 0 else -1 for child in tree["right_children"]]
+            feature += tree["split_indices"]
+            # For leaves, split_conditions holds the leaf value
+            threshold += tree["split_conditions"]
+            default_left += tree["default_left"]
+            depth = max(depth, _tree_depth(tree["left_children"], tree["right_children"]))
+
+        self.left = np.asarray(left, dtype=np.intp)
+        self.right = np.asarray(right, dtype=np.intp)
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.depth = depth
+        # Tree indices per class, in boosting order
+        self.class_trees = [np.flatnonzero(np.asarray(tree_class) == c) for c in range(self.n_classes)]
+
+    def predict(self, rows, n_features):
+        dense = np.full((len(rows), n_features), np.nan, dtype=np.float32)
+        for i, (columns, values) in enumerate(rows):
+            dense[i, columns] = values
+
+        nodes = np.tile(self.roots, (len(rows), 1))
+        row_index = np.arange(len(rows))[:, None]
+        for _ in range(self.depth):
+            left = self.left[nodes]
+            value = dense[row_index, self.feature[nodes]]
+            go_left = np.where(np.isnan(value), self.default_left[nodes], value < self.threshold[nodes])
+            nodes = np.where(left < 0, nodes, np.where(go_left, left, self.right[nodes]))
+
+        leaves = self.threshold[nodes]
+        margins = np.empty((len(rows), self.n_classes), dtype=np.float32)
+        for c, tree_ids in enumerate(self.class_trees):
+            # cumsum adds left to right, the same order (and float32 rounding) as XGBoost
+            column = np.concatenate([np.full((len(rows), 1), self.base_score[c], dtype=np.float32), leaves[:, tree_ids]], axis=1)
+            margins[:, c] = np.cumsum(column, axis=1, dtype=np.float32)[:, -1]
+        return margins.argmax(axis=1)
+
+
+def _tree_depth(left_children, right_children):
+    depth, level = 0, [0]
+    while level:
+        level = [child for node in level for child in (left_children[node], right_children[node]) if child >= 0]
+        depth += 1 if level else 0
+    return depth
+
+
+class CompiledClassifier:
+    """
+    Vectorizer + model + label encoder as one scorer that returns labels directly.
+    Built by compile_classifier() when a model is released and stored in its bundle.
+    """
+    def __init__(self, tfidf, scorer, labels):
+        self.tfidf = tfidf
+        self.scorer = scorer
+        self.labels = labels
+
+    def predict(self, texts):
+        """Labels for already-cleaned texts, in order."""
+        rows = [self.tfidf.transform_one(text) for text in texts]
+        return [self.labels[i] for i in self.scorer.predict(rows, self.tfidf.n_features)]
+
+
+def compile_classifier(vectorizer, model, label_encoder):
+    """
+    A CompiledClassifier equivalent to label_encoder.inverse_transform(model.predict(vectorizer.transform(texts))).
+    Raises ValueError for a vectorizer or model it can't reproduce exactly.
+    """
+    if hasattr(model, "get_booster"):
+        scorer = TreeEnsembleScorer(model)
+        class_ids = np.arange(scorer.n_classes)
+    elif hasattr(model, "coef_"):
+        scorer = LinearScorer(model)
+        class_ids = model.classes_
+    else:
+        raise ValueError(f"Can't compile a {type(model).__name__}")
+    labels = [label.item() if hasattr(label, "item") else label for label in label_encoder.inverse_transform(class_ids)]
+    return CompiledClassifier(CompiledTfidf(vectorizer), scorer, labels)
+
+
+def verify_compiled(compiled, vectorizer, model, label_encoder, texts):
+    """
+    Raises ValueError unless compiled labels every text exactly as the fitted vectorizer, model
+    and label encoder do. Run before a compiled scorer is released, so a library change that
+    alters tokenization or tree layout fails the release instead of changing production labels.
+    """
+    expected = label_encoder.inverse_transform(model.predict(vectorizer.transform(texts))).tolist()
+    actual = compiled.predict(texts)
+    mismatches = [i for i, (label, reference) in enumerate(zip(actual, expected)) if label != reference]
+    if mismatches:
+        examples = "; ".join(f"{texts[i]!r}: {actual[i]!r} instead of {expected[i]!r}" for i in mismatches[:3])
+        raise ValueError(
+            f"Compiled scorer disagrees with the model on {len(mismatches)} of {len(texts)} texts ({examples})"
+        )
@@ -0,0 +1,105 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from config import settings
+from src.utils.batching import MicroBatcher
+from src.utils.tracing import tracer
+
+class EmbeddingService:
+    """
+    The one all-MiniLM-L6-v2 instance in the process, shared by KnowledgeBase and QualityValidator.
+
+    - Encodes are micro-batched across threads, so concurrent turns share forward passes.
+    - Results are kept in an LRU cache keyed by a hash of the text.
+    - Embeddings that already exist elsewhere (e.g. chunk vectors stored in Chroma) can be
+      primed into the cache so they are never re-encoded.
+    """
+    def __init__(self, model_name=settings.EMBEDDING_MODEL_NAME, cache_size=settings.EMBEDDING_CACHE_SIZE):
+        # Deferred: sentence_transformers pulls in torch
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.cache_size = cache_size
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.batcher = MicroBatcher(
+            self._encode_batch,
+            max_batch_size=settings.EMBEDDING_BATCH_SIZE,
+            max_wait_ms=settings.EMBEDDING_MAX_WAIT_MS,
+            name="embedding-batcher"
+        )
+
+    @staticmethod
+    def text_key(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def encode(self, texts):
+        """Returns a float32 array of shape (len(texts), dim). Cached texts skip the model."""
+        keys = [self.text_key(t) for t in texts]
+        vectors = [None] * len(texts)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    vectors[i] = cached
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+        # Misses go through the batcher so they share a forward pass with other threads' misses
+        pending = {i: self.batcher.submit(texts[i]) for i, v in enumerate(vectors) if v is None}
+        for i, future in pending.items():
+            vectors[i] = future.result()
+        if pending:
+            self._store((keys[i], vectors[i]) for i in pending)
+
+        return np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+    def encode_one(self, text):
+        return self.encode([text])[0]
+
+    def prime(self, texts, embeddings):
+        """Caches embeddings that were computed elsewhere, e.g. chunk vectors stored in Chroma."""
+        self._store(
+            (self.text_key(text), np.asarray(embedding, dtype=np.float32))
+            for text, embedding in zip(texts, embeddings)
+        )
+
+    def clear(self):
+        """Drops every cached embedding (benchmarks use this to measure cold encodes)."""
+        with self._lock:
+            self._cache.clear()
+
+    def _store(self, items):
+        with self._lock:
+            for key, vector in items:
+                self._cache[key] = vector
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _encode_batch(self, texts):
+        with tracer.span("embeddings.encode"):
+            vectors = self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+        return list(np.asarray(vectors, dtype=np.float32))
+
+_shared_service = None
+_shared_lock = threading.Lock()
+
+def get_embedding_service():
+    """Returns the process-wide EmbeddingService, loading the model on first use."""
+    global _shared_service
+    with _shared_lock:
+        if _shared_service is None:
+            _shared_service = EmbeddingService()
+        return _shared_service
@@ -1,27 +1,137 @@
 import os
-from transformers import pipeline
+import threading
+
+import joblib
+
+from config import settings
+from src.components.inference_backends import load_sequence_classifier
+from src.utils.batching import MicroBatcher
+from src.utils.tracing import tracer
+
+class FastToxicityTier:
+    """
+    First tier of the guardrail cascade: a hashed character n-gram logistic regression,
+    trained offline by scripts/train_toxicity_tier.py to imitate toxic-bert.
+
+    Its probability is compared against two thresholds calibrated on held-out data:
+    below clear_below the message is safe, at or above block_above it is blocked, and anything
+    in between is escalated to toxic-bert. Scoring takes microseconds, versus a full BERT pass.
+    """
+    def __init__(self, path=settings.TOXICITY_FAST_TIER_PATH):
+        bundle = joblib.load(path)
+        self.vectorizer = bundle["vectorizer"]
+        self.model = bundle["model"]
+        self.clear_below = bundle["clear_below"]
+        self.block_above = bundle["block_above"]
+
+        self._lock = threading.Lock()
+        self.counts = {"cleared": 0, "blocked": 0, "escalated": 0}
+
+    def score(self, texts):
+        """Probability that each text is toxic according to the fast model."""
+        return self.model.predict_proba(self.vectorizer.transform(texts))[:, 1]
+
+    def decide(self, texts):
+        """Returns one (is_safe, reason) per text, or None where toxic-bert has to decide."""
+        with tracer.span("toxicity.fast_tier"):
+            probabilities = self.score(texts)
+
+        verdicts = []
+        for probability in probabilities:
+            if probability < self.clear_below:
+                verdicts.append((True, "Safe"))
+                outcome = "cleared"
+            elif probability >= self.block_above:
+                verdicts.append((False, f"Blocked by fast toxicity filter ({round(float(probability), 2)})"))
+                outcome = "blocked"
+            else:
+                verdicts.append(None)
+                outcome = "escalated"
+            with self._lock:
+                self.counts[outcome] += 1
+        return verdicts
 
 class ToxicityFilter:
-    def __init__(self, threshold=0.7):
+    def __init__(self, threshold=settings.TOXICITY_THRESHOLD, batching=settings.TOXICITY_BATCHING,
+                 cascade=settings.TOXICITY_CASCADE, backend=settings.TOXICITY_BACKEND):
+        # transformers takes seconds to import, so pay for it only when a filter is built
+        from transformers import pipeline
+
         self.threshold = threshold
+        self.backend = backend
         # We load the model once when the class is initialized
-        # 'unitary/toxic-bert' is the industry standard for this
+        # 'unitary/toxic-bert' is the industry standard for this (fp32, int8 or ONNX: TOXICITY_BACKEND)
+        tokenizer, model = load_sequence_classifier(settings.TOXICITY_MODEL_NAME, backend)
         self.classifier = pipeline(
-            "text-classification", 
-            model="unitary/toxic-bert", 
-            top_k=None 
+            "text-classification",
+            model=model,
+            tokenizer=tokenizer,
+            top_k=None
         )
 
+        # Cheap first tier: only messages it is unsure about reach toxic-bert
+        self.fast_tier = None
+        if cascade:
+            if os.path.exists(settings.TOXICITY_FAST_TIER_PATH):
+                self.fast_tier = FastToxicityTier()
+            else:
+                print("Warning: Toxicity cascade enabled but no fast tier found. "
+                      "Run scripts/train_toxicity_tier.py. Using toxic-bert only.")
+
+        # Concurrent requests share padded forward passes instead of running batch size 1 each
+        self.batcher = None
+        if batching:
+            self.batcher = MicroBatcher(
+                self._classify_batch,
+                max_batch_size=settings.TOXICITY_MAX_BATCH_SIZE,
+                max_wait_ms=settings.TOXICITY_MAX_WAIT_MS,
+                name="toxicity-batcher"
+            )
+
     def check_safety(self, text):
         """
         Returns (True, "Safe") or (False, "Reason")
         """
-        results = self.classifier(text)
-        scores = results[0]
-        
+        if self.fast_tier is not None:
+            verdict = self.fast_tier.decide([text])[0]
+            if verdict is not None:
+                return verdict
+
+        if self.batcher is not None:
+            return self.batcher.process(text)
+        return self._classify_batch([text])[0]
+
+    def check_safety_batch(self, texts):
+        """
+        Checks many messages at once: the fast tier settles what it can and the rest
+        share one padded toxic-bert forward pass.
+        Returns a list of (is_safe, reason) tuples in the same order as texts.
+        """
+        texts = list(texts)
+        verdicts = self.fast_tier.decide(texts) if self.fast_tier is not None else [None] * len(texts)
+
+        uncertain = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        if uncertain:
+            for i, verdict in zip(uncertain, self._classify_batch([texts[i] for i in uncertain])):
+                verdicts[i] = verdict
+        return verdicts
+
+    def max_scores(self, texts):
+        """Highest toxic-bert category score per text (a text is blocked when this exceeds the threshold)."""
+        return [max(category['score'] for category in scores) for scores in self._bert_scores(texts)]
+
+    def _classify_batch(self, texts):
+        return [self._verdict(scores) for scores in self._bert_scores(texts)]
+
+    def _bert_scores(self, texts):
+        texts = list(texts)
+        with tracer.span("toxicity.bert"):
+            return self.classifier(texts, batch_size=len(texts), truncation=True)
+
+    def _verdict(self, scores):
         for category in scores:
             if category['score'] > self.threshold:
                 reason = f"Blocked due to {category['label']} ({round(category['score'], 2)})"
                 return False, reason
-        
-        return True, "Safe"
\ No newline at end of file
+
+        return True, "Safe"
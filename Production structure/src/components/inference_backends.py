@@ -0,0 +1,96 @@
+import json
+import os
+
+from config import settings
+
+BACKENDS = ("torch", "torch_int8", "onnx")
+MANIFEST_FILE = "manifest.json"
+INT8_MODEL_FILE = "model.pt"
+
+
+def converted_path(component, backend):
+    """Directory holding the converted model for a component ("llm" or "toxicity")."""
+    return os.path.join(settings.INFERENCE_MODELS_DIR, f"{component}-{backend}")
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def quantize_dynamic(model):
+    """int8 weights for every Linear layer; activations are quantized on the fly, so no calibration data is needed."""
+    import torch
+    return torch.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_seq2seq(model_name, backend=settings.LLM_BACKEND, directory=None):
+    """
+    (tokenizer, model) for a seq2seq LM. Every backend's model has the usual generate()
+    (streamer, stopping_criteria and generation kwargs included), so callers don't change.
+    directory overrides where a converted model is read from (default: converted_path("llm", backend)).
+    """
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+    _check_backend(backend)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    directory = directory or converted_path("llm", backend)
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        manifest = _converted_manifest(directory, backend, model_name)
+        return tokenizer, ORTModelForSeq2SeqLM.from_pretrained(directory, **manifest["load_kwargs"])
+    if backend == "torch_int8":
+        return tokenizer, _load_int8(directory, model_name, lambda: AutoModelForSeq2SeqLM.from_pretrained(model_name))
+    return tokenizer, AutoModelForSeq2SeqLM.from_pretrained(model_name)
+
+
+def load_sequence_classifier(model_name, backend=settings.TOXICITY_BACKEND, directory=None):
+    """(tokenizer, model) for a sequence classifier, ready for a transformers text-classification pipeline."""
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    _check_backend(backend)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    directory = directory or converted_path("toxicity", backend)
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        manifest = _converted_manifest(directory, backend, model_name)
+        return tokenizer, ORTModelForSequenceClassification.from_pretrained(directory, **manifest["load_kwargs"])
+    if backend == "torch_int8":
+        return tokenizer, _load_int8(
+            directory, model_name, lambda: AutoModelForSequenceClassification.from_pretrained(model_name)
+        )
+    return tokenizer, AutoModelForSequenceClassification.from_pretrained(model_name)
+
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}. Use one of {', '.join(BACKENDS)}.")
+
+
+def _converted_manifest(directory, backend, model_name):
+    try:
+        manifest = read_manifest(directory)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"No {backend} export of {model_name} in {directory}. "
+            f"Run scripts/export_inference_models.py --backend {backend}."
+        )
+    if manifest["model_name"] != model_name:
+        raise ValueError(
+            f"The export in {directory} was made from {manifest['model_name']}, not {model_name}. "
+            f"Re-run scripts/export_inference_models.py."
+        )
+    return manifest
+
+
+def _load_int8(directory, model_name, load_fp32):
+    """The exported int8 model if there is one for this model_name, else quantized now (slower start, fp32 peak RAM)."""
+    import torch
+
+    try:
+        _converted_manifest(directory, "torch_int8", model_name)
+        # A whole pickled module: the quantized layers can't be rebuilt from a plain state dict
+        return torch.load(os.path.join(directory, INT8_MODEL_FILE), weights_only=False).eval()
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Warning: {e} Quantizing the fp32 model at startup instead.")
+        return quantize_dynamic(load_fp32())
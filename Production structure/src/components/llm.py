@@ -1,41 +1,147 @@
-from transformers import pipeline, AutoTokenizer, AutoModelForSeq2SeqLM
+import time
+from threading import Event, Thread
+
+from config import settings
+from src.components.inference_backends import load_seq2seq
+from src.components.prompt_builder import PromptBuilder
+from src.utils.tracing import tracer
+
+class GenerationStream:
+    """
+    Iterator over the text pieces of one generation, yielded as soon as the model decodes them.
+    After iteration finishes, .text holds the full answer and the timing attributes are filled in.
+    stop() ends the generation after the current decoder step; iteration then finishes normally.
+    """
+    def __init__(self, streamer, generate_fn, stop_event=None, prompt_stats=None):
+        self.prompt_stats = prompt_stats or {}
+        self._streamer = streamer
+        self._generate_fn = generate_fn
+        self._stop_event = stop_event
+        self._thread = Thread(target=self._generate, daemon=True)
+        self._error = None
+        self._output_ids = None
+        self._pieces = []
+
+        self.ttft_seconds = None
+        self.total_seconds = None
+
+        self._start = time.perf_counter()
+        self._thread.start()
+
+    def _generate(self):
+        try:
+            self._output_ids = self._generate_fn(streamer=self._streamer)
+        except Exception as e:
+            # Unblock the consumer; the error is re-raised from __iter__
+            self._error = e
+            self._streamer.end()
+
+    def __iter__(self):
+        for piece in self._streamer:
+            if not piece:
+                continue
+            if self.ttft_seconds is None:
+                self.ttft_seconds = time.perf_counter() - self._start
+                tracer.record("llm.first_token", self.ttft_seconds)
+            self._pieces.append(piece)
+            yield piece
+        self._thread.join()
+        self.total_seconds = time.perf_counter() - self._start
+        tracer.record("llm.generate", self.total_seconds)
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    @property
+    def stopped(self):
+        return self._stop_event is not None and self._stop_event.is_set()
+
+    @property
+    def text(self):
+        return "".join(self._pieces).strip()
+
+    @property
+    def generated_tokens(self):
+        if self._output_ids is None:
+            return 0
+        # Decoder output starts with the pad/start token, which isn't generated
+        return max(0, self._output_ids.shape[-1] - 1)
+
+    @property
+    def tokens_per_second(self):
+        if not self.total_seconds:
+            return 0.0
+        return self.generated_tokens / self.total_seconds
 
 class ChatGenerator:
-    def __init__(self):
-        # We use the free local model
-        model_name = "google/flan-t5-large"
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
-        
-        self.pipeline = pipeline(
-            "text2text-generation",
-            model=self.model, 
-            tokenizer=self.tokenizer, 
-            max_length=256,
+    def __init__(self, backend=settings.LLM_BACKEND):
+        # We use the free local model, in full precision or converted (LLM_BACKEND).
+        # transformers + torch are imported inside the loader, only when a generator is built.
+        self.backend = backend
+        self.tokenizer, self.model = load_seq2seq(settings.LLM_MODEL_NAME, backend)
+        self.prompts = PromptBuilder(self.tokenizer)
+
+        self.generation_kwargs = dict(
+            max_length=settings.LLM_MAX_LENGTH,
             temperature=0.3,
             do_sample=True,
-            repetition_penalty=1.2
+            repetition_penalty=settings.LLM_REPETITION_PENALTY
         )
 
-    def generate_response(self, user_query, retrieved_context, sentiment, intent):
-        # Construct the prompt
-        prompt = f"""
-        You are a helpful Customer Support Agent. Follow these rules significantly:
-        1. Answer the user's question using ONLY the Context provided below.
-        2. If the Context does not contain the answer, say "I don't have that information right now."
-        3. Do not make up facts.
-        4. Be polite and concise.
-
-        Context:
-        {retrieved_context}
-        
-        User Sentiment: {sentiment}
-        User Intent: {intent}
-        
-        User Question: {user_query}
-        
-        Answer:
+    def build_prompt(self, user_query, retrieved_context, sentiment, intent, history=None):
+        """The prompt as token ids (see PromptBuilder), with its token counts in .stats."""
+        return self.prompts.build(user_query, retrieved_context, sentiment, intent, history)
+
+    def _generation_kwargs(self, max_new_tokens):
+        if max_new_tokens is None:
+            return self.generation_kwargs
+        # A tighter cap for this call only (e.g. when the turn is running out of time)
+        kwargs = {k: v for k, v in self.generation_kwargs.items() if k != "max_length"}
+        kwargs["max_new_tokens"] = max_new_tokens
+        return kwargs
+
+    def generate_response(self, user_query, retrieved_context, sentiment, intent, max_new_tokens=None, history=None):
+        prompt = self.build_prompt(user_query, retrieved_context, sentiment, intent, history)
+        with tracer.span("llm.generate"):
+            output_ids = self.model.generate(**prompt.as_tensors(), **self._generation_kwargs(max_new_tokens))
+        return self.tokenizer.decode(output_ids[0], skip_special_tokens=True)
+
+    def stream_response(self, user_query, retrieved_context, sentiment, intent, max_new_tokens=None, history=None):
+        """
+        Same answer as generate_response(), but returns a GenerationStream that yields text
+        pieces while flan-t5 is still decoding. Generation runs on a background thread.
+        max_new_tokens, if given, caps this answer below LLM_MAX_LENGTH.
+        history is the conversation so far as text (see src/utils/session_store.py).
+        The stream's prompt_stats holds the prompt's token counts.
         """
-        
-        response = self.pipeline(prompt)
-        return response[0]['generated_text']
\ No newline at end of file
+        prompt = self.build_prompt(user_query, retrieved_context, sentiment, intent, history)
+        inputs = prompt.as_tensors()
+
+        from transformers import StoppingCriteriaList, TextIteratorStreamer
+
+        generation_kwargs = self._generation_kwargs(max_new_tokens)
+        stop_event = Event()
+        return GenerationStream(
+            TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True),
+            lambda streamer: self.model.generate(
+                **inputs, streamer=streamer,
+                stopping_criteria=StoppingCriteriaList([_stop_on(stop_event)]),
+                **generation_kwargs
+            ),
+            stop_event,
+            prompt_stats=prompt.stats
+        )
+
+def _stop_on(event):
+    """A transformers StoppingCriteria that ends generation once event is set (checked every decoder step)."""
+    import torch
+    from transformers import StoppingCriteria
+
+    class StopOnEvent(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    return StopOnEvent()
@@ -0,0 +1,127 @@
+import re
+import threading
+from collections import OrderedDict
+
+from config import settings
+from src.utils.tracing import tracer
+
+# The support-agent instructions, without the indentation a triple-quoted string would carry
+# (the encoder reads every one of those spaces)
+INSTRUCTIONS = (
+    "You are a helpful Customer Support Agent. Follow these rules significantly:\n"
+    "1. Answer the user's question using ONLY the Context provided below.\n"
+    "2. If the Context does not contain the answer, say \"I don't have that information right now.\"\n"
+    "3. Do not make up facts.\n"
+    "4. Be polite and concise."
+)
+HISTORY_LABEL = "Conversation so far:"
+CONTEXT_LABEL = "Context:"
+LABELS_TEMPLATE = "User Sentiment: {sentiment}\nUser Intent: {intent}\n\nUser Question:"
+ANSWER_CUE = "Answer:"
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class Prompt:
+    """One rendered prompt: its input ids plus the token counts logged with the turn."""
+    def __init__(self, input_ids, stats):
+        self.input_ids = input_ids
+        self.stats = stats
+
+    def as_tensors(self):
+        """Keyword arguments for model.generate() (a batch of one)."""
+        import torch
+        input_ids = torch.tensor([self.input_ids], dtype=torch.long)
+        return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+
+
+class PromptBuilder:
+    """
+    Builds the generator's prompt directly as token ids, with a fixed budget for each part.
+
+    - The instructions are tokenized once, when the builder is created.
+    - Retrieved context is cut to PROMPT_CONTEXT_TOKENS at sentence boundaries (a single
+      sentence longer than the budget keeps its first tokens). The same policy chunks are
+      retrieved again and again, so fitted contexts are kept in an LRU cache.
+    - The user's message keeps its first PROMPT_QUERY_TOKENS tokens.
+    - Conversation history, if any (already compacted by the session store), keeps its last
+      PROMPT_HISTORY_TOKENS tokens.
+
+    Each part is tokenized on its own and the ids are concatenated, which is how the tokenizer
+    splits the whole text anyway: every part starts on a word boundary.
+    """
+    def __init__(self, tokenizer, context_tokens=settings.PROMPT_CONTEXT_TOKENS,
+                 query_tokens=settings.PROMPT_QUERY_TOKENS, history_tokens=settings.PROMPT_HISTORY_TOKENS,
+                 cache_size=settings.PROMPT_CONTEXT_CACHE_SIZE):
+        self.tokenizer = tokenizer
+        self.context_tokens = context_tokens
+        self.query_tokens = query_tokens
+        self.history_tokens = history_tokens
+        self.cache_size = cache_size
+
+        self.instruction_ids = self._encode(INSTRUCTIONS)
+        self.history_label_ids = self._encode(HISTORY_LABEL)
+        self.context_label_ids = self._encode(CONTEXT_LABEL)
+        self.answer_cue_ids = self._encode(ANSWER_CUE)
+        self._labels = {}
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _encode(self, text):
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def build(self, user_query, retrieved_context, sentiment, intent, history=None):
+        with tracer.span("llm.tokenize"):
+            history_ids = []
+            if history and self.history_tokens:
+                history_ids = self.history_label_ids + self._encode(history)[-self.history_tokens:]
+            context_ids, dropped = self._fit_context(retrieved_context)
+            label_ids = self._label_ids(sentiment, intent)
+            query_ids = self._encode(user_query)[:self.query_tokens]
+
+            input_ids = self.tokenizer.build_inputs_with_special_tokens(
+                self.instruction_ids + history_ids + self.context_label_ids + context_ids
+                + label_ids + query_ids + self.answer_cue_ids
+            )
+        return Prompt(input_ids, {
+            "prompt_tokens": len(input_ids),
+            "history_tokens": len(history_ids),
+            "context_tokens": len(context_ids),
+            "context_sentences_dropped": dropped,
+            "query_tokens": len(query_ids),
+        })
+
+    def _label_ids(self, sentiment, intent):
+        # A handful of combinations, so kept without a bound
+        key = (sentiment, intent)
+        ids = self._labels.get(key)
+        if ids is None:
+            ids = self._labels[key] = self._encode(LABELS_TEMPLATE.format(sentiment=sentiment, intent=intent))
+        return ids
+
+    def _fit_context(self, context):
+        """(token ids, sentences dropped) of the context, within the token budget."""
+        with self._lock:
+            fitted = self._contexts.get(context)
+            if fitted is not None:
+                self._contexts.move_to_end(context)
+                return fitted
+
+        sentences = [s for s in _SENTENCE_END.split(context.strip()) if s]
+        sentence_ids = self.tokenizer(sentences, add_special_tokens=False)["input_ids"] if sentences else []
+        ids, kept = [], 0
+        for token_ids in sentence_ids:
+            if len(ids) + len(token_ids) > self.context_tokens:
+                if not kept:
+                    # One oversized sentence: better its start than no context at all
+                    ids, kept = token_ids[:self.context_tokens], 1
+                break
+            ids += token_ids
+            kept += 1
+        fitted = (ids, len(sentences) - kept)
+
+        with self._lock:
+            self._contexts[context] = fitted
+            if len(self._contexts) > self.cache_size:
+                self._contexts.popitem(last=False)
+        return fitted
@@ -1,41 +1,158 @@
-import chromadb
-from chromadb.utils import embedding_functions
 import os
+import threading
+import time
+
+from config import settings
+from src.components.embeddings import get_embedding_service
+from src.components.vector_index import VectorIndex
+from src.utils.response_cache import read_index_version
+from src.utils.system import reinit_after_fork
+from src.utils.tracing import tracer
+
+NO_POLICY_FOUND = "No specific policy found for this issue."
+
+def category_for_intent(intent):
+    """The chunk category a predicted intent is restricted to, or None to search everything."""
+    return settings.RAG_INTENT_CATEGORIES.get(intent) if intent else None
 
 class KnowledgeBase:
-    def __init__(self):
+    def __init__(self, backend=settings.RAG_BACKEND):
+        # Same MiniLM model used during ingestion, shared with the QualityValidator.
+        # We embed queries ourselves, so Chroma never loads its own copy of the model.
+        self.embedder = get_embedding_service()
+        self.backend = backend
+        self.client = None
+        self.collection = None
+        self.index = None
+
+        if backend == "numpy":
+            self._index_lock = threading.Lock()
+            self.index = self._load_index()
+            self._index_checked_at = time.monotonic()
+        else:
+            self._open_collection()
+        # Registered for both backends: the numpy one also opens Chroma, to re-export a stale index
+        reinit_after_fork(self, "_reopen_collection")
+
+        # The pipeline only waits for the intent before retrieving when it is actually used
+        self.filters_by_intent = self.index is not None and settings.RAG_INTENT_FILTER
+
+    def _open_collection(self):
         # Path to the persistent database
         base_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
         db_path = os.path.join(base_path, 'artifacts', 'chroma_db_data')
-        
+
+        # chromadb is slow to import; defer it until the collection is actually needed
+        import chromadb
+
         self.client = chromadb.PersistentClient(path=db_path)
-        
-        # Using the same embedding function used during ingestion
-        self.ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
-        
+
         # Get the collection. We assume it was created by your build_rag_db.py script.
         try:
-            self.collection = self.client.get_collection(
-                name="company_knowledge_base",
-                embedding_function=self.ef
-            )
+            self.collection = self.client.get_collection(name=settings.CHROMA_COLLECTION_NAME)
         except Exception:
             # Fallback if collection doesn't exist yet
             print("Warning: Knowledge Base not found. Creating empty one.")
-            self.collection = self.client.create_collection(
-                name="company_knowledge_base",
-                embedding_function=self.ef
-            )
+            self.collection = self.client.create_collection(name=settings.CHROMA_COLLECTION_NAME)
 
-    def search(self, query, n_results=1):
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results
-        )
-        
-        if results['documents'] and results['documents'][0]:
-            return results['documents'][0][0]
+    def _reopen_collection(self):
+        # Chroma's SQLite connection must not cross fork. PersistentClient caches one system per
+        # path, so that cache is dropped first or the child would get the parent's connection back.
+        if self.client is None:
+            return
+        from chromadb.api.client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+        if self.index is not None:
+            # The numpy backend only needs Chroma for a re-export; _load_index() reopens it then
+            self.client = self.collection = None
         else:
-            return "No specific policy found for this issue."
\ No newline at end of file
+            self._open_collection()
+
+    def _load_index(self):
+        """The exported vector index if it matches the current knowledge base, else a fresh export from Chroma."""
+        version = read_index_version()
+        try:
+            index = VectorIndex.load(settings.RAG_VECTOR_INDEX_PATH, mmap=settings.RAG_VECTOR_INDEX_MMAP)
+            if index.version == version:
+                return index
+            print("Vector index is older than the knowledge base. Re-exporting it from Chroma...")
+        except FileNotFoundError:
+            print("No vector index found. Exporting it from Chroma...")
+
+        if self.collection is None:
+            self._open_collection()
+        VectorIndex.from_collection(self.collection, version=version).save(settings.RAG_VECTOR_INDEX_PATH)
+        return VectorIndex.load(settings.RAG_VECTOR_INDEX_PATH, mmap=settings.RAG_VECTOR_INDEX_MMAP)
+
+    def _current_index(self):
+        """Swaps in a re-exported index after build_rag_db.py has rebuilt the knowledge base."""
+        now = time.monotonic()
+        if now - self._index_checked_at >= settings.RAG_VECTOR_INDEX_CHECK_SECONDS:
+            with self._index_lock:
+                if now - self._index_checked_at >= settings.RAG_VECTOR_INDEX_CHECK_SECONDS:
+                    self._index_checked_at = now
+                    if read_index_version() != self.index.version:
+                        print("Knowledge base rebuilt. Reloading vector index.")
+                        self.index = self._load_index()
+        return self.index
+
+    def search(self, query, n_results=1):
+        return self.retrieve(query, n_results)["text"]
+
+    def retrieve(self, query, n_results=1, intent=None):
+        """
+        Like search(), but returns the top chunk with its id and category:
+        {"id": ..., "text": ..., "category": ...}. id is None when nothing matched.
+        With the numpy backend, intent restricts the search to its category (RAG_INTENT_CATEGORIES).
+        """
+        return self.search_batch([query], n_results, [intent])[0]
+
+    def search_batch(self, queries, n_results=1, intents=None):
+        """
+        retrieve() for many queries at once: one batched encode and, with the numpy backend,
+        one matrix product per category. Returns one result dict per query, in order.
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        intents = list(intents) if intents is not None else [None] * len(queries)
+
+        with tracer.span("rag.embed_query"):
+            query_embeddings = self.embedder.encode(queries)
+
+        if self.index is not None:
+            return self._search_index(query_embeddings, n_results, intents)
+
+        with tracer.span("rag.chroma_query"):
+            results = self.collection.query(
+                query_embeddings=query_embeddings.tolist(),
+                n_results=n_results,
+                include=["documents", "embeddings", "metadatas"]
+            )
+
+        matches = []
+        for i in range(len(queries)):
+            if results['documents'] and results['documents'][i]:
+                document = results['documents'][i][0]
+                # The chunk was embedded when the index was built; hand that vector to the shared
+                # cache so validating the answer against this context doesn't re-encode it
+                if results.get('embeddings') is not None and len(results['embeddings'][i]):
+                    self.embedder.prime([document], [results['embeddings'][i][0]])
+                metadata = (results.get('metadatas') or [[None]] * len(queries))[i][0] or {}
+                matches.append({"id": results['ids'][i][0], "text": document, "category": metadata.get("category")})
+            else:
+                matches.append({"id": None, "text": NO_POLICY_FOUND, "category": None})
+        return matches
+
+    def _search_index(self, query_embeddings, n_results, intents):
+        index = self._current_index()
+        categories = [category_for_intent(intent) if self.filters_by_intent else None for intent in intents]
+        matches = []
+        for hits in index.search_batch(query_embeddings, n_results, categories):
+            if not hits:
+                matches.append({"id": None, "text": NO_POLICY_FOUND, "category": None})
+                continue
+            row = hits[0][0]
+            self.embedder.prime([index.texts[row]], [index.vectors[row]])
+            matches.append({"id": index.ids[row], "text": index.texts[row], "category": index.categories[row]})
+        return matches
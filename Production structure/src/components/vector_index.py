@@ -0,0 +1,166 @@
+import json
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+
+from src.utils.tracing import tracer
+
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.json"
+CURRENT_FILE = "CURRENT"
+KEEP_VERSIONS = 2  # The live export plus the one before it, which a process may still have mapped
+
+
+class VectorIndex:
+    """
+    Exact cosine search over the knowledge base, held as one contiguous float32 matrix.
+
+    Rows are L2-normalized at build time, so a query is one matrix-vector product plus a
+    partial sort. Rows are also grouped by category, which makes every category a contiguous
+    slice of the matrix: a category-restricted search is the same product over a view, with
+    no copying or masking. Saved as a plain .npy file, so it can be memory-mapped and shared
+    read-only between processes.
+
+    Each save() writes a new export directory (vectors + meta) and then repoints CURRENT at it,
+    the same way model bundles are released, so a reader never pairs new vectors with old ids.
+    """
+    def __init__(self, vectors, ids, texts, categories, version=None):
+        order = np.argsort(np.asarray(categories, dtype=object).astype(str), kind="stable")
+        self.vectors = np.ascontiguousarray(vectors[order], dtype=np.float32)
+        self.ids = [ids[i] for i in order]
+        self.texts = [texts[i] for i in order]
+        self.categories = [categories[i] for i in order]
+        self.version = version
+        self._build_slices()
+
+    @classmethod
+    def _from_sorted(cls, vectors, ids, texts, categories, version):
+        index = cls.__new__(cls)
+        index.vectors, index.ids, index.texts = vectors, ids, texts
+        index.categories, index.version = categories, version
+        index._build_slices()
+        return index
+
+    @classmethod
+    def from_collection(cls, collection, version=None, page_size=5000):
+        """Reads every chunk (with its stored embedding) out of a Chroma collection."""
+        ids, texts, categories, vectors = [], [], [], []
+        offset = 0
+        while True:
+            page = collection.get(
+                include=["documents", "embeddings", "metadatas"], limit=page_size, offset=offset
+            )
+            if not page["ids"]:
+                break
+            ids += page["ids"]
+            texts += page["documents"]
+            categories += [(m or {}).get("category") for m in page["metadatas"]]
+            vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+            offset += len(page["ids"])
+
+        matrix = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+        if len(matrix):
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms == 0, 1.0, norms)
+        return cls(matrix, ids, texts, categories, version)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Loads the live index written by save(). With mmap the matrix stays on disk and pages in
+        on demand. Raises FileNotFoundError when nothing has been saved (or only an old,
+        unversioned export exists).
+        """
+        with open(os.path.join(directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+            export_dir = os.path.join(directory, f.read().strip())
+        vectors = np.load(os.path.join(export_dir, VECTORS_FILE), mmap_mode="r" if mmap else None)
+        with open(os.path.join(export_dir, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls._from_sorted(vectors, meta["ids"], meta["texts"], meta["categories"], meta.get("version"))
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        staging = os.path.join(directory, f".staging-{os.getpid()}")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        with open(os.path.join(staging, VECTORS_FILE), "wb") as f:
+            np.save(f, self.vectors)
+        with open(os.path.join(staging, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "texts": self.texts, "categories": self.categories,
+                       "version": self.version}, f)
+        export = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        os.replace(staging, os.path.join(directory, export))
+
+        # Flip the pointer last (atomic rename): readers see the old export or the new one, never a mix
+        pointer_tmp = os.path.join(directory, CURRENT_FILE + ".tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            f.write(export)
+        os.replace(pointer_tmp, os.path.join(directory, CURRENT_FILE))
+        _prune(directory, KEEP_VERSIONS)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query_vector, k=1, category=None):
+        """Top-k rows for one query: [(row, score), ...], best first."""
+        return self.search_batch(np.asarray(query_vector, dtype=np.float32)[None, :], k, [category])[0]
+
+    def search_batch(self, query_vectors, k=1, categories=None):
+        """
+        Top-k rows for many queries at once. categories, if given, holds one category (or None
+        for the whole index) per query; queries sharing a category share one matrix product.
+        A category with no chunks falls back to the whole index.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1.0, norms)
+        categories = categories if categories is not None else [None] * len(queries)
+
+        groups = {}
+        for i, category in enumerate(categories):
+            span = self._slices.get(category, (0, len(self.ids))) if category is not None else (0, len(self.ids))
+            groups.setdefault(span, []).append(i)
+
+        results = [[] for _ in range(len(queries))]
+        with tracer.span("rag.vector_search"):
+            for (start, stop), rows in groups.items():
+                if stop <= start:
+                    continue
+                scores = queries[rows] @ self.vectors[start:stop].T
+                for row_scores, i in zip(scores, rows):
+                    results[i] = [(start + int(j), float(row_scores[j])) for j in _top_k(row_scores, k)]
+        return results
+
+    def _build_slices(self):
+        """category -> (start, stop) row range; relies on rows being grouped by category."""
+        self._slices = {}
+        for row, category in enumerate(self.categories):
+            start, _ = self._slices.get(category, (row, row))
+            self._slices[category] = (start, row + 1)
+
+
+def _prune(directory, keep):
+    # Unversioned files from before exports had their own directories
+    for name in (VECTORS_FILE, META_FILE):
+        if os.path.exists(os.path.join(directory, name)):
+            os.remove(os.path.join(directory, name))
+    exports = sorted(
+        entry for entry in os.listdir(directory)
+        if not entry.startswith(".") and os.path.isdir(os.path.join(directory, entry))
+    )
+    # A process that already mapped a removed export keeps reading it; only new loads move on
+    for export in exports[:-keep]:
+        shutil.rmtree(os.path.join(directory, export), ignore_errors=True)
+
+
+def _top_k(scores, k):
+    """Indices of the k largest scores, best first (argpartition, then sorts only those k)."""
+    k = min(k, len(scores))
+    if k == 1:
+        return [int(np.argmax(scores))]
+    if k == len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
@@ -0,0 +1,405 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import settings
+from src.utils.system import reinit_after_fork
+from src.utils.tracing import tracer
+
+FALLBACK_RESPONSE = "I'm not 100% sure about that based on our current policies. Let me connect you with a human agent to be safe."
+
+
+def _to_ms(spans):
+    return {name: round(seconds * 1000, 3) for name, seconds in spans.items()}
+
+
+class Deadline:
+    """Latency budget of one turn. start is a time.monotonic() value; it defaults to now."""
+    def __init__(self, seconds=settings.TURN_BUDGET_SECONDS, start=None):
+        self.seconds = seconds
+        self.start = time.monotonic() if start is None else start
+
+    def remaining(self):
+        """Seconds left, or infinity for an unlimited budget."""
+        if not self.seconds:
+            return float("inf")
+        return self.seconds - (time.monotonic() - self.start)
+
+
+class StageExecutor:
+    """
+    Runs independent pipeline stages on a shared thread pool and records how long each one took.
+    The models release the GIL inside their native code, so threads give real overlap here.
+    """
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or settings.PIPELINE_STAGE_THREADS
+        self._start()
+        reinit_after_fork(self, "_start")
+
+    def _start(self):
+        # A pool inherited through fork has no live threads, so forked workers need their own
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage")
+
+    def run(self, timings, name, fn, *args, **kwargs):
+        """Runs a stage on the calling thread and stores its wall time in timings[name]."""
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings[name] = time.perf_counter() - start
+            tracer.record(f"stage.{name}", timings[name])
+
+    def submit(self, timings, name, fn, *args, **kwargs):
+        """Same as run(), but on the pool. Returns a Future."""
+        # Carry the caller's context over so spans inside the stage count towards its turn
+        context = contextvars.copy_context()
+        return self.pool.submit(context.run, self.run, timings, name, fn, *args, **kwargs)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+class ChatPipeline:
+    """
+    One conversation turn: Safety -> Classification -> Retrieval -> Generation -> Validation -> Logging.
+    Shared by the REPL (src/main.py) and the HTTP service (src/server.py) so both behave identically.
+
+    Stage graph for a turn:
+        safety ----+--> sentiment --+
+                   +--> intent -----+--> generation --> validation
+        retrieval (speculative) ----+
+    Sentiment, intent and retrieval only depend on the text, so they run side by side and the
+    turn costs roughly the slowest of them instead of their sum. When the knowledge base
+    restricts its search to the predicted intent's category (rag_system.filters_by_intent),
+    retrieval runs right after intent instead; the in-memory index answers in well under a millisecond.
+
+    Every turn carries a Deadline. Before generation and before validation the pipeline
+    compares what is left of it with the recent cost of that stage (moving averages) and,
+    if it won't fit, degrades the turn instead of running late:
+        capped_generation   generate only as many tokens as the budget affords
+        policy_answer       not even that: answer with the retrieved policy text itself
+        skipped_validation  no time to validate: return the answer unscored
+    Whatever was chosen is listed under "degradation" in the turn and in the logged metrics.
+
+    With a session store (src/utils/session_store.py), each answered turn is recorded under its
+    session_id and the session's compacted history goes into the next turn's prompt.
+    """
+    def __init__(self, safety_guard, sentiment_engine, intent_engine, rag_system,
+                 bot_voice, validator, logger, variant="v1_production", executor=None,
+                 response_cache=None, stage_cache=None, sessions=None):
+        self.safety_guard = safety_guard
+        self.sentiment_engine = sentiment_engine
+        self.intent_engine = intent_engine
+        self.rag_system = rag_system
+        self.bot_voice = bot_voice
+        self.validator = validator
+        self.logger = logger
+        self.variant = variant
+        self.executor = executor or StageExecutor()
+        self.response_cache = response_cache
+        self.stage_cache = stage_cache
+        self.sessions = sessions
+        self.quality_threshold = settings.QUALITY_THRESHOLD
+        self.speculative_retrieval = settings.SPECULATIVE_RETRIEVAL
+        self._retrieval_needs_intent = None
+        # Moving averages of stage cost: "generation_per_token" and "validation", in seconds
+        self._estimates = {}
+
+    def run_turn(self, session_id, user_input, on_token=None, deadline=None):
+        """
+        Runs the full pipeline for one message and returns a dict describing the turn,
+        including per-stage wall times in seconds under "timings".
+        Every span traced during the turn is logged with it (metrics["spans_ms"]).
+
+        deadline (default: a fresh Deadline of TURN_BUDGET_SECONDS) bounds the turn; see the
+        class docstring for how it degrades. quality_score is None when validation was skipped.
+
+        on_token, if given, is called with each piece of the answer as the LLM produces it
+        (or once with the whole answer on a cache hit). Validation still runs on the completed
+        text, so a streamed answer can end up replaced by the fallback: check "fallback".
+        An answer that drifts off-context while it is written (see DriftMonitor in
+        src/utils/analytics.py) is stopped early and also replaced by the fallback
+        (metrics["generation_aborted"]).
+
+        Blocking: callers that must not stall (e.g. an event loop) should run this on an executor.
+        """
+        deadline = deadline or Deadline()
+        with tracer.collect() as spans:
+            turn = self._run_turn(session_id, user_input, on_token, spans, deadline)
+        tracer.record(f"turn.{turn['status']}", turn["latency_seconds"])
+        for degradation in turn.get("degradation", ()):
+            tracer.record(f"turn.degraded.{degradation}", turn["latency_seconds"])
+        return turn
+
+    def reject(self, session_id, user_input, reason, deadline=None):
+        """
+        Logs and returns a turn that was refused before any work started (e.g. the server's
+        queue was full). Shaped like a blocked turn, with status "rejected".
+        """
+        latency = time.monotonic() - deadline.start if deadline is not None else 0.0
+        metrics = {"degradation": ["rejected"]}
+        self.logger.log(session_id, "rejected", user_input, "N/A", "N/A", "N/A", reason, latency, 0, metrics=metrics)
+        tracer.record("turn.rejected", latency)
+        return {
+            "session_id": session_id,
+            "status": "rejected",
+            "response": "We're handling a lot of conversations right now. Please try again in a moment.",
+            "reason": reason,
+            "latency_seconds": latency,
+            "degradation": ["rejected"],
+        }
+
+    def _run_turn(self, session_id, user_input, on_token, spans, deadline):
+        start_time = time.time()
+        timings = {}
+        metrics = {}
+        degradation = []
+
+        # Retrieval does not depend on the safety verdict, so start it now and throw it away if blocked
+        retrieval_future = None
+        if self.speculative_retrieval and not self._filters_by_intent():
+            retrieval_future = self.executor.submit(
+                timings, "retrieval", self._cached, metrics, "retrieval", self.rag_system.retrieve, user_input
+            )
+
+        # Step 0: Safety Guardrail (Fail Fast)
+        is_safe, reason = self.executor.run(
+            timings, "safety", self._cached, metrics, "safety", self.safety_guard.check_safety, user_input
+        )
+        if not is_safe:
+            if retrieval_future is not None:
+                retrieval_future.cancel()
+            # Log the rejected message for auditing
+            metrics["spans_ms"] = _to_ms(tracer.snapshot(spans))
+            self.logger.log(session_id, "safety_block", user_input, "N/A", "N/A", "N/A", reason, 0, 0, metrics=metrics)
+            return {
+                "session_id": session_id,
+                "status": "blocked",
+                "response": f"I cannot respond to that. ({reason})",
+                "reason": reason,
+                "latency_seconds": time.time() - start_time,
+                "timings": dict(timings),  # Snapshot: a discarded retrieval may still finish later
+            }
+
+        # Step 1 & 2: Classification (The "Ears") and Retrieval (The "Memory"), in parallel
+        sentiment_future = self.executor.submit(
+            timings, "sentiment", self._cached, metrics, "sentiment", self.sentiment_engine.predict, user_input
+        )
+        intent_future = self.executor.submit(
+            timings, "intent", self._cached, metrics, "intent", self.intent_engine.predict, user_input
+        )
+        if retrieval_future is None and not self._filters_by_intent():
+            retrieval_future = self.executor.submit(
+                timings, "retrieval", self._cached, metrics, "retrieval", self.rag_system.retrieve, user_input
+            )
+
+        intent = intent_future.result()
+        if retrieval_future is None:
+            # Search only the policy category this intent maps to
+            retrieved = self.executor.run(
+                timings, "retrieval", self._cached, metrics, "retrieval",
+                lambda text: self.rag_system.retrieve(text, intent=intent), user_input
+            )
+        else:
+            retrieved = retrieval_future.result()
+        sentiment = sentiment_future.result()
+        retrieved_context = retrieved["text"]
+
+        # Earlier turns of this session, for the prompt
+        history = self.sessions.history(session_id) if self.sessions is not None else ""
+
+        # Step 2.5: Response Cache - a near-duplicate question about the same policy chunk
+        # was already answered and validated, so skip generation and validation entirely.
+        # Cached answers were written without any conversation around them, so a turn that
+        # has history neither reads nor fills the cache.
+        use_response_cache = self.response_cache is not None and retrieved["id"] is not None and not history
+        cached = None
+        if use_response_cache:
+            cached = self.executor.run(
+                timings, "cache_lookup", self.response_cache.lookup, intent, retrieved["id"], user_input
+            )
+            metrics["cache_hit"] = cached is not None
+            metrics["cache_hit_rate"] = round(self.response_cache.hit_rate, 4)
+
+        max_new_tokens = None if cached is not None else self._affordable_tokens(deadline)
+        if cached is not None:
+            quality_score = cached["quality_score"]
+            fallback = False
+            final_output = cached["response"]
+            metrics["ttft_seconds"] = round(time.time() - start_time, 4)
+            if on_token is not None:
+                on_token(final_output)
+        elif max_new_tokens is not None and max_new_tokens < settings.TURN_MIN_GENERATION_TOKENS:
+            # No time to generate: the retrieved policy text is the best answer we can give now
+            degradation.append("policy_answer")
+            fallback = retrieved["id"] is None
+            final_output = FALLBACK_RESPONSE if fallback else retrieved_context
+            # Never validated: logged without a score, and "policy_answer" in degradation says why
+            quality_score = None
+            metrics["ttft_seconds"] = round(time.time() - start_time, 4)
+            if on_token is not None:
+                on_token(final_output)
+        else:
+            if max_new_tokens is not None:
+                metrics["max_new_tokens"] = max_new_tokens
+
+            # Step 3: Generation (The "Voice"), streamed piece by piece
+            # We pass sentiment so the bot knows if it should be apologetic or happy
+            raw_response = self.executor.run(
+                timings, "generation", self._generate, metrics, start_time, on_token, max_new_tokens,
+                history,
+                user_query=user_input,
+                retrieved_context=retrieved_context,
+                sentiment=sentiment,
+                intent=intent
+            )
+            if metrics.get("generated_tokens"):
+                self._observe("generation_per_token", timings["generation"] / metrics["generated_tokens"])
+            if max_new_tokens is not None and metrics.get("generated_tokens", 0) >= max_new_tokens:
+                # Only a degradation if the cap actually cut the answer short
+                degradation.append("capped_generation")
+
+            # Step 4: Quality Validation (The "Editor"), if the budget still covers it
+            validation_cost = self._estimates.get("validation")
+            if metrics.get("generation_aborted"):
+                # Already judged off-context while it was being written
+                quality_score = None
+                fallback = True
+                final_output = FALLBACK_RESPONSE
+            elif validation_cost is not None and deadline.remaining() < validation_cost:
+                degradation.append("skipped_validation")
+                quality_score = None
+                fallback = False
+                final_output = raw_response
+            else:
+                quality_score, validity_reason = self.executor.run(
+                    timings, "validation", self.validator.validate, raw_response, retrieved_context
+                )
+                self._observe("validation", timings["validation"])
+
+                # If quality is too low, override with a fallback message
+                fallback = quality_score < self.quality_threshold
+                final_output = FALLBACK_RESPONSE if fallback else raw_response
+
+            # Only complete answers that passed validation are worth reusing
+            if use_response_cache and not fallback and not degradation:
+                self.response_cache.put(intent, retrieved["id"], user_input, raw_response, quality_score)
+
+        if degradation:
+            metrics["degradation"] = degradation
+        if self.sessions is not None:
+            metrics["session_turns"] = self.sessions.append(session_id, {
+                "query": user_input,
+                "response": final_output,
+                "intent": intent,
+                "chunk_id": retrieved["id"],
+                "fallback": fallback,
+            })
+
+        # Log Everything (The "MLOps")
+        latency = time.time() - start_time
+        metrics["spans_ms"] = _to_ms(tracer.snapshot(spans))
+        self.logger.log(
+            session_id=session_id,
+            variant=self.variant,
+            query=user_input,
+            sentiment=sentiment,
+            intent=intent,
+            context=retrieved_context,
+            response=final_output,
+            latency=latency,
+            score=quality_score,
+            metrics=metrics
+        )
+
+        return {
+            "session_id": session_id,
+            "status": "ok",
+            "response": final_output,
+            "sentiment": sentiment,
+            "intent": intent,
+            "quality_score": float(quality_score) if quality_score is not None else None,
+            "fallback": fallback,
+            "cache_hit": cached is not None,
+            "degradation": degradation,
+            "latency_seconds": latency,
+            "timings": timings,
+            "metrics": metrics,
+        }
+
+    def _filters_by_intent(self):
+        # Resolved on first use: a lazily loaded knowledge base only has to be ready by then
+        if self._retrieval_needs_intent is None:
+            self._retrieval_needs_intent = bool(getattr(self.rag_system, "filters_by_intent", False))
+        return self._retrieval_needs_intent
+
+    def _cached(self, metrics, stage, fn, text):
+        """Runs a deterministic stage through the stage cache (if any), noting hits in metrics."""
+        if self.stage_cache is None:
+            return fn(text)
+        result, hit = self.stage_cache.get_or_compute(stage, text, fn)
+        if hit:
+            metrics.setdefault("stage_cache_hits", []).append(stage)
+        return result
+
+    def _affordable_tokens(self, deadline):
+        """
+        None when a full generation (plus validation) fits in what is left of the budget,
+        otherwise how many tokens do. Until a generation has been timed, assume it fits.
+        """
+        per_token = self._estimates.get("generation_per_token")
+        remaining = deadline.remaining()
+        if per_token is None or remaining == float("inf"):
+            return None
+        remaining -= self._estimates.get("validation", 0.0)
+        affordable = max(0, int(remaining / per_token))
+        return affordable if affordable < settings.LLM_MAX_LENGTH else None
+
+    def _drift_monitor(self, retrieved_context, user_query):
+        if not settings.GENERATION_DRIFT_CHECK or not hasattr(self.validator, "drift_monitor"):
+            return None
+        return self.validator.drift_monitor(retrieved_context, user_query)
+
+    def _observe(self, name, seconds):
+        # Unsynchronised on purpose: a lost update between concurrent turns only skips one sample
+        previous = self._estimates.get(name)
+        weight = settings.TURN_ESTIMATE_WEIGHT
+        self._estimates[name] = seconds if previous is None else (1 - weight) * previous + weight * seconds
+
+    def _generate(self, metrics, turn_start, on_token, max_new_tokens=None, history=None, **prompt_fields):
+        if max_new_tokens is not None:
+            prompt_fields["max_new_tokens"] = max_new_tokens
+        if history:
+            prompt_fields["history"] = history
+        stream = self.bot_voice.stream_response(**prompt_fields)
+        # Prompt token counts (prompt_tokens, context_tokens, ...), when the generator reports them
+        metrics.update(getattr(stream, "prompt_stats", None) or {})
+        monitor = self._drift_monitor(prompt_fields["retrieved_context"], prompt_fields["user_query"])
+        checked_at = 0
+        for piece in stream:
+            if metrics.get("generation_aborted"):
+                continue  # Pieces decoded before the stop took effect
+            if "ttft_seconds" not in metrics:
+                # Measured from the start of the turn: what the user actually waits for
+                metrics["ttft_seconds"] = round(time.time() - turn_start, 4)
+            if on_token is not None:
+                on_token(piece)
+
+            if monitor is None:
+                continue
+            monitor.add(piece)
+            if monitor.words - checked_at >= settings.GENERATION_DRIFT_CHECK_EVERY:
+                checked_at = monitor.words
+                if monitor.drifting():
+                    # Would almost certainly fail validation: stop paying for decoder steps now
+                    metrics["generation_aborted"] = True
+                    metrics["drift_overlap"] = round(monitor.overlap, 4)
+                    tracer.record("llm.aborted", time.time() - turn_start)
+                    if hasattr(stream, "stop"):
+                        stream.stop()
+                    else:
+                        break
+
+        metrics["generated_tokens"] = stream.generated_tokens
+        metrics["tokens_per_second"] = round(stream.tokens_per_second, 2)
+        return stream.text
@@ -0,0 +1,149 @@
+import asyncio
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import settings
+from src.bootstrap import load_pipeline
+
+
+class PreforkServer:
+    """
+    Runs the HTTP service on several worker processes that share one copy of the models.
+
+    The parent loads every component once (nothing lazy: a background load would not be
+    inherited), binds the listening socket, then forks. Children get the model weights, the
+    vector index and the classifier bundles through copy-on-write pages instead of loading
+    their own, and every worker accepts connections from the same socket, so the kernel
+    spreads them across processes. Threads, thread pools and SQLite connections don't survive
+    fork; the components that own them re-create them in the child (see reinit_after_fork).
+
+    The parent only supervises: it restarts a worker that dies and, on SIGTERM/SIGINT, stops
+    all of them. Each worker's GET /metrics describes that worker alone.
+    """
+    def __init__(self, processes, worker_threads=None, max_in_flight=None, max_queued=None, torch_threads=None):
+        self.processes = processes
+        self.worker_threads = worker_threads
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.torch_threads = torch_threads or settings.SERVER_TORCH_THREADS or max(1, (os.cpu_count() or 1) // processes)
+        self.pipeline = None
+        self.sock = None
+        self.workers = {}  # pid -> worker index
+        self.stopping = False
+        self.signalled = False
+
+    def run(self, host=None, port=None):
+        if not hasattr(os, "fork"):
+            raise RuntimeError("Pre-forked serving needs os.fork(); run with --processes 1 on this platform.")
+
+        # Tokenizer thread pools started in the parent would deadlock in the children
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+        print(f"Booting up Enterprise Chatbot Service ({self.processes} worker processes)...")
+        try:
+            self.pipeline = load_pipeline(lazy=())
+        except Exception as e:
+            print(f"\n CRITICAL ERROR during startup: {e}")
+            print("Please check that your .pkl files and ChromaDB are in the 'artifacts/' folder.")
+            return
+
+        self.sock = socket.create_server(
+            (host or settings.SERVER_HOST, port or settings.SERVER_PORT), backlog=1024
+        )
+        self.sock.setblocking(False)
+        address = self.sock.getsockname()
+        print(f"Serving on http://{address[0]}:{address[1]} with {self.processes} workers")
+
+        # The logger's writer thread would not exist in the children; each worker reopens it
+        self.pipeline.logger.close()
+        # Move everything loaded so far out of the collector's reach: a collection in a child
+        # would otherwise touch (and so copy) every page holding those objects
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        for index in range(self.processes):
+            self._spawn(index)
+        self._supervise()
+
+    def _spawn(self, index):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = index
+            return
+
+        # --- Child ---
+        status = 0
+        try:
+            self._run_worker(index)
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        except BaseException as e:
+            print(f"Worker {index} crashed: {e}")
+            status = 1
+        finally:
+            # Skip the parent's atexit handlers and buffered state: just leave
+            sys.stdout.flush()
+            os._exit(status)
+
+    def _run_worker(self, index):
+        # Unwind out of the event loop so queued log rows are written before the worker exits
+        signal.signal(signal.SIGTERM, _exit_worker)
+        signal.signal(signal.SIGINT, _exit_worker)
+        try:
+            import torch
+            # Workers run side by side, so each gets its share of the cores, not all of them
+            torch.set_num_threads(self.torch_threads)
+        except ImportError:
+            pass
+
+        self.pipeline.logger.reopen(worker_tag=f"w{index}")
+        from src.server import ChatServer
+        server = ChatServer(self.pipeline, worker_threads=self.worker_threads, max_in_flight=self.max_in_flight,
+                            max_queued=self.max_queued)
+        print(f"   Worker {index} ready (pid {os.getpid()})")
+        try:
+            asyncio.run(server.serve(sock=self.sock))
+        finally:
+            self.pipeline.logger.close()
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def _supervise(self):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                if self.stopping and not self.signalled:
+                    self._stop_workers()
+                time.sleep(0.2)
+                continue
+
+            index = self.workers.pop(pid)
+            if not self.stopping:
+                print(f"Worker {index} (pid {pid}) exited with status {status}. Restarting it.")
+                self._spawn(index)
+        print("Shutting down.")
+
+    def _stop_workers(self):
+        # Sent once; _supervise() keeps reaping until every worker is gone
+        self.signalled = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.workers.pop(pid, None)
+
+
+def _exit_worker(signum, frame):
+    raise SystemExit(0)
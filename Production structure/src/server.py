@@ -0,0 +1,332 @@
+import sys
+import os
+import json
+import math
+import uuid
+import asyncio
+import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# This ensures Python can find your 'src' folder if you run from the project root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import settings
+from src.bootstrap import load_pipeline
+from src.pipeline import Deadline
+from src.utils.tracing import tracer
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ChatServer:
+    """
+    Minimal asyncio HTTP/JSON front end for the ChatPipeline.
+
+    The event loop only parses requests and writes responses. Every turn runs on a bounded
+    thread pool (the models are blocking), and a semaphore caps how many turns are in flight
+    so a burst of traffic queues up instead of piling work onto the executor.
+
+    Admission control keeps that queue from growing without bound: a request is answered
+    503 straight away when max_queued turns are already waiting, or once it has waited so
+    long that less than SERVER_MIN_TURN_SECONDS of its latency budget is left. The budget
+    (TURN_BUDGET_SECONDS, or "budget_ms" in the body) starts when the request arrives, so
+    time spent queueing counts against it and the pipeline degrades the turn accordingly.
+
+    Routes:
+        POST /chat         {"message": "...", "session_id": "optional", "budget_ms": optional} -> turn as JSON
+        POST /chat/stream  same body -> chunked NDJSON: {"type": "token", "text": ...} events
+                           while the LLM writes, then {"type": "done", ...turn}
+        GET  /health       -> {"status": "ok"}
+        GET  /metrics      -> Prometheus text: per-span latency histograms and p50/p95/p99
+    """
+    def __init__(self, pipeline, worker_threads=None, max_in_flight=None, max_queued=None):
+        self.pipeline = pipeline
+        self.executor = ThreadPoolExecutor(
+            max_workers=worker_threads or settings.SERVER_WORKER_THREADS,
+            thread_name_prefix="pipeline"
+        )
+        self.max_in_flight = max_in_flight or settings.SERVER_MAX_IN_FLIGHT
+        self.max_queued = settings.SERVER_MAX_QUEUED if max_queued is None else max_queued
+        self.in_flight = None  # Created inside the running loop
+        self.queued = 0
+
+    async def serve(self, host=None, port=None, sock=None):
+        """Serves until cancelled. sock: an already listening socket (shared by pre-forked workers)."""
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        if sock is not None:
+            server = await asyncio.start_server(self.handle_connection, sock=sock)
+        else:
+            server = await asyncio.start_server(
+                self.handle_connection,
+                host or settings.SERVER_HOST,
+                port or settings.SERVER_PORT
+            )
+        for sock in server.sockets:
+            print(f"Serving on http://{sock.getsockname()[0]}:{sock.getsockname()[1]}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(wait=True)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            # Keep-alive: serve requests on this connection until the client closes it
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+
+                status, payload = await self.dispatch(method, path, body)
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+                if hasattr(payload, "__aiter__"):
+                    await self._write_stream(writer, status, payload, keep_alive)
+                else:
+                    await self._write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        except HTTPError as e:
+            await self._write_response(writer, e.status, {"error": e.message}, keep_alive=False)
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, body):
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/metrics":
+            return 200, tracer.render_prometheus()
+
+        if path not in ("/chat", "/chat/stream"):
+            return 404, {"error": f"Unknown route {path}"}
+        if method != "POST":
+            return 405, {"error": f"Use POST {path}"}
+
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:  # Malformed JSON or bytes that aren't UTF-8
+            return 400, {"error": "Body must be JSON"}
+        if not isinstance(data, dict):
+            return 400, {"error": "Body must be a JSON object"}
+
+        message = data.get("message", "")
+        if not isinstance(message, str):
+            return 400, {"error": "Field 'message' must be a string"}
+        message = message.strip()
+        if not message:
+            return 400, {"error": "Field 'message' is required"}
+        session_id = data.get("session_id") or str(uuid.uuid4())
+        if not isinstance(session_id, str):
+            return 400, {"error": "Field 'session_id' must be a string"}
+        try:
+            deadline = self._deadline(data.get("budget_ms"))
+        except (TypeError, ValueError):
+            return 400, {"error": "Field 'budget_ms' must be a positive number of milliseconds"}
+
+        if self._queue_full():
+            return 503, self.pipeline.reject(session_id, message, "queue full", deadline)
+
+        if path == "/chat/stream":
+            return 200, self._stream_turn(session_id, message, deadline)
+
+        loop = asyncio.get_running_loop()
+        if not await self._acquire_slot(deadline):
+            return 503, self.pipeline.reject(session_id, message, "budget spent waiting in queue", deadline)
+        try:
+            turn = await loop.run_in_executor(
+                self.executor, self.pipeline.run_turn, session_id, message, None, deadline
+            )
+        except Exception as e:
+            print(f"Pipeline error for session {session_id}: {e}")
+            return 500, {"error": "Pipeline failure", "session_id": session_id}
+        finally:
+            self.in_flight.release()
+        return 200, turn
+
+    def _deadline(self, budget_ms):
+        if budget_ms is None:
+            return Deadline()
+        if isinstance(budget_ms, bool):
+            raise TypeError(budget_ms)
+        budget = float(budget_ms) / 1000
+        # json.loads accepts NaN and Infinity, which no deadline can be built from
+        if not math.isfinite(budget) or budget <= 0:
+            raise ValueError(budget_ms)
+        return Deadline(min(budget, settings.SERVER_MAX_BUDGET_SECONDS))
+
+    def _queue_full(self):
+        return self.in_flight.locked() and self.queued >= self.max_queued
+
+    async def _acquire_slot(self, deadline):
+        """
+        Waits for an in-flight slot. False (and no slot) when the request's budget ran down to
+        SERVER_MIN_TURN_SECONDS while it waited: starting it then would only produce a late answer.
+        """
+        if not self.in_flight.locked():
+            # Free slot: taken without yielding to the loop, so _queue_full() sees it at once
+            await self.in_flight.acquire()
+            return True
+        timeout = deadline.remaining() - settings.SERVER_MIN_TURN_SECONDS
+        if timeout == float("inf"):
+            timeout = None
+        elif timeout <= 0:
+            return False
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self.in_flight.acquire(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.queued -= 1
+
+    async def _stream_turn(self, session_id, message, deadline):
+        """Async generator of NDJSON events for one turn."""
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+
+        # Called on the executor thread for every piece of the answer
+        def on_token(piece):
+            loop.call_soon_threadsafe(events.put_nowait, {"type": "token", "text": piece})
+
+        async def run():
+            if not await self._acquire_slot(deadline):
+                turn = self.pipeline.reject(session_id, message, "budget spent waiting in queue", deadline)
+                events.put_nowait({"type": "error", "error": "Server busy", **turn})
+                return
+            try:
+                turn = await loop.run_in_executor(
+                    self.executor,
+                    functools.partial(self.pipeline.run_turn, session_id, message, on_token=on_token, deadline=deadline)
+                )
+                event = {"type": "done", **turn}
+            except Exception as e:
+                print(f"Pipeline error for session {session_id}: {e}")
+                event = {"type": "error", "error": "Pipeline failure", "session_id": session_id}
+            finally:
+                self.in_flight.release()
+            # Token callbacks were scheduled before the executor future resolved, so this lands last
+            events.put_nowait(event)
+
+        task = asyncio.create_task(run())
+        while True:
+            event = await events.get()
+            yield event
+            if event["type"] in ("done", "error"):
+                break
+        await task
+
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > settings.SERVER_MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0], headers, body
+
+    async def _write_response(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload, default=str).encode("utf-8"), "application/json"
+        head = (
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _write_stream(self, writer, status, events, keep_alive):
+        head = (
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            "Content-Type: application/x-ndjson\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode("latin-1"))
+        async for event in events:
+            line = (json.dumps(event, default=str) + "\n").encode("utf-8")
+            writer.write(f"{len(line):X}\r\n".encode("latin-1") + line + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the chatbot pipeline over HTTP/JSON.")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKER_THREADS,
+                        help="Threads available for blocking model calls")
+    parser.add_argument("--max-in-flight", type=int, default=settings.SERVER_MAX_IN_FLIGHT,
+                        help="Turns processed concurrently before new requests wait")
+    parser.add_argument("--max-queued", type=int, default=settings.SERVER_MAX_QUEUED,
+                        help="Turns allowed to wait for a slot; beyond that requests get 503")
+    parser.add_argument("--processes", type=int, default=settings.SERVER_PROCESSES,
+                        help="Pre-forked worker processes sharing the loaded models (see src/prefork.py)")
+    args = parser.parse_args()
+
+    if args.processes > 1:
+        from src.prefork import PreforkServer
+        PreforkServer(
+            args.processes, worker_threads=args.workers, max_in_flight=args.max_in_flight, max_queued=args.max_queued
+        ).run(args.host, args.port)
+        return
+
+    print("Booting up Enterprise Chatbot Service...")
+    try:
+        pipeline = load_pipeline()
+    except Exception as e:
+        print(f"\n CRITICAL ERROR during startup: {e}")
+        print("Please check that your .pkl files and ChromaDB are in the 'artifacts/' folder.")
+        return
+
+    server = ChatServer(pipeline, worker_threads=args.workers, max_in_flight=args.max_in_flight,
+                        max_queued=args.max_queued)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Shutting down.")
+
+if __name__ == "__main__":
+    main()
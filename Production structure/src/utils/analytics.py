@@ -1,52 +1,315 @@
+import atexit
+import contextlib
 import csv
+import json
 import os
-from datetime import datetime
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
+import queue
+import re
+import threading
+import time
+from datetime import date, datetime
+
+from config import settings
+from src.components.embeddings import get_embedding_service
+from src.utils.tracing import tracer
+
+LOG_COLUMNS = [
+    "timestamp", "session_id", "variant",
+    "user_query", "sentiment", "intent",
+    "retrieved_context", "llm_response",
+    "latency_seconds", "quality_score",
+    "metrics"  # JSON object with per-turn extras (cache hits, timings, ...)
+]
+
+_STOP = object()
+
+_WORD = re.compile(r"[a-z0-9]+")
 
 class ExperimentLogger:
-    def __init__(self):
+    """
+    Turn logger that never touches the disk on the request thread.
+
+    log() only puts a row on a bounded queue. A background thread drains it in batches (every
+    LOG_FLUSH_BATCH_SIZE rows or LOG_FLUSH_INTERVAL_SECONDS, whichever comes first), appends them
+    to production_logs.csv through a handle that stays open, and rotates the file by size or
+    day. Optionally the same rows also go to a zstd-compressed Parquet file for analytics.
+    close() (also registered with atexit) drains everything that was queued before returning.
+
+    Pre-forked server workers share production_logs.csv: each one calls reopen() with its own
+    tag, batches are appended under an exclusive file lock, and each worker gets its own
+    Parquet file (production_logs-<tag>.parquet), since Parquet files can't be shared.
+    """
+    def __init__(self, log_dir=None, columnar_format=settings.LOG_COLUMNAR_FORMAT):
         # Save logs in the 'logs' folder at project root
-        base_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        log_dir = os.path.join(base_path, 'logs')
+        if log_dir is None:
+            base_path = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+            log_dir = os.path.join(base_path, 'logs')
         os.makedirs(log_dir, exist_ok=True)
         
+        self.log_dir = log_dir
         self.filepath = os.path.join(log_dir, 'production_logs.csv')
-        
-        # Initialize file with headers if it doesn't exist
-        if not os.path.exists(self.filepath):
-            with open(self.filepath, mode='w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    "timestamp", "session_id", "variant", 
-                    "user_query", "sentiment", "intent", 
-                    "retrieved_context", "llm_response", 
-                    "latency_seconds", "quality_score"
-                ])
-
-    def log(self, session_id, variant, query, sentiment, intent, context, response, latency, score):
-        with open(self.filepath, mode='a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                datetime.now(), session_id, variant, 
+        self.worker_tag = None
+        self.columnar_format = columnar_format
+        if columnar_format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                print("Warning: pyarrow is not installed. Parquet logging disabled, CSV only.")
+                self.columnar_format = None
+
+        # Older files may predate newer columns
+        if os.path.exists(self.filepath):
+            self._upgrade_header()
+
+        self._csv_file = None
+        self._parquet_writer = None
+        self._opened_on = None
+        self._open_files()
+
+        self._close_lock = threading.Lock()
+        self._start_writer()
+        atexit.register(self.close)
+
+    def _start_writer(self):
+        self._queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._writer.start()
+
+    def log(self, session_id, variant, query, sentiment, intent, context, response, latency, score, metrics=None):
+        # Blocks only if the writer has fallen LOG_QUEUE_SIZE rows behind: backpressure, never data loss
+        with tracer.span("logger.enqueue"):
+            self._queue.put([
+                str(datetime.now()), session_id, variant, 
                 query, sentiment, intent, 
                 context, response, 
-                round(latency, 4), round(score, 4)
+                # A skipped score stays None: an empty CSV field, a null in the float Parquet column
+                round(latency, 4), round(score, 4) if score is not None else None,
+                json.dumps(metrics, default=str) if metrics else ""
             ])
 
+    def flush(self):
+        """Blocks until every row logged so far is on disk."""
+        self._queue.join()
+
+    def close(self):
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def reopen(self, worker_tag=None):
+        """
+        Starts logging again after close(), e.g. in a freshly forked server worker (the writer
+        thread does not survive fork, which is why the parent closes the logger first).
+        With a worker_tag the CSV file is treated as shared with other processes.
+        """
+        if not self._closed:
+            raise RuntimeError("reopen() is only valid after close()")
+        self.worker_tag = worker_tag
+        self._close_lock = threading.Lock()
+        with self._shared_csv_lock():
+            self._open_files()
+        self._start_writer()
+
+    # --- Writer thread ---
+
+    def _run(self):
+        batch_size = settings.LOG_FLUSH_BATCH_SIZE
+        interval = settings.LOG_FLUSH_INTERVAL_SECONDS
+        stopping = False
+
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + interval
+            while len(batch) < batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+
+            if batch:
+                try:
+                    with tracer.span("logger.flush"):
+                        self._write(batch)
+                except Exception as e:
+                    # Keep the writer alive; a failed batch shouldn't take logging down for good
+                    print(f"Warning: failed to write {len(batch)} log rows: {e}")
+                for _ in batch:
+                    self._queue.task_done()
+
+        self._close_files()
+
+    def _write(self, rows):
+        with self._shared_csv_lock():
+            if self._rotated_elsewhere():
+                # Another worker already rotated the shared CSV: follow it to the new file
+                self._rotate(move_csv=False)
+            elif self._should_rotate():
+                self._rotate()
+
+            csv.writer(self._csv_file).writerows(rows)
+            self._csv_file.flush()
+
+        if self._parquet_writer is not None:
+            import pyarrow as pa
+            columns = {name: [row[i] for row in rows] for i, name in enumerate(LOG_COLUMNS)}
+            for name in ("sentiment", "intent"):
+                columns[name] = [str(value) for value in columns[name]]
+            self._parquet_writer.write_table(pa.table(columns, schema=self._parquet_schema()))
+
+    def _should_rotate(self):
+        if settings.LOG_ROTATE_DAILY and self._opened_on != date.today():
+            return True
+        return self._csv_file.tell() >= settings.LOG_ROTATE_BYTES
+
+    @contextlib.contextmanager
+    def _shared_csv_lock(self):
+        """Exclusive lock around CSV appends and rotation, only taken when the file is shared."""
+        if self.worker_tag is None:
+            yield
+            return
+        import fcntl
+        with open(self.filepath + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _rotated_elsewhere(self):
+        if self.worker_tag is None:
+            return False
+        try:
+            return os.stat(self.filepath).st_ino != os.fstat(self._csv_file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _rotate(self, move_csv=True):
+        self._close_files()
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        for path in (self.filepath if move_csv else None, self._parquet_path()):
+            if path and os.path.exists(path):
+                root, ext = os.path.splitext(path)
+                os.replace(path, f"{root}-{stamp}{ext}")
+        self._open_files()
+
+    def _open_files(self):
+        is_new = not os.path.exists(self.filepath)
+        self._csv_file = open(self.filepath, mode='a', newline='', encoding='utf-8')
+        # Initialize file with headers if it doesn't exist
+        if is_new:
+            csv.writer(self._csv_file).writerow(LOG_COLUMNS)
+            self._csv_file.flush()
+        self._opened_on = date.today()
+
+        if self.columnar_format == "parquet":
+            import pyarrow.parquet as pq
+            # Parquet can't be appended to, so an existing file from a previous run is moved aside
+            if os.path.exists(self._parquet_path()):
+                root, ext = os.path.splitext(self._parquet_path())
+                os.replace(self._parquet_path(), f"{root}-{datetime.now().strftime('%Y%m%d-%H%M%S')}{ext}")
+            self._parquet_writer = pq.ParquetWriter(self._parquet_path(), self._parquet_schema(), compression="zstd")
+
+    def _close_files(self):
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+    def _parquet_path(self):
+        if self.worker_tag is not None:
+            return os.path.join(self.log_dir, f'production_logs-{self.worker_tag}.parquet')
+        return os.path.join(self.log_dir, 'production_logs.parquet')
+
+    def _parquet_schema(self):
+        import pyarrow as pa
+        return pa.schema([
+            (name, pa.float64() if name in ("latency_seconds", "quality_score") else pa.string())
+            for name in LOG_COLUMNS
+        ])
+
+    def _upgrade_header(self):
+        """
+        Older log files were written before new columns existed. Their rows are still valid
+        (the missing trailing columns just read as empty), so only the header line is replaced.
+        """
+        with open(self.filepath, mode='r', newline='', encoding='utf-8') as f:
+            header = next(csv.reader(f), [])
+            if header == LOG_COLUMNS or header != LOG_COLUMNS[:len(header)]:
+                return
+            rest = f.read()
+
+        with open(self.filepath, mode='w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerow(LOG_COLUMNS)
+            f.write(rest)
+
+class DriftMonitor:
+    """
+    Incremental, lexical stand-in for QualityValidator while an answer is still being written.
+    Tracks which share of the answer's content words (no stop words, three letters or more)
+    also occur in the retrieved context or the user's question. Each piece costs a regex over
+    that piece and a few set lookups, so it can run after every streamed token.
+    """
+    def __init__(self, context, query=""):
+        from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+        self.stop_words = ENGLISH_STOP_WORDS
+        self.grounded_words = set(_WORD.findall(f"{context} {query}".lower()))
+        self.words = 0
+        self.content_words = 0
+        self.grounded = 0
+        self._tail = ""  # A word may be split across pieces; it's counted once complete
+
+    def add(self, piece):
+        text = (self._tail + piece).lower()
+        words = _WORD.findall(text)
+        # The last word isn't finished unless the piece ended on a separator
+        self._tail = words.pop() if words and text[-1:].isalnum() else ""
+        for word in words:
+            self.words += 1
+            if len(word) < 3 or word in self.stop_words:
+                continue
+            self.content_words += 1
+            self.grounded += word in self.grounded_words
+
+    @property
+    def overlap(self):
+        return self.grounded / self.content_words if self.content_words else 1.0
+
+    def drifting(self, min_words=settings.GENERATION_DRIFT_MIN_WORDS, min_overlap=settings.GENERATION_DRIFT_MIN_OVERLAP):
+        return self.content_words >= min_words and self.overlap < min_overlap
+
 class QualityValidator:
     def __init__(self):
-        # We reuse the RAG embedding model for validation
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        # We reuse the RAG embedding model for validation (one shared instance per process)
+        self.embedder = get_embedding_service()
+
+    def drift_monitor(self, retrieved_context, user_query=""):
+        """A DriftMonitor for an answer to user_query that is being generated against retrieved_context."""
+        return DriftMonitor(retrieved_context, user_query)
 
     def validate(self, llm_response, retrieved_context):
+        with tracer.span("validator.validate"):
+            return self._validate(llm_response, retrieved_context)
+
+    def _validate(self, llm_response, retrieved_context):
         if not llm_response or len(llm_response) < 5:
             return 0.0, "Too Short"
             
-        # Create vectors
-        embeddings = self.model.encode([llm_response, retrieved_context])
+        # Create vectors (the retrieved context is normally already cached by the KnowledgeBase)
+        embeddings = self.embedder.encode([llm_response, retrieved_context])
         
-        # Calculate similarity
+        # Calculate similarity (sklearn is imported lazily to keep startup fast)
+        from sklearn.metrics.pairwise import cosine_similarity
         score = cosine_similarity([embeddings[0]], [embeddings[1]])[0][0]
         
         return float(score), "Valid"
\ No newline at end of file
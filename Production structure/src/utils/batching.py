@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from src.utils.system import reinit_after_fork
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching queue.
+
+    Callers on any thread submit single items. A background thread collects them into a batch
+    until either max_batch_size items are waiting or max_wait_ms has passed since the oldest one
+    was submitted, runs batch_fn once on the whole list, and hands each caller its own result.
+    Under light load a request waits at most max_wait_ms; under heavy load batches fill up
+    immediately and the model runs far fewer, larger forward passes.
+
+    batch_fn must take a list of items and return a list of results in the same order.
+    """
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=5, name="micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+
+        self.name = name
+        self._start()
+        reinit_after_fork(self, "_start")
+
+    def _start(self):
+        # Also runs in a forked child: the parent's worker thread does not exist there, and
+        # anything the parent had queued belongs to the parent's callers
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        """Queues one item and returns a Future for its result."""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.append((item, future, time.monotonic()))
+            self._cond.notify()
+        return future
+
+    def process(self, item):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(item).result()
+
+    def close(self):
+        """Stops accepting items; anything already queued is still processed."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return None
+
+            # The oldest item's clock started when it was submitted, not now: items that queued
+            # behind a slow batch don't wait another full window
+            deadline = self._queue[0][2] + self.max_wait
+            while len(self._queue) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            size = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(size)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+
+import joblib
+
+from config import settings
+
+BUNDLE_FILE = "bundle.joblib"
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def bundle_root(name):
+    return os.path.join(settings.MODEL_BUNDLE_DIR, name)
+
+
+def current_pointer(name):
+    """Path of the file naming the live version of a bundle (it changes on every release)."""
+    return os.path.join(bundle_root(name), CURRENT_FILE)
+
+
+def save_bundle(name, parts, data_path=None, extra=None):
+    """
+    Writes parts (e.g. {"vectorizer", "model", "label_encoder"}) as ONE uncompressed joblib file
+    plus a manifest, then points CURRENT at it. Keeping the pieces in a single file means a
+    vectorizer can never be paired with a model from another run; keeping it uncompressed lets
+    load_bundle() memory-map the numpy arrays inside (IDF weights, coefficients).
+    Returns the new version string.
+    """
+    root = bundle_root(name)
+    staging = os.path.join(root, f".staging-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    bundle_path = os.path.join(staging, BUNDLE_FILE)
+    joblib.dump(parts, bundle_path)
+    bundle_hash = file_sha256(bundle_path)
+    version = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{bundle_hash[:8]}"
+
+    manifest = {
+        "name": name,
+        "version": version,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "parts": sorted(parts),
+        "files": {BUNDLE_FILE: bundle_hash},
+        "training_data": None,
+        **(extra or {}),
+    }
+    if data_path is not None:
+        manifest["training_data"] = {
+            "path": os.path.relpath(data_path, settings.BASE_DIR),
+            "sha256": file_sha256(data_path),
+            "bytes": os.path.getsize(data_path),
+        }
+    with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    os.replace(staging, os.path.join(root, version))
+
+    # Flip the pointer last (atomic rename): readers see the old bundle or the new one, never a mix
+    pointer_tmp = current_pointer(name) + ".tmp"
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer_tmp, current_pointer(name))
+
+    _prune(name, keep=settings.MODEL_BUNDLE_KEEP)
+    return version
+
+
+def load_bundle(name, mmap=settings.MODEL_BUNDLE_MMAP, verify=settings.MODEL_BUNDLE_VERIFY):
+    """
+    Returns (parts, manifest) for the live version of a bundle. With mmap, numpy arrays are
+    mapped read-only from the file, so every worker process shares one copy in the page cache.
+    Raises FileNotFoundError when no bundle has been released, ValueError when it fails its hash.
+    """
+    with open(current_pointer(name), "r", encoding="utf-8") as f:
+        version = f.read().strip()
+    directory = os.path.join(bundle_root(name), version)
+    with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    bundle_path = os.path.join(directory, BUNDLE_FILE)
+    if verify and file_sha256(bundle_path) != manifest["files"][BUNDLE_FILE]:
+        raise ValueError(f"Model bundle {name}/{version} does not match its manifest hash. Retrain or restore it.")
+
+    parts = joblib.load(bundle_path, mmap_mode="r" if mmap else None)
+    return parts, manifest
+
+
+def _prune(name, keep):
+    root = bundle_root(name)
+    versions = sorted(
+        entry for entry in os.listdir(root)
+        if not entry.startswith(".") and os.path.isdir(os.path.join(root, entry))
+    )
+    for version in versions[:-keep] if keep else []:
+        shutil.rmtree(os.path.join(root, version), ignore_errors=True)
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import settings
+
+
+def read_index_version():
+    """
+    Returns the version stamp build_rag_db.py writes after every (re)build, or None if the
+    index predates the stamp. Anything derived from the collection should be dropped when it changes.
+    """
+    try:
+        with open(settings.RAG_INDEX_VERSION_PATH, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class SemanticResponseCache:
+    """
+    Caches validated LLM answers so near-duplicate questions skip generation entirely.
+
+    An entry is keyed on (intent, retrieved chunk id) and holds the query embedding it was
+    answered for (from the shared EmbeddingService, which has normally just embedded the same
+    query for retrieval, so this costs a cache hit rather than a forward pass).
+
+    A lookup only considers entries in the same bucket and returns the closest one whose
+    cosine similarity clears the threshold. Entries expire after ttl_seconds, the whole cache
+    is bounded to max_entries (least recently used goes first), and everything is dropped
+    when the knowledge base is rebuilt.
+    """
+    def __init__(self, embedder, similarity_threshold=settings.RESPONSE_CACHE_SIMILARITY,
+                 ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES):
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()  # entry_id -> entry dict, in LRU order
+        self._buckets = {}             # (intent, chunk_id) -> set of entry_ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.index_version = read_index_version()
+        self._version_checked_at = time.monotonic()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def lookup(self, intent, chunk_id, query):
+        """Returns {"response", "quality_score", "similarity"} for the best match, or None."""
+        self._check_index_version()
+        query = self._normalize(self.embedder.encode_one(query))
+        now = time.time()
+
+        with self._lock:
+            best_id, best_score = None, self.similarity_threshold
+            for entry_id in list(self._buckets.get((intent, chunk_id), ())):
+                entry = self._entries[entry_id]
+                if now - entry["created_at"] > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                score = float(np.dot(query, entry["embedding"]))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            return {
+                "response": entry["response"],
+                "quality_score": entry["quality_score"],
+                "similarity": best_score,
+            }
+
+    def put(self, intent, chunk_id, query, response, quality_score):
+        embedding = self._normalize(self.embedder.encode_one(query))
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "key": (intent, chunk_id),
+                "embedding": embedding,
+                "response": response,
+                "quality_score": float(quality_score),
+                "created_at": time.time(),
+            }
+            self._buckets.setdefault((intent, chunk_id), set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        bucket = self._buckets.get(entry["key"])
+        if bucket is not None:
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._buckets[entry["key"]]
+
+    def _check_index_version(self):
+        # A stat + tiny read, but no need to do it on every single request
+        now = time.monotonic()
+        if now - self._version_checked_at < settings.RESPONSE_CACHE_VERSION_CHECK_SECONDS:
+            return
+        self._version_checked_at = now
+
+        version = read_index_version()
+        if version != self.index_version:
+            print(f"Knowledge base rebuilt ({self.index_version} -> {version}). Clearing response cache.")
+            self.index_version = version
+            self.clear()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,249 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import settings
+from src.utils.system import reinit_after_fork
+
+
+def new_session():
+    return {
+        "turns": [],  # The most recent turns, in full (query and answer cut to SESSION_TURN_CHARS)
+        "digest": {"turns": 0, "intents": [], "chunk_ids": [], "queries": ""},  # Everything older
+        "updated_at": time.time(),
+    }
+
+
+def _clip(text, limit):
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def _remember_recent(items, item, limit):
+    """items with item moved (or added) to the end, keeping the last limit distinct values."""
+    if item is None:
+        return items
+    items = [i for i in items if i != item] + [item]
+    return items[-limit:]
+
+
+def compact(session, recent_turns=settings.SESSION_RECENT_TURNS):
+    """
+    Folds every turn beyond the last recent_turns into the session's digest: the intents and
+    retrieved chunk ids seen (most recent SESSION_DIGEST_ITEMS of each) and the opening words
+    of each question, cut to SESSION_DIGEST_CHARS from the oldest end. However long the
+    conversation, a session stays about the same size.
+    """
+    digest = session["digest"]
+    while len(session["turns"]) > recent_turns:
+        turn = session["turns"].pop(0)
+        digest["turns"] += 1
+        digest["intents"] = _remember_recent(digest["intents"], turn.get("intent"), settings.SESSION_DIGEST_ITEMS)
+        digest["chunk_ids"] = _remember_recent(digest["chunk_ids"], turn.get("chunk_id"), settings.SESSION_DIGEST_ITEMS)
+        opening = " ".join(turn["query"].split()[:settings.SESSION_DIGEST_QUERY_WORDS])
+        queries = f"{digest['queries']}; {opening}" if digest["queries"] else opening
+        if len(queries) > settings.SESSION_DIGEST_CHARS:
+            # Drop the oldest text, starting again on a whole word
+            queries = queries[-settings.SESSION_DIGEST_CHARS:].split(" ", 1)[-1]
+        digest["queries"] = queries
+    return session
+
+
+def render_history(session):
+    """The session as prompt text: a line on the compacted turns, then the recent ones in full."""
+    if session is None:
+        return ""
+    lines = []
+    digest = session["digest"]
+    if digest["turns"]:
+        lines.append(f"Earlier the user asked about {', '.join(digest['intents']) or 'other topics'}: {digest['queries']}.")
+    for turn in session["turns"]:
+        lines.append(f"User: {turn['query']}")
+        if not turn.get("fallback"):
+            lines.append(f"Agent: {turn['response']}")
+    return "\n".join(lines)
+
+
+class SessionStore:
+    """
+    Per-session conversation history, bounded in the number of sessions and in bytes.
+
+    append() records a finished turn and compacts the session (see compact()), so a session's
+    size, and the history it adds to the prompt, stays constant over a long chat. Sessions
+    idle for longer than ttl_seconds are treated as gone; past max_sessions or max_bytes the
+    least recently used ones are evicted.
+
+    This base class keeps sessions in process memory. SQLiteSessionStore keeps them in a file,
+    so they survive a restart and are shared between pre-forked workers (with the in-memory
+    store each worker only knows the turns it served itself).
+    """
+    def __init__(self, max_sessions=settings.SESSION_MAX_SESSIONS, max_bytes=settings.SESSION_MAX_BYTES,
+                 ttl_seconds=settings.SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.bytes = 0
+        self.evictions = 0
+        self._sessions = OrderedDict()  # session_id -> (session, size in bytes), in LRU order
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """The session dict, or None if it is unknown or expired."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if self._expired(entry[0]):
+                self._drop(session_id)
+                return None
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def history(self, session_id):
+        """The session's history as prompt text ("" for a new session)."""
+        return render_history(self.get(session_id))
+
+    def append(self, session_id, turn):
+        """
+        Records one finished turn: {"query", "response", "intent", "chunk_id", "fallback"}.
+        Returns the number of turns the session has seen.
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            # A copy: a concurrent turn may be rendering the current one into its prompt
+            session = copy.deepcopy(entry[0]) if entry is not None and not self._expired(entry[0]) else new_session()
+            session = self._add_turn(session, turn)
+            if entry is not None:
+                self._drop(session_id)
+            size = len(json.dumps(session))
+            self._sessions[session_id] = (session, size)
+            self.bytes += size
+            self._evict()
+        return session["digest"]["turns"] + len(session["turns"])
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _add_turn(self, session, turn):
+        session["turns"].append({
+            "query": _clip(turn["query"], settings.SESSION_TURN_CHARS),
+            "response": _clip(turn["response"], settings.SESSION_TURN_CHARS),
+            "intent": turn.get("intent"),
+            "chunk_id": turn.get("chunk_id"),
+            "fallback": bool(turn.get("fallback")),
+        })
+        session["updated_at"] = time.time()
+        return compact(session)
+
+    def _expired(self, session):
+        return bool(self.ttl_seconds) and time.time() - session["updated_at"] > self.ttl_seconds
+
+    def _drop(self, session_id):
+        _, size = self._sessions.pop(session_id)
+        self.bytes -= size
+
+    def _evict(self):
+        # Least recently used first, so expired sessions are at the front
+        while self._sessions and self._expired(next(iter(self._sessions.values()))[0]):
+            self._drop(next(iter(self._sessions)))
+        while self._sessions and (len(self._sessions) > self.max_sessions or self.bytes > self.max_bytes):
+            self._drop(next(iter(self._sessions)))
+            self.evictions += 1
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SessionStore in a SQLite file (WAL mode, so pre-forked workers can share it). Each append
+    is one read-modify-write transaction. Expired and over-limit sessions are swept at most
+    every SESSION_SWEEP_SECONDS rather than on every write.
+    """
+    def __init__(self, path=settings.SESSION_DB_PATH, **limits):
+        super().__init__(**limits)
+        self.path = path
+        self._swept_at = 0.0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connect()
+        reinit_after_fork(self, "_connect")
+
+    def _connect(self):
+        # SQLite connections must not cross fork, so forked workers open their own
+        self._lock = threading.Lock()
+        # Autocommit mode: transactions are opened explicitly in append()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(session_id TEXT PRIMARY KEY, data TEXT, bytes INTEGER, updated_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_by_age ON sessions (updated_at)")
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._load(session_id)
+        if session is None or self._expired(session):
+            return None
+        return session
+
+    def append(self, session_id, turn):
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two workers can't interleave on one session
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                session = self._load(session_id)
+                if session is None or self._expired(session):
+                    session = new_session()
+                session = self._add_turn(session, turn)
+                data = json.dumps(session)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                    (session_id, data, len(data), session["updated_at"])
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            if time.monotonic() - self._swept_at >= settings.SESSION_SWEEP_SECONDS:
+                self._swept_at = time.monotonic()
+                self._evict()
+        return session["digest"]["turns"] + len(session["turns"])
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _load(self, session_id):
+        row = self._db.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _evict(self):
+        if self.ttl_seconds:
+            self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions").fetchone()
+        self.bytes = total
+        if count <= self.max_sessions and total <= self.max_bytes:
+            return
+        # Least recently updated first, until both limits hold again
+        victims, freed = [], 0
+        for session_id, size in self._db.execute("SELECT session_id, bytes FROM sessions ORDER BY updated_at").fetchall():
+            if count - len(victims) <= self.max_sessions and total - freed <= self.max_bytes:
+                break
+            victims.append((session_id,))
+            freed += size
+        self._db.execute("BEGIN IMMEDIATE")
+        self._db.executemany("DELETE FROM sessions WHERE session_id = ?", victims)
+        self._db.execute("COMMIT")
+        self.bytes = total - freed
+        self.evictions += len(victims)
+
+
+def open_session_store(backend=settings.SESSION_BACKEND):
+    """The session store for a SESSION_BACKEND value: "memory" or "sqlite"."""
+    if backend == "memory":
+        return SessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"Unknown session backend {backend!r}. Use 'memory' or 'sqlite'.")
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import settings
+from src.utils.system import reinit_after_fork
+
+
+def normalize_text(text):
+    """
+    Cache key normalisation: lowercase and collapse whitespace. Every cached stage is insensitive
+    to both (the classifiers lowercase, toxic-bert and MiniLM use uncased vocabularies), so
+    "I want a refund" and "i want  a refund" share one entry without changing any result.
+    """
+    return " ".join(text.lower().split())
+
+
+def fingerprint_files(paths, extra=""):
+    """Hash of each file's path, size and modification time (cheap: no file contents are read)."""
+    digest = hashlib.sha1(extra.encode("utf-8"))
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        except FileNotFoundError:
+            digest.update(f"{path}:missing".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class StageCache:
+    """
+    Memoizes deterministic pipeline stages (safety, sentiment, intent, retrieval).
+
+    Entries are keyed by (stage, artifact fingerprint, normalized text) and live in an in-process
+    LRU, optionally backed by a SQLite file so they survive restarts. Each stage registers the
+    artifact files it depends on:
+      - live stages (retrieval) read their artifacts on every call, so the fingerprint is
+        re-checked every few seconds and a rebuild drops that stage's in-memory entries;
+      - pinned stages (the classifiers) load their artifacts once, so their fingerprint is
+        taken at registration and describes exactly what is loaded. Retrained artifacts are
+        picked up, under a new fingerprint, by the next process.
+    Results must be JSON-serializable for the disk tier (tuples come back as lists).
+    """
+    def __init__(self, max_entries=settings.STAGE_CACHE_MAX_ENTRIES, disk_path=None):
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stages = {}
+        self.stats = {}
+
+        self.disk_path = disk_path
+        self._disk = None
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            self._connect()
+            reinit_after_fork(self, "_connect")
+
+    def _connect(self):
+        # SQLite connections must not cross fork, so forked workers open their own
+        self._lock = threading.Lock()
+        self._disk = sqlite3.connect(self.disk_path, check_same_thread=False)
+        self._disk.execute("PRAGMA journal_mode=WAL")
+        self._disk.execute(
+            "CREATE TABLE IF NOT EXISTS stage_results "
+            "(stage TEXT, fingerprint TEXT, text TEXT, value TEXT, PRIMARY KEY (stage, fingerprint, text))"
+        )
+        self._disk.commit()
+
+    def register(self, stage, paths, extra="", live=False):
+        """Declares a stage and the artifacts (plus any extra config string) its results depend on."""
+        self._stages[stage] = {
+            "paths": list(paths),
+            "extra": extra,
+            "live": live,
+            "fingerprint": fingerprint_files(paths, extra),
+            "checked_at": time.monotonic(),
+        }
+        self.stats[stage] = {"hits": 0, "misses": 0}
+
+    def get_or_compute(self, stage, text, compute):
+        """Returns (result, was_cached). compute(text) runs only on a miss."""
+        fingerprint = self._fingerprint(stage)
+        key = (stage, fingerprint, normalize_text(text))
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats[stage]["hits"] += 1
+                return self._memory[key], True
+
+        value = self._disk_get(key)
+        if value is not None:
+            self._remember(key, value)
+            with self._lock:
+                self.stats[stage]["hits"] += 1
+            return value, True
+
+        value = compute(text)
+        self._remember(key, value)
+        self._disk_put(key, value)
+        with self._lock:
+            self.stats[stage]["misses"] += 1
+        return value, False
+
+    @property
+    def hit_rate(self):
+        """Hits over lookups across all stages."""
+        hits = sum(s["hits"] for s in self.stats.values())
+        total = hits + sum(s["misses"] for s in self.stats.values())
+        return hits / total if total else 0.0
+
+    def _fingerprint(self, stage):
+        info = self._stages[stage]
+        if not info["live"]:
+            return info["fingerprint"]
+
+        now = time.monotonic()
+        if now - info["checked_at"] >= settings.STAGE_CACHE_CHECK_SECONDS:
+            info["checked_at"] = now
+            fingerprint = fingerprint_files(info["paths"], info["extra"])
+            if fingerprint != info["fingerprint"]:
+                print(f"Artifacts for '{stage}' changed. Invalidating cached results.")
+                info["fingerprint"] = fingerprint
+                with self._lock:
+                    for key in [k for k in self._memory if k[0] == stage]:
+                        del self._memory[key]
+        return info["fingerprint"]
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _disk_get(self, key):
+        if self._disk is None:
+            return None
+        with self._lock:
+            row = self._disk.execute(
+                "SELECT value FROM stage_results WHERE stage = ? AND fingerprint = ? AND text = ?", key
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _disk_put(self, key, value):
+        if self._disk is None:
+            return
+        with self._lock:
+            self._disk.execute(
+                "INSERT OR REPLACE INTO stage_results VALUES (?, ?, ?, ?)", (*key, json.dumps(value))
+            )
+            self._disk.commit()
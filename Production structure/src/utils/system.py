@@ -0,0 +1,57 @@
+import os
+import sys
+import weakref
+
+
+def current_rss_mb():
+    """Resident memory of this process right now, in MB (Linux /proc; falls back to the peak elsewhere)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def proportional_rss_mb():
+    """
+    This process's share of resident memory (PSS), in MB: pages shared with other processes
+    (e.g. model weights inherited from a pre-fork parent) are split between them.
+    Falls back to plain RSS where /proc/self/smaps_rollup is unavailable.
+    """
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return current_rss_mb()
+
+
+def reinit_after_fork(obj, method_name):
+    """
+    Calls obj.<method_name>() in every child forked after this point (threads and database
+    connections do not survive fork). Holds obj weakly, so registering never keeps it alive.
+    """
+    if not hasattr(os, "register_at_fork"):
+        return
+    ref = weakref.ref(obj)
+
+    def after_in_child():
+        target = ref()
+        if target is not None:
+            getattr(target, method_name)()
+
+    os.register_at_fork(after_in_child=after_in_child)
+
+
+def peak_rss_mb():
+    """Highest resident memory this process has reached, in MB (0.0 where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
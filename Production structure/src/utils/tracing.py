@@ -0,0 +1,145 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds: 100us doubling up to ~52s, plus +Inf
+BUCKETS = [0.0001 * 2 ** i for i in range(20)]
+
+_current_spans = contextvars.ContextVar("current_spans", default=None)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (Prometheus style). Percentiles are interpolated within a bucket."""
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, q):
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return 0.0
+
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = BUCKETS[index - 1] if index > 0 else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else BUCKETS[-1] * 2
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return BUCKETS[-1]
+
+
+class Tracer:
+    """
+    Process-wide span timer. Every span feeds a per-name histogram; spans opened while a
+    collect() block is active on the same logical request are also added to that request's
+    breakdown. Cost per span is two perf_counter() calls and a short lock, so it stays on.
+    """
+    def __init__(self):
+        self.histograms = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        histogram.observe(seconds)
+
+        spans = _current_spans.get()
+        if spans is not None:
+            # Same span twice in one request (e.g. two encodes) adds up. A turn's stages run on
+            # several threads that share this dict, so the read-modify-write is locked.
+            with self._lock:
+                spans[name] = spans.get(name, 0.0) + seconds
+
+    @contextmanager
+    def collect(self):
+        """Yields a dict that fills with {span name: seconds} for everything traced inside the block."""
+        spans = {}
+        token = _current_spans.set(spans)
+        try:
+            yield spans
+        finally:
+            _current_spans.reset(token)
+
+    def snapshot(self, spans):
+        """A copy of a collect() dict, safe to iterate while stage threads may still add to it."""
+        with self._lock:
+            return dict(spans)
+
+    def register_gauge(self, name, fn, help_text=""):
+        """Adds a value computed at scrape time (e.g. a cache hit rate) to the metrics dump."""
+        self.gauges[name] = (fn, help_text)
+
+    def summary(self):
+        """{span name: {"count", "p50", "p95", "p99", "mean"}} in seconds."""
+        return {
+            name: {
+                "count": h.count,
+                "p50": h.percentile(0.50),
+                "p95": h.percentile(0.95),
+                "p99": h.percentile(0.99),
+                "mean": h.total / h.count if h.count else 0.0,
+            }
+            for name, h in sorted(self.histograms.items())
+        }
+
+    def render_prometheus(self):
+        """Prometheus text exposition format: one histogram plus p50/p95/p99 per span name."""
+        lines = [
+            "# HELP chatbot_span_seconds Wall time per traced span.",
+            "# TYPE chatbot_span_seconds histogram",
+        ]
+        for name, h in sorted(self.histograms.items()):
+            with h._lock:
+                counts, count, total = list(h.counts), h.count, h.total
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + [float("inf")], counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:.6g}"
+                lines.append(f'chatbot_span_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'chatbot_span_seconds_sum{{span="{name}"}} {total:.6f}')
+            lines.append(f'chatbot_span_seconds_count{{span="{name}"}} {count}')
+
+        lines.append("# TYPE chatbot_span_quantile_seconds gauge")
+        for name, h in sorted(self.histograms.items()):
+            for q in (0.5, 0.95, 0.99):
+                lines.append(f'chatbot_span_quantile_seconds{{span="{name}",quantile="{q}"}} {h.percentile(q):.6f}')
+
+        for name, (fn, help_text) in sorted(self.gauges.items()):
+            try:
+                value = float(fn())
+            except Exception:
+                continue
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+tracer = Tracer()